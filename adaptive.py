@@ -0,0 +1,254 @@
+import json
+from itertools import combinations, product
+from pathlib import Path
+
+import numpy as np
+import polars as pl
+
+from metrics import Metric, RougeL
+from prompting_script import CONTEXT_CONDITIONS, KEEP_ALIVE, MODELS, run_batches, select_combos
+from dataset_loader import DocumentStore, iter_items, iter_windows
+from response_cache import ResponseCache
+from result_writer import ResultWriter, is_error_record, load_completed_keys
+from results_store import convert_jsonl
+from scheduler import is_local_model, schedule_by_model, unload_model, warm_model
+from score_responses import with_reference_answers
+
+def bootstrap_means(sums: np.ndarray, counts: np.ndarray, n_boot: int, rng: np.random.Generator) -> np.ndarray:
+    """
+    `n_boot` bootstrap means that resample items rather than single scores: `sums` and
+    `counts` hold each item's score total and number of scores (one per model), and
+    every draw takes an item's scores together, as one (n_boot, n_items) matrix.
+    """
+    indices = rng.integers(0, len(sums), size=(n_boot, len(sums)))
+    return sums[indices].sum(axis=1) / counts[indices].sum(axis=1)
+
+class SequentialComparison:
+    """
+    Bootstrap confidence intervals per (prompt_variant, context_condition) cell, pooled
+    over models like confidence_vis.ipynb, updated as scores arrive. Scores are kept per
+    item and resampled by item, since the models' answers to one item are correlated.
+
+    A cell with at least `min_items` scored items is settled, and no longer sampled, when:
+    - 'separated' -> the CI of its per-item difference to every other variant under the
+                     same condition excludes 0
+    - 'saturated' -> its own CI is narrower than `precision`
+
+    Intervals are recomputed after every round, so the default confidence is stricter
+    than 95% to keep the repeated looks from settling comparisons on noise.
+    """
+    def __init__(
+        self,
+        prompt_variants: list[str],
+        conditions: list[str],
+        min_items: int = 30,
+        confidence: float = 0.99,
+        precision: float = 0.02,
+        n_boot: int = 2000,
+        seed: int = 0
+    ):
+        self.prompt_variants = prompt_variants
+        self.conditions = conditions
+        self.min_items = min_items
+        self.confidence = confidence
+        self.precision = precision
+        self.n_boot = n_boot
+        self.rng = np.random.default_rng(seed)
+        # cell -> item_index -> scores of that item (one per model)
+        self.scores: dict[tuple[str, str], dict[int, list[float]]] = {
+            (variant, condition): {} for variant, condition in product(prompt_variants, conditions)
+        }
+        # cell -> reason it was settled; settling is final since settled cells get no new scores
+        self.settled: dict[tuple[str, str], str] = {}
+
+    def add(self, prompt_variant: str, condition: str, item_index: int, score: float) -> None:
+        self.scores[(prompt_variant, condition)].setdefault(item_index, []).append(score)
+
+    def active(self) -> set[tuple[str, str]]:
+        return self.scores.keys() - self.settled.keys()
+
+    def _interval(self, samples: np.ndarray) -> tuple[float, float]:
+        tail = (1 - self.confidence) / 2
+        low, high = np.quantile(samples, [tail, 1 - tail])
+        return float(low), float(high)
+
+    def _paired_differences(self, cell_a: tuple[str, str], cell_b: tuple[str, str]) -> np.ndarray | None:
+        """
+        Bootstrap means of the per-item differences between two cells, resampling one
+        shared set of items, so each item is compared with itself. Only items scored
+        in both cells take part; None while fewer than `min_items` are.
+        """
+        items_a, items_b = self.scores[cell_a], self.scores[cell_b]
+        shared = sorted(items_a.keys() & items_b.keys())
+        if len(shared) < self.min_items:
+            return None
+        differences = np.array([np.mean(items_a[idx]) - np.mean(items_b[idx]) for idx in shared], dtype=np.float64)
+        return bootstrap_means(differences, np.ones(len(shared)), self.n_boot, self.rng)
+
+    def update(self) -> pl.DataFrame:
+        """
+        Recomputes the intervals, settles the cells that qualify and returns one row
+        per cell with n, mean, ci_low, ci_high and status.
+        """
+        boots = {
+            cell: bootstrap_means(
+                np.array([sum(item_scores) for item_scores in items.values()], dtype=np.float64),
+                np.array([len(item_scores) for item_scores in items.values()], dtype=np.float64),
+                self.n_boot,
+                self.rng
+            )
+            for cell, items in self.scores.items() if len(items) >= self.min_items
+        }
+
+        separated = {cell: True for cell in self.scores}
+        for condition in self.conditions:
+            for a, b in combinations(self.prompt_variants, 2):
+                cell_a, cell_b = (a, condition), (b, condition)
+                differences = self._paired_differences(cell_a, cell_b)
+                if differences is None:
+                    separated[cell_a] = separated[cell_b] = False
+                    continue
+                low, high = self._interval(differences)
+                if low <= 0 <= high:
+                    separated[cell_a] = separated[cell_b] = False
+
+        rows = []
+        for cell, items in self.scores.items():
+            scores = [score for item_scores in items.values() for score in item_scores]
+            low, high = self._interval(boots[cell]) if cell in boots else (None, None)
+            if cell in boots and cell not in self.settled:
+                if high - low < self.precision:
+                    self.settled[cell] = "saturated"
+                elif separated[cell] and len(self.prompt_variants) > 1:
+                    self.settled[cell] = "separated"
+            rows.append({
+                "prompt_variant": cell[0],
+                "context_condition": cell[1],
+                "items": len(items),
+                "n": len(scores),
+                "mean": float(np.mean(scores)) if scores else None,
+                "ci_low": low,
+                "ci_high": high,
+                "status": self.settled.get(cell, "sampling"),
+            })
+        return pl.DataFrame(rows)
+
+def score_records(records: list[dict[str, any]], metric: Metric, column: str) -> list[float]:
+    """
+    Scores records against the same reference answers score_responses.py uses.
+    """
+    if not records:
+        return []
+    df = with_reference_answers(pl.DataFrame({
+        "context_condition": [r["context_condition"] for r in records],
+        "gold_answer": [r["gold_answer"] for r in records],
+        "model_answer": [r["model_answer"] for r in records],
+    }))
+    return metric.score_many(df["reference_answers"], df["model_answer"])[column]
+
+def read_records(path: str) -> list[dict[str, any]]:
+    if not Path(path).exists():
+        return []
+    records = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if not is_error_record(record):
+                records.append(record)
+    return records
+
+def main(
+    models: list[str] | None = None,
+    prompt_variants: list[str] | None = None,
+    dataset_path: str = "data/input_data.json",
+    output_path: str = "results/rag_results.jsonl"
+):
+    """
+    Runs the grid in rounds of ROUND_SIZE items, scoring each generation as it arrives
+    with a cheap lexical metric, and only schedules the cells whose comparisons are
+    still uncertain. Stops once every cell is settled or the dataset runs out.
+
+    Rounds are small, so local models are loaded once and kept resident across rounds
+    instead of being reloaded for every round.
+    """
+    SEED = 42
+    DATASET_PATH = dataset_path
+    OUTPUT_PATH = output_path
+    STORE_DIR = "results/store"
+    CACHE_PATH = "results/response_cache.sqlite"
+    INTERVALS_PATH = "results/adaptive_intervals.csv"
+    ROUND_SIZE = 10
+    SCORE_COLUMN = "rougeL_recall"
+
+    cache = ResponseCache(CACHE_PATH)
+    metric = RougeL(n_jobs=1)
+    models = models or MODELS
+    PROMPT_COMBOS = select_combos(prompt_variants)
+    comparison = SequentialComparison([combo["name"] for combo in PROMPT_COMBOS], CONTEXT_CONDITIONS, seed=SEED)
+
+    # Earlier generations count towards the intervals, so a resumed run picks up where it stopped
+    completed = load_completed_keys(OUTPUT_PATH)
+    previous = [
+        record for record in read_records(OUTPUT_PATH)
+        if record["model_name"] in models and (record["prompt_variant"], record["context_condition"]) in comparison.scores
+    ]
+    for record, score in zip(previous, score_records(previous, metric, SCORE_COLUMN)):
+        comparison.add(record["prompt_variant"], record["context_condition"], record["item_index"], score)
+    if previous:
+        print(f"Resuming: {len(previous)} scored generations from {OUTPUT_PATH}")
+    intervals = comparison.update()
+
+    calls, items_seen, failed = 0, 0, 0
+    # Local models are loaded on first use and stay resident until the last round
+    resident = []
+    try:
+        with ResultWriter(OUTPUT_PATH) as writer:
+            for window in iter_windows(iter_items(DATASET_PATH, DocumentStore()), ROUND_SIZE):
+                active = comparison.active()
+                if not active:
+                    break
+                items_seen += len(window)
+                cells = [
+                    (dataset_item, condition, model, prompt_combo)
+                    for dataset_item, condition, model, prompt_combo in product(window, CONTEXT_CONDITIONS, models, PROMPT_COMBOS)
+                    if (prompt_combo["name"], condition) in active
+                    and (dataset_item[0], model, prompt_combo["name"], condition) not in completed
+                ]
+                calls += len(cells)
+
+                batches = schedule_by_model(cells, models)
+                for model, _ in batches:
+                    if model not in resident and is_local_model(model):
+                        print(f"Loaded {model} in {warm_model(model, keep_alive=KEEP_ALIVE):.1f}s")
+                        resident.append(model)
+
+                records = []
+                for record in run_batches(batches, cache, SEED, desc=f"items {window[0][0]}-{window[-1][0]} ", manage_models=False):
+                    if is_error_record(record):
+                        failed += 1
+                    else:
+                        writer.write(record)
+                        records.append(record)
+
+                for record, score in zip(records, score_records(records, metric, SCORE_COLUMN)):
+                    comparison.add(record["prompt_variant"], record["context_condition"], record["item_index"], score)
+                intervals = comparison.update()
+                print(f"After item {window[-1][0]}: {len(comparison.active())}/{len(comparison.scores)} cells still sampling")
+    finally:
+        for model in resident:
+            unload_model(model)
+
+    full_grid = items_seen * len(CONTEXT_CONDITIONS) * len(models) * len(PROMPT_COMBOS)
+    print(intervals.sort("context_condition", "mean", descending=[False, True]))
+    print(f"\nMade {calls} generation calls where the full grid over {items_seen} items needs {full_grid}")
+    if failed:
+        print(f"{failed} cells failed after retries and will be retried on the next run")
+    intervals.write_csv(INTERVALS_PATH)
+    convert_jsonl(OUTPUT_PATH, STORE_DIR)
+    cache.close()
+
+if __name__ == "__main__":
+    main()
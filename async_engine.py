@@ -0,0 +1,240 @@
+import asyncio
+from collections.abc import Iterable, Iterator
+
+from tqdm import tqdm
+
+from backends import empty_telemetry, get_backend
+from rate_limit import estimate_tokens
+from dataset_loader import DocumentStore, iter_items, iter_windows
+from prompting_script import (
+    KEEP_ALIVE,
+    MODELS,
+    RETRIEVAL_INDEX_DIR,
+    RETRIEVAL_N_PROBE,
+    RETRIEVAL_TOP_K,
+    AnswerSpan,
+    build_record,
+    extract_answer,
+    generation_options,
+    grid_cells,
+    prepare_evaluation,
+    select_combos,
+    select_conditions,
+)
+from response_cache import ResponseCache
+from results_store import convert_jsonl
+from result_writer import ResultWriter, is_error_record, load_completed_keys
+from scheduler import Cell, is_local_model, schedule_by_model, unload_model, warm_model
+from sharding import shard_path
+
+class AsyncGenerator:
+    """
+    Sends requests through each backend's pooled async client with a semaphore per
+    model, so the number of requests in flight is bounded by what each model can
+    serve rather than by threads.
+    """
+    def __init__(self, max_in_flight: int | dict[str, int] = 8, cache: ResponseCache | None = None, seed: int = 42):
+        self.max_in_flight = max_in_flight
+        self.cache = cache
+        self.seed = seed
+        self._semaphores: dict[str, asyncio.Semaphore] = {}
+
+    def limit_for(self, model_name: str) -> int:
+        if isinstance(self.max_in_flight, dict):
+            return self.max_in_flight.get(model_name, self.max_in_flight.get("default", 8))
+        return self.max_in_flight
+
+    def semaphore(self, model_name: str) -> asyncio.Semaphore:
+        if model_name not in self._semaphores:
+            self._semaphores[model_name] = asyncio.Semaphore(self.limit_for(model_name))
+        return self._semaphores[model_name]
+
+    async def call_model(
+        self,
+        prompt_messages: list[dict[str, str]],
+        model_name: str,
+        answer_start: str | None = None,
+        options: dict[str, any] | None = None,
+        stop_on_answer: bool = False
+    ) -> tuple[str, dict[str, any]]:
+        cached = None
+        if self.cache is not None:
+            cache_options = (options or {}) | ({"stop_on_answer": True} if stop_on_answer else {})
+            cache_key = ResponseCache.make_key(model_name, prompt_messages, cache_options)
+            # SQLite calls block, keep them off the event loop
+            cached = await asyncio.to_thread(self.cache.get, cache_key)
+
+        if cached is not None:
+            answer, telemetry = cached
+            telemetry = (telemetry or empty_telemetry()) | {"cached": True}
+        else:
+            backend = get_backend(model_name)
+
+            async def attempt() -> tuple[str, dict[str, any]]:
+                until = AnswerSpan(answer_start).feed if stop_on_answer else None
+                return await backend.achat(model_name, prompt_messages, options, until=until)
+
+            async with self.semaphore(model_name):
+                answer, telemetry = await backend.acall(attempt, estimate_tokens(prompt_messages, options))
+            if self.cache is not None:
+                await asyncio.to_thread(self.cache.put, cache_key, model_name, answer, telemetry)
+
+        return extract_answer(answer, answer_start), telemetry
+
+    async def rag_evaluation(
+        self,
+        dataset_item: tuple[int, dict[str, any]],
+        context_condition: str,
+        model: str,
+        prompt_combo: dict[str, str]
+    ) -> dict[str, any]:
+        """
+        Async counterpart of prompting_script.rag_evaluation, producing the same record.
+        """
+        idx, _ = dataset_item
+        context_str, docs_metadata, prompt_messages, answer_start = prepare_evaluation(
+            dataset_item, context_condition, prompt_combo, self.seed, model
+        )
+
+        telemetry = None
+        try:
+            model_answer, telemetry = await self.call_model(
+                prompt_messages, model, answer_start, generation_options(prompt_combo), stop_on_answer=True
+            )
+        except Exception as e:
+            print(f"[ERROR] item {idx}, variant '{prompt_combo['name']}', "
+                    f"context '{context_condition}': {e}")
+            model_answer = f"[ERROR] {e}"
+
+        return build_record(
+            dataset_item, context_condition, model, prompt_combo, context_str, docs_metadata, model_answer, telemetry
+        )
+
+async def run_grid(
+    cells: Iterable[Cell],
+    generator: AsyncGenerator,
+    writer: ResultWriter,
+    models: list[str] = MODELS,
+    queue_size: int = 256,
+    total: int | None = None
+) -> int:
+    """
+    Feeds grid cells through a bounded queue. The producer blocks once `queue_size`
+    cells are waiting, so the grid is never materialised as pending tasks.
+
+    If a worker raises (rather than returning an error record), the producer and the
+    other workers are cancelled and the exception propagates.
+
+    Returns:
+        number of cells that failed after retries; they are not written, so a rerun retries them
+    """
+    queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+    # Cells arrive one model at a time, so the largest per-model limit keeps every model
+    # busy without letting the next model start while many of the last one's are in flight
+    n_workers = max(generator.limit_for(model) for model in models)
+    progress = tqdm(total=total)
+    failed = 0
+
+    async def producer():
+        for cell in cells:
+            await queue.put(cell)
+        for _ in range(n_workers):
+            await queue.put(None)
+
+    async def worker():
+        nonlocal failed
+        while (cell := await queue.get()) is not None:
+            record = await generator.rag_evaluation(*cell)
+            if is_error_record(record):
+                failed += 1
+            else:
+                writer.write(record)
+            progress.update()
+
+    try:
+        # The task group cancels every other task as soon as one of them fails
+        async with asyncio.TaskGroup() as group:
+            group.create_task(producer())
+            for _ in range(n_workers):
+                group.create_task(worker())
+    except ExceptionGroup as errors:
+        raise errors.exceptions[0] from errors
+    finally:
+        progress.close()
+    return failed
+
+def main(
+    max_in_flight: int | dict[str, int] = 8,
+    shard: tuple[int, int] | None = None,
+    models: list[str] | None = None,
+    prompt_variants: list[str] | None = None,
+    dataset_path: str = "data/input_data.json",
+    output_path: str = "results/rag_results.jsonl",
+    conditions: list[str] | None = None
+):
+    """
+    Async counterpart of prompting_script.main, taking the same grid, shard and path
+    parameters. Each model streams the items WINDOW_SIZE at a time and its cells are
+    queued in prompt-prefix order, one model after another.
+    """
+    SEED = 42
+    DATASET_PATH = dataset_path
+    OUTPUT_PATH = shard_path(output_path, shard)
+    STORE_DIR = "results/store"
+    CACHE_PATH = "results/response_cache.sqlite"
+    WINDOW_SIZE = 1000
+
+    cache = ResponseCache(CACHE_PATH)
+
+    models = models or MODELS
+    conditions = select_conditions(conditions)
+    PROMPT_COMBOS = select_combos(prompt_variants)
+    documents = DocumentStore()
+
+    retriever = None
+    if "retrieved" in conditions:
+        from retrieval import Retriever
+        retriever = Retriever(RETRIEVAL_INDEX_DIR, RETRIEVAL_TOP_K, RETRIEVAL_N_PROBE)
+
+    completed = load_completed_keys(OUTPUT_PATH)
+    if completed:
+        print(f"Resuming: {len(completed)} cells already in {OUTPUT_PATH}")
+
+    def cells(model: str) -> Iterator[Cell]:
+        for window in iter_windows(iter_items(DATASET_PATH, documents), WINDOW_SIZE):
+            if retriever is not None:
+                retriever.attach(window)
+            for _, batch in schedule_by_model(grid_cells(window, conditions, [model], PROMPT_COMBOS, completed, shard)):
+                yield from batch
+
+    async def run_models() -> int:
+        # One model at a time over the whole dataset: the next model's cells are only
+        # queued once every cell of the previous one has completed
+        failed = 0
+        for model in models:
+            local = is_local_model(model)
+            if local:
+                print(f"Loaded {model} in {await asyncio.to_thread(warm_model, model, KEEP_ALIVE):.1f}s")
+            try:
+                failed += await run_grid(cells(model), generator, writer, [model])
+            finally:
+                if local:
+                    await asyncio.to_thread(unload_model, model)
+        return failed
+
+    generator = AsyncGenerator(max_in_flight, cache=cache, seed=SEED)
+    with ResultWriter(OUTPUT_PATH) as writer:
+        failed = asyncio.run(run_models())
+
+    print(f"\nSaved {writer.written} generations to {OUTPUT_PATH} ({len(documents)} distinct documents)")
+    if failed:
+        print(f"{failed} cells failed after retries and will be retried on the next run")
+    if shard is None:
+        convert_jsonl(OUTPUT_PATH, STORE_DIR)
+    else:
+        print(f"Shard {shard[0]}/{shard[1]} done; run `python sharding.py {shard[1]}` once every shard has finished")
+    print(f"Response cache: {cache.stats()}")
+    cache.close()
+
+if __name__ == "__main__":
+    main()
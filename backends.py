@@ -0,0 +1,371 @@
+import asyncio
+import os
+import threading
+import time
+import weakref
+from collections.abc import Awaitable, Callable
+
+import httpx
+
+from plugins import load_object
+from rate_limit import RateController, RateLimits
+
+DEFAULT_POOL_SIZE = 64
+
+# Ollama's counters (durations in nanoseconds), filled in as far as each backend reports them
+OLLAMA_TELEMETRY_FIELDS = (
+    "total_duration", "load_duration", "prompt_eval_count", "prompt_eval_duration", "eval_count", "eval_duration",
+)
+
+def empty_telemetry() -> dict[str, any]:
+    """
+    Per-call telemetry: Ollama's counters plus client-side wall time and
+    time to first token in seconds, and whether the answer came from the cache.
+    """
+    return {field: None for field in OLLAMA_TELEMETRY_FIELDS} | {
+        "wall_time_s": None, "ttft_s": None, "cached": False, "stopped_early": False, "client_timed": False,
+    }
+
+class _Timer:
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.first_token = None
+
+    def token(self, text: str | None) -> None:
+        if text and self.first_token is None:
+            self.first_token = time.perf_counter()
+
+    def finish(self, telemetry: dict[str, any]) -> dict[str, any]:
+        telemetry["wall_time_s"] = time.perf_counter() - self.start
+        if self.first_token is not None:
+            telemetry["ttft_s"] = self.first_token - self.start
+        return telemetry
+
+def stopped_telemetry(n_chunks: int, timer: _Timer) -> dict[str, any]:
+    """
+    Telemetry of a stream closed by `until`. The server never sends its final
+    counters, so they are estimated from the client clock and marked client_timed:
+    eval_count is the number of streamed chunks (about one token each) and
+    eval_duration the time from the first chunk to the stop.
+    """
+    telemetry = timer.finish(empty_telemetry() | {"eval_count": n_chunks, "stopped_early": True, "client_timed": True})
+    telemetry["total_duration"] = int(telemetry["wall_time_s"] * 1e9)
+    if telemetry["ttft_s"] is not None:
+        telemetry["eval_duration"] = int((telemetry["wall_time_s"] - telemetry["ttft_s"]) * 1e9)
+    return telemetry
+
+class Backend:
+    """
+    A model provider. Each backend owns one long-lived sync client and one async
+    client, both on a keep-alive connection pool of `pool_size` sockets.
+
+    `chat` and `achat` return the stripped answer text and its telemetry (see empty_telemetry).
+    Streaming backends call `until` with each new piece of text and close the stream
+    as soon as it returns True, which stops generation on the server.
+
+    Backends built with `limits` run calls made through `call`/`acall` under a
+    RateController (rate_limit.py), which retries 429s and timeouts.
+    """
+    name = "backend"
+
+    def __init__(self, pool_size: int = DEFAULT_POOL_SIZE, timeout: float | None = None, limits: RateLimits | None = None):
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.controller = RateController(limits) if limits is not None else None
+        self._lock = threading.Lock()
+        self._client = None
+        self._async_clients = weakref.WeakKeyDictionary()
+
+    def pool_limits(self) -> httpx.Limits:
+        return httpx.Limits(max_connections=self.pool_size, max_keepalive_connections=self.pool_size)
+
+    @property
+    def client(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = self._make_client()
+        return self._client
+
+    @property
+    def async_client(self):
+        # Async connection pools are bound to an event loop, so keep one client per running loop
+        loop = asyncio.get_running_loop()
+        if loop not in self._async_clients:
+            self._async_clients[loop] = self._make_async_client()
+        return self._async_clients[loop]
+
+    def call(self, fn: Callable[[], any], tokens: int = 0) -> any:
+        """
+        Runs `fn` (one attempt at a request) under this backend's rate controller, if any.
+        """
+        if self.controller is None:
+            return fn()
+        return self.controller.call(fn, tokens)
+
+    async def acall(self, fn: Callable[[], Awaitable[any]], tokens: int = 0) -> any:
+        if self.controller is None:
+            return await fn()
+        return await self.controller.acall(fn, tokens)
+
+    def _make_client(self):
+        raise NotImplementedError("Please implement this method")
+
+    def _make_async_client(self):
+        raise NotImplementedError("Please implement this method")
+
+    def chat(self, model_name: str, messages: list[dict[str, str]], options: dict[str, any] | None = None, json_mode: bool = False, until: Callable[[str], bool] | None = None) -> tuple[str, dict[str, any]]:
+        raise NotImplementedError("Please implement this method")
+
+    async def achat(self, model_name: str, messages: list[dict[str, str]], options: dict[str, any] | None = None, json_mode: bool = False, until: Callable[[str], bool] | None = None) -> tuple[str, dict[str, any]]:
+        raise NotImplementedError("Please implement this method")
+
+class OllamaBackend(Backend):
+    name = "ollama"
+
+    def __init__(self, host: str | None = None, pool_size: int = DEFAULT_POOL_SIZE, timeout: float | None = None, limits: RateLimits | None = None):
+        super().__init__(pool_size, timeout, limits)
+        self.host = host
+
+    def _make_client(self):
+        from ollama import Client
+        return Client(host=self.host, timeout=self.timeout, limits=self.pool_limits())
+
+    def _make_async_client(self):
+        from ollama import AsyncClient
+        return AsyncClient(host=self.host, timeout=self.timeout, limits=self.pool_limits())
+
+    @staticmethod
+    def _telemetry(final) -> dict[str, any]:
+        telemetry = empty_telemetry()
+        for field in OLLAMA_TELEMETRY_FIELDS:
+            telemetry[field] = getattr(final, field, None)
+        return telemetry
+
+    def chat(self, model_name: str, messages: list[dict[str, str]], options: dict[str, any] | None = None, json_mode: bool = False, until: Callable[[str], bool] | None = None) -> tuple[str, dict[str, any]]:
+        # Streamed so the time to first token can be measured; the last chunk carries the counters
+        timer = _Timer()
+        parts, chunk = [], None
+        stream = self.client.chat(model=model_name, messages=messages, options=options, format="json" if json_mode else None, stream=True)
+        for chunk in stream:
+            timer.token(chunk.message.content)
+            parts.append(chunk.message.content or "")
+            if until is not None and until(parts[-1]):
+                stream.close()
+                return "".join(parts).strip(), stopped_telemetry(len(parts), timer)
+        return "".join(parts).strip(), timer.finish(self._telemetry(chunk))
+
+    async def achat(self, model_name: str, messages: list[dict[str, str]], options: dict[str, any] | None = None, json_mode: bool = False, until: Callable[[str], bool] | None = None) -> tuple[str, dict[str, any]]:
+        timer = _Timer()
+        parts, chunk = [], None
+        stream = await self.async_client.chat(model=model_name, messages=messages, options=options, format="json" if json_mode else None, stream=True)
+        async for chunk in stream:
+            timer.token(chunk.message.content)
+            parts.append(chunk.message.content or "")
+            if until is not None and until(parts[-1]):
+                await stream.aclose()
+                return "".join(parts).strip(), stopped_telemetry(len(parts), timer)
+        return "".join(parts).strip(), timer.finish(self._telemetry(chunk))
+
+    def warm(self, model_name: str, keep_alive: str | int = "30m") -> float:
+        """
+        Loads the model and keeps it resident for `keep_alive`.
+
+        Returns:
+            load time in seconds as reported by the server
+        """
+        response = self.client.generate(model=model_name, prompt="", keep_alive=keep_alive)
+        return (response.load_duration or 0) / 1e9
+
+    def unload(self, model_name: str) -> None:
+        self.client.generate(model=model_name, prompt="", keep_alive=0)
+
+# OpenAI reasoning models, which take a different set of request parameters
+REASONING_MODEL_PREFIXES = ("o1", "o3", "o4")
+
+class OpenAIBackend(Backend):
+    """
+    Any OpenAI-compatible chat completions endpoint (OPENAI_BASE_URL / OPENAI_API_KEY).
+    Rate limits come from OPENAI_RPM / OPENAI_TPM unless given.
+    """
+    name = "openai"
+
+    def __init__(self, base_url: str | None = None, pool_size: int = DEFAULT_POOL_SIZE, timeout: float | None = None, limits: RateLimits | None = None):
+        super().__init__(pool_size, timeout, limits or RateLimits.from_env("OPENAI"))
+        self.base_url = base_url
+
+    def _make_client(self):
+        from openai import OpenAI
+        # Retries are left to the rate controller so backoff and concurrency cuts see every 429
+        return OpenAI(base_url=self.base_url, max_retries=0, http_client=httpx.Client(limits=self.pool_limits(), timeout=self.timeout))
+
+    def _make_async_client(self):
+        from openai import AsyncOpenAI
+        return AsyncOpenAI(base_url=self.base_url, max_retries=0, http_client=httpx.AsyncClient(limits=self.pool_limits(), timeout=self.timeout))
+
+    @staticmethod
+    def request_kwargs(options: dict[str, any] | None, json_mode: bool, model_name: str = "") -> dict[str, any]:
+        """
+        Translates Ollama-style generation options to chat completions parameters.
+        Reasoning models (o1, o3, o4) take max_completion_tokens and reject sampling
+        parameters and stop sequences, so those are dropped for them.
+        """
+        reasoning = model_name.startswith(REASONING_MODEL_PREFIXES)
+        kwargs = {}
+        if options:
+            if "num_predict" in options:
+                kwargs["max_completion_tokens" if reasoning else "max_tokens"] = options["num_predict"]
+            for key in ("seed",) if reasoning else ("temperature", "top_p", "stop", "seed"):
+                if key in options:
+                    kwargs[key] = options[key]
+        if json_mode:
+            kwargs["response_format"] = {"type": "json_object"}
+        return kwargs
+
+    @staticmethod
+    def _telemetry(usage) -> dict[str, any]:
+        telemetry = empty_telemetry()
+        if usage is not None:
+            telemetry["prompt_eval_count"] = usage.prompt_tokens
+            telemetry["eval_count"] = usage.completion_tokens
+        return telemetry
+
+    def chat(self, model_name: str, messages: list[dict[str, str]], options: dict[str, any] | None = None, json_mode: bool = False, until: Callable[[str], bool] | None = None) -> tuple[str, dict[str, any]]:
+        timer = _Timer()
+        parts, usage = [], None
+        stream = self.client.chat.completions.create(
+            model=model_name, messages=messages, stream=True, stream_options={"include_usage": True},
+            **self.request_kwargs(options, json_mode, model_name)
+        )
+        for chunk in stream:
+            if chunk.choices:
+                timer.token(chunk.choices[0].delta.content)
+                parts.append(chunk.choices[0].delta.content or "")
+                if until is not None and until(parts[-1]):
+                    stream.close()
+                    return "".join(parts).strip(), stopped_telemetry(len(parts), timer)
+            usage = chunk.usage or usage
+        return "".join(parts).strip(), timer.finish(self._telemetry(usage))
+
+    async def achat(self, model_name: str, messages: list[dict[str, str]], options: dict[str, any] | None = None, json_mode: bool = False, until: Callable[[str], bool] | None = None) -> tuple[str, dict[str, any]]:
+        timer = _Timer()
+        parts, usage = [], None
+        stream = await self.async_client.chat.completions.create(
+            model=model_name, messages=messages, stream=True, stream_options={"include_usage": True},
+            **self.request_kwargs(options, json_mode, model_name)
+        )
+        async for chunk in stream:
+            if chunk.choices:
+                timer.token(chunk.choices[0].delta.content)
+                parts.append(chunk.choices[0].delta.content or "")
+                if until is not None and until(parts[-1]):
+                    await stream.close()
+                    return "".join(parts).strip(), stopped_telemetry(len(parts), timer)
+            usage = chunk.usage or usage
+        return "".join(parts).strip(), timer.finish(self._telemetry(usage))
+
+class GeminiBackend(Backend):
+    """
+    Gemini through google-genai when GEMINI_API_KEY is set, otherwise through
+    google.colab.ai (which has no async API). Messages are joined into one prompt.
+    Rate limits come from GEMINI_RPM / GEMINI_TPM unless given.
+    """
+    name = "gemini"
+
+    def __init__(self, api_key: str | None = None, pool_size: int = DEFAULT_POOL_SIZE, timeout: float | None = None, limits: RateLimits | None = None):
+        super().__init__(pool_size, timeout, limits or RateLimits.from_env("GEMINI"))
+        self.api_key = api_key or os.getenv("GEMINI_API_KEY")
+
+    def _make_client(self):
+        if self.api_key is None:
+            from google.colab import ai
+            return ai
+
+        from google import genai
+        return genai.Client(
+            api_key=self.api_key,
+            http_options={"client_args": {"limits": self.pool_limits()}, "async_client_args": {"limits": self.pool_limits()}},
+        )
+
+    def _make_async_client(self):
+        if self.api_key is None:
+            raise ValueError("Async Gemini calls need GEMINI_API_KEY, google.colab.ai is sync only")
+        return self.client.aio
+
+    @staticmethod
+    def config(options: dict[str, any] | None, json_mode: bool) -> dict[str, any]:
+        config = {}
+        if options:
+            if "num_predict" in options:
+                config["max_output_tokens"] = options["num_predict"]
+            if "stop" in options:
+                config["stop_sequences"] = options["stop"]
+            for key in ("temperature", "top_p", "seed"):
+                if key in options:
+                    config[key] = options[key]
+        if json_mode:
+            config["response_mime_type"] = "application/json"
+        return config
+
+    @staticmethod
+    def _telemetry(response) -> dict[str, any]:
+        telemetry = empty_telemetry()
+        usage = getattr(response, "usage_metadata", None)
+        if usage is not None:
+            telemetry["prompt_eval_count"] = usage.prompt_token_count
+            telemetry["eval_count"] = usage.candidates_token_count
+        return telemetry
+
+    def chat(self, model_name: str, messages: list[dict[str, str]], options: dict[str, any] | None = None, json_mode: bool = False, until: Callable[[str], bool] | None = None) -> tuple[str, dict[str, any]]:
+        # Not streamed, so ttft_s stays empty and `until` is not used; num_predict still caps the output
+        prompt = "\n".join([message["content"] for message in messages])
+        timer = _Timer()
+        if self.api_key is None:
+            answer = self.client.generate_text(prompt, model_name=model_name).strip()
+            return answer, timer.finish(empty_telemetry())
+        response = self.client.models.generate_content(model=model_name, contents=prompt, config=self.config(options, json_mode))
+        return (response.text or "").strip(), timer.finish(self._telemetry(response))
+
+    async def achat(self, model_name: str, messages: list[dict[str, str]], options: dict[str, any] | None = None, json_mode: bool = False, until: Callable[[str], bool] | None = None) -> tuple[str, dict[str, any]]:
+        prompt = "\n".join([message["content"] for message in messages])
+        timer = _Timer()
+        response = await self.async_client.models.generate_content(model=model_name, contents=prompt, config=self.config(options, json_mode))
+        return (response.text or "").strip(), timer.finish(self._telemetry(response))
+
+# (model name prefixes, factory); the first match wins and Ollama is the fallback
+_REGISTRY: list[tuple[tuple[str, ...], Callable[[], Backend]]] = [
+    (("gemini",), GeminiBackend),
+    # Not a bare "gpt-": Ollama serves open-weight models such as gpt-oss:20b
+    (("gpt-3", "gpt-4", "gpt-5") + REASONING_MODEL_PREFIXES, OpenAIBackend),
+]
+_DEFAULT_FACTORY: Callable[[], Backend] = OllamaBackend
+_instances: dict[Callable[[], Backend], Backend] = {}
+_instances_lock = threading.Lock()
+
+def register_backend(prefixes: tuple[str, ...], factory: Callable[[], Backend] | str) -> None:
+    """
+    Routes models whose name starts with any of `prefixes` to the backend built by `factory`.
+    `factory` may be a 'module:Class' string, imported when a matching model is first used.
+    Later registrations take precedence.
+    """
+    if isinstance(factory, str):
+        target = factory
+        factory = lambda: load_object(target)()
+    _REGISTRY.insert(0, (prefixes, factory))
+
+def _factory_for(model_name: str) -> Callable[[], Backend]:
+    for prefixes, factory in _REGISTRY:
+        if model_name.startswith(prefixes):
+            return factory
+    return _DEFAULT_FACTORY
+
+def get_backend(model_name: str) -> Backend:
+    """
+    The shared backend instance serving `model_name`.
+    """
+    factory = _factory_for(model_name)
+    if factory not in _instances:
+        with _instances_lock:
+            if factory not in _instances:
+                _instances[factory] = factory()
+    return _instances[factory]
@@ -0,0 +1,204 @@
+import json
+import time
+from itertools import product
+from pathlib import Path
+
+from backends import OpenAIBackend, empty_telemetry, get_backend
+from prompting_script import (
+    CONTEXT_CONDITIONS,
+    build_record,
+    extract_answer,
+    generation_options,
+    load_dataset,
+    prepare_evaluation,
+    select_combos,
+)
+from result_writer import ResultWriter, load_completed_keys
+from results_store import convert_jsonl
+from scheduler import Cell
+
+BATCH_ENDPOINT = "/v1/chat/completions"
+# OpenAI accepts at most 50,000 requests per batch input file
+MAX_BATCH_REQUESTS = 50_000
+FINAL_STATUSES = ("completed", "failed", "expired", "cancelled")
+
+def custom_id(cell: Cell) -> str:
+    """
+    Stable ID of a grid cell: its record key, so outputs map back to cells across runs.
+    """
+    (idx, _), condition, model, prompt_combo = cell
+    return "|".join(str(part) for part in (idx, model, prompt_combo["name"], condition))
+
+def build_batch(cells: list[Cell], batch_dir: str, name: str, seed: int = 42) -> dict[str, any]:
+    """
+    Writes the cells of one model as batch-API JSONL files of at most MAX_BATCH_REQUESTS
+    lines and returns the manifest that merge_outputs needs to rebuild the records.
+
+    The manifest holds the prompt combos and seed of the run and, per request, only
+    its item index, combo name and condition: contexts are rebuilt deterministically
+    on merge, and a resumed run merges with the combos it was built with.
+    """
+    Path(batch_dir).mkdir(parents=True, exist_ok=True)
+    manifest = {"model": cells[0][2], "seed": seed, "combos": {}, "batches": [], "requests": {}}
+    for part, start in enumerate(range(0, len(cells), MAX_BATCH_REQUESTS)):
+        path = Path(batch_dir) / f"{name}-{part:03d}.jsonl"
+        with open(path, "w", encoding="utf-8") as f:
+            for cell in cells[start:start + MAX_BATCH_REQUESTS]:
+                dataset_item, condition, model, prompt_combo = cell
+                _, _, prompt_messages, _ = prepare_evaluation(dataset_item, condition, prompt_combo, seed, model)
+                body = {"model": model, "messages": prompt_messages} | OpenAIBackend.request_kwargs(generation_options(prompt_combo), False, model)
+                f.write(json.dumps({"custom_id": custom_id(cell), "method": "POST", "url": BATCH_ENDPOINT, "body": body}, ensure_ascii=False) + "\n")
+                manifest["combos"][prompt_combo["name"]] = prompt_combo
+                manifest["requests"][custom_id(cell)] = {
+                    "item_index": dataset_item[0],
+                    "prompt_variant": prompt_combo["name"],
+                    "context_condition": condition,
+                }
+        manifest["batches"].append({"path": str(path), "batch_id": None})
+    return manifest
+
+def save_manifest(manifest: dict[str, any], path: str) -> None:
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False)
+
+def submit(client, path: str, metadata: dict[str, str] | None = None) -> str:
+    with open(path, "rb") as f:
+        input_file = client.files.create(file=f, purpose="batch")
+    batch = client.batches.create(
+        input_file_id=input_file.id, endpoint=BATCH_ENDPOINT, completion_window="24h", metadata=metadata
+    )
+    return batch.id
+
+def poll(client, batch_id: str, interval: float = 30.0, timeout: float | None = None):
+    """
+    Waits for the batch to reach a final status and returns it.
+    """
+    start = time.monotonic()
+    while True:
+        batch = client.batches.retrieve(batch_id)
+        if batch.status in FINAL_STATUSES:
+            return batch
+        if timeout is not None and time.monotonic() - start > timeout:
+            raise TimeoutError(f"Batch {batch_id} still {batch.status} after {timeout}s")
+        time.sleep(interval)
+
+def download_outputs(client, batch) -> list[dict[str, any]]:
+    """
+    Lines of the batch's output file and of its error file, where OpenAI reports the
+    requests that failed; merge_outputs tells them apart by status.
+    """
+    outputs = []
+    for file_id in (batch.output_file_id, batch.error_file_id):
+        if file_id is not None:
+            text = client.files.content(file_id).text
+            outputs += [json.loads(line) for line in text.splitlines() if line.strip()]
+    return outputs
+
+def merge_outputs(
+    outputs: list[dict[str, any]],
+    manifest: dict[str, any],
+    dataset: list[dict[str, any]]
+) -> tuple[list[dict[str, any]], list[str]]:
+    """
+    Turns batch output lines into rag_evaluation records, rebuilding each request's
+    context from the dataset with the manifest's combos and seed.
+
+    Returns:
+        records, custom_ids of the requests that failed
+    """
+    records, failed = [], []
+    for output in outputs:
+        request = manifest["requests"].get(output["custom_id"])
+        response = output.get("response") or {}
+        if request is None:
+            continue
+        if output.get("error") or response.get("status_code") != 200:
+            failed.append(output["custom_id"])
+            continue
+
+        body = response["body"]
+        usage = body.get("usage") or {}
+        telemetry = empty_telemetry() | {"prompt_eval_count": usage.get("prompt_tokens"), "eval_count": usage.get("completion_tokens")}
+        answer = (body["choices"][0]["message"]["content"] or "").strip()
+        dataset_item = (request["item_index"], dataset[request["item_index"]])
+        prompt_combo = manifest["combos"][request["prompt_variant"]]
+        context_str, docs_metadata, _, answer_start = prepare_evaluation(
+            dataset_item, request["context_condition"], prompt_combo, manifest["seed"], manifest["model"]
+        )
+        records.append(build_record(
+            dataset_item,
+            request["context_condition"],
+            manifest["model"],
+            prompt_combo,
+            context_str,
+            docs_metadata,
+            extract_answer(answer, answer_start),
+            telemetry
+        ))
+    return records, failed
+
+def main(
+    model: str = "gpt-4.1-mini",
+    poll_interval: float = 30.0,
+    prompt_variants: list[str] | None = None,
+    dataset_path: str = "data/input_data.json",
+    output_path: str = "results/rag_results.jsonl"
+):
+    SEED = 42
+    DATASET_PATH = dataset_path
+    OUTPUT_PATH = output_path
+    STORE_DIR = "results/store"
+    BATCH_DIR = "results/batches"
+
+    PROMPT_COMBOS = select_combos(prompt_variants)
+    dataset = load_dataset(DATASET_PATH)
+    client = get_backend(model).client
+    name = model.replace("/", "_").replace(":", "_")
+    manifest_path = Path(BATCH_DIR) / f"{name}.manifest.json"
+
+    # A manifest left by an earlier run means its batches are still pending: poll those,
+    # merging them with the combos they were built with whatever --variants says now
+    if manifest_path.exists():
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        print(f"Resuming {len(manifest['batches'])} batches from {manifest_path}")
+    else:
+        completed = load_completed_keys(OUTPUT_PATH)
+        cells = [
+            (dataset_item, condition, model, prompt_combo)
+            for dataset_item, condition, prompt_combo in product(
+                list(enumerate(dataset)), CONTEXT_CONDITIONS, PROMPT_COMBOS
+            ) if (dataset_item[0], model, prompt_combo["name"], condition) not in completed
+        ]
+        if not cells:
+            print(f"Nothing to do: every cell for {model} is already in {OUTPUT_PATH}")
+            return
+        manifest = build_batch(cells, BATCH_DIR, name, SEED)
+        save_manifest(manifest, manifest_path)
+        print(f"Built {len(cells)} requests for {model} in {len(manifest['batches'])} batch files")
+
+    for batch_info in manifest["batches"]:
+        if batch_info["batch_id"] is None:
+            batch_info["batch_id"] = submit(client, batch_info["path"], {"model": model})
+            save_manifest(manifest, manifest_path)
+            print(f"Submitted {batch_info['path']} as {batch_info['batch_id']}")
+
+    failed = []
+    with ResultWriter(OUTPUT_PATH) as writer:
+        for batch_info in manifest["batches"]:
+            batch = poll(client, batch_info["batch_id"], poll_interval)
+            if batch.status != "completed":
+                print(f"[ERROR] batch {batch.id} ended as {batch.status}; its cells will be rebuilt on the next run")
+            records, batch_failed = merge_outputs(download_outputs(client, batch), manifest, dataset)
+            for record in records:
+                writer.write(record)
+            failed += batch_failed
+
+    manifest_path.unlink()
+    print(f"\nSaved {writer.written} generations to {OUTPUT_PATH}")
+    if failed:
+        print(f"{len(failed)} requests failed in the batch and will be resubmitted on the next run")
+    convert_jsonl(OUTPUT_PATH, STORE_DIR)
+
+if __name__ == "__main__":
+    main()
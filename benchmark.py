@@ -0,0 +1,237 @@
+import asyncio
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import resource
+import shutil
+import statistics
+import subprocess
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from itertools import product
+from pathlib import Path
+
+from mock_ollama import MockConfig, MockOllamaServer
+
+DATASET_PATH = "data/input_data.json"
+BENCHMARK_DIR = "results/benchmarks"
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def _with_peak_rss(fn, *args) -> tuple[any, float]:
+    return fn(*args), peak_rss_mb()
+
+def isolated(fn, *args) -> tuple[any, float]:
+    """
+    Runs fn(*args) in a freshly spawned process. ru_maxrss is a lifetime high-water
+    mark, so measured in one long-lived process every scenario would report the peak
+    of the largest one before it.
+
+    Returns:
+        fn's result, peak RSS of that process in MB
+    """
+    with ProcessPoolExecutor(1, mp_context=multiprocessing.get_context("spawn")) as pool:
+        return pool.submit(_with_peak_rss, fn, *args).result()
+
+@contextlib.contextmanager
+def scratch_dir():
+    """
+    Runs the block in an empty temporary working directory with data/ and results/.
+    """
+    cwd = os.getcwd()
+    scratch = Path(tempfile.mkdtemp(prefix="ragbe-bench-"))
+    try:
+        (scratch / "data").mkdir()
+        (scratch / "results").mkdir()
+        os.chdir(scratch)
+        yield scratch
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(scratch, ignore_errors=True)
+
+def percentile(values: list[float], q: float) -> float:
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+def summarize(name: str, latencies: list[float], wall: float, peak_rss: float, **extra) -> dict[str, any]:
+    result = {
+        "scenario": name,
+        "requests": len(latencies),
+        "wall_time_s": wall,
+        "requests_per_s": len(latencies) / wall if wall > 0 else float("inf"),
+        "p50_latency_s": percentile(latencies, 0.50),
+        "p99_latency_s": percentile(latencies, 0.99),
+        "mean_latency_s": statistics.fmean(latencies) if latencies else float("nan"),
+        "peak_rss_mb": peak_rss,
+    } | extra
+    print(
+        f"{name}: {result['requests_per_s']:.1f} req/s, p50 {result['p50_latency_s'] * 1000:.0f}ms, "
+        f"p99 {result['p99_latency_s'] * 1000:.0f}ms, peak RSS {result['peak_rss_mb']:.0f}MB"
+    )
+    return result
+
+def synthetic_dataset(n_items: int) -> list[dict[str, any]]:
+    with open(DATASET_PATH, "r", encoding="utf-8") as f:
+        items = json.load(f)["items"]
+    return [items[i % len(items)] | {"question": f"{items[i % len(items)]['question']} (#{i})"} for i in range(n_items)]
+
+def grid_cells(n_items: int, models: list[str]) -> list[tuple]:
+    from prompting_script import CONTEXT_CONDITIONS, PROMPT_VARIANTS, prompt_combos
+
+    return list(product(list(enumerate(synthetic_dataset(n_items))), CONTEXT_CONDITIONS, models, prompt_combos(PROMPT_VARIANTS)))
+
+def bench_threads(cells: list[tuple], n_jobs: int) -> tuple[list[dict[str, any]], list[float], float]:
+    from joblib import Parallel, delayed
+    from prompting_script import rag_evaluation
+
+    def timed(cell):
+        start = time.perf_counter()
+        record = rag_evaluation(*cell)
+        return record, time.perf_counter() - start
+
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        out = Parallel(n_jobs=n_jobs, prefer="threads")(delayed(timed)(cell) for cell in cells)
+    wall = time.perf_counter() - start
+    return [r for r, _ in out], [t for _, t in out], wall
+
+def bench_async(cells: list[tuple], max_in_flight: int) -> tuple[list[float], float]:
+    from async_engine import AsyncGenerator
+
+    async def run():
+        generator = AsyncGenerator(max_in_flight)
+        latencies = []
+
+        async def timed(cell):
+            start = time.perf_counter()
+            await generator.rag_evaluation(*cell)
+            latencies.append(time.perf_counter() - start)
+
+        await asyncio.gather(*(timed(cell) for cell in cells))
+        return latencies
+
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        latencies = asyncio.run(run())
+    return latencies, time.perf_counter() - start
+
+def bench_main(items: list[dict[str, any]], models: list[str] | None = None) -> tuple[float, list[dict[str, any]]]:
+    """
+    Runs prompting_script.main end to end in a scratch directory holding `items`.
+
+    Returns:
+        wall time in seconds, the records it wrote
+    """
+    import prompting_script
+
+    with scratch_dir():
+        with open(DATASET_PATH, "w", encoding="utf-8") as f:
+            json.dump({"items": items}, f)
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            prompting_script.main(models=models)
+        wall = time.perf_counter() - start
+        with open("results/rag_results.jsonl", "r", encoding="utf-8") as f:
+            return wall, [json.loads(line) for line in f]
+
+def bench_scoring(records: list[dict[str, any]], repeat: int, streaming: bool) -> tuple[float, dict[str, any]]:
+    """
+    Runs score_responses.main with the lexical metrics over `records` repeated
+    `repeat` times, in a scratch directory so no score cache is warm.
+
+    Returns:
+        wall time in seconds, per-metric timings written by score_responses
+    """
+    import score_responses
+
+    with scratch_dir():
+        with open("results/rag_results.jsonl", "w", encoding="utf-8") as f:
+            for record in records * repeat:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            score_responses.main(streaming=streaming, batch_size=10_000, metric_names=["rougeL", "bleu"])
+        wall = time.perf_counter() - start
+        with open("results/metric_timings.json", "r", encoding="utf-8") as f:
+            return wall, json.load(f)
+
+def git_revision() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def main(
+    grid_sizes: tuple[int, ...] = (2, 8),
+    concurrency: tuple[int, ...] = (1, 8, 32),
+    models: tuple[str, ...] = ("mock-a", "mock-b"),
+    config: MockConfig | None = None,
+    scoring_rows: int = 10_000
+) -> dict[str, any]:
+    """
+    Runs every scenario against a mock Ollama server and saves the report as JSON
+    in BENCHMARK_DIR. The scoring scenarios score the records written by
+    prompting_script.main, repeated up to about `scoring_rows` rows.
+    """
+    config = config or MockConfig()
+    server = MockOllamaServer(config).start()
+    # Must be set before the Ollama backend is first created: its client reads it once
+    os.environ["OLLAMA_HOST"] = server.host
+
+    # Every scenario runs in its own spawned process, which inherits OLLAMA_HOST
+    results = []
+    try:
+        for n_items in grid_sizes:
+            cells = grid_cells(n_items, list(models))
+            for level in concurrency:
+                (_, latencies, wall), peak = isolated(bench_threads, cells, level)
+                results.append(summarize(f"threads items={n_items} n_jobs={level}", latencies, wall, peak, items=n_items, concurrency=level))
+                (latencies, wall), peak = isolated(bench_async, cells, level)
+                results.append(summarize(f"async items={n_items} in_flight={level}", latencies, wall, peak, items=n_items, concurrency=level))
+
+            server.reset_stats()
+            (wall, records), peak = isolated(bench_main, synthetic_dataset(n_items), list(models))
+            results.append(summarize(
+                f"prompting_script.main items={n_items}", list(server.latencies), wall, peak,
+                items=n_items, model_loads=server.model_loads, server_errors=server.errors
+            ))
+
+            repeat = max(1, scoring_rows // max(len(records), 1))
+            for streaming in (False, True):
+                (wall, timings), peak = isolated(bench_scoring, records, repeat, streaming)
+                rows = len(records) * repeat
+                results.append({
+                    "scenario": f"score_responses.main rows={rows} streaming={streaming}",
+                    "rows": rows,
+                    "wall_time_s": wall,
+                    "rows_per_s": rows / wall,
+                    "metrics": timings,
+                    "peak_rss_mb": peak,
+                })
+                print(f"{results[-1]['scenario']}: {results[-1]['rows_per_s']:.0f} rows/s, peak RSS {peak:.0f}MB")
+    finally:
+        server.stop()
+
+    report = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "git_revision": git_revision(),
+        "mock_config": {k: v for k, v in vars(config).items() if k != "rng"},
+        "results": results,
+    }
+    Path(BENCHMARK_DIR).mkdir(parents=True, exist_ok=True)
+    path = Path(BENCHMARK_DIR) / f"benchmark-{datetime.now():%Y%m%d-%H%M%S}.json"
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nSaved benchmark results to {path}")
+    return report
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,225 @@
+import hashlib
+import json
+from collections import OrderedDict, defaultdict
+from pathlib import Path
+import numpy as np
+import polars as pl
+import torch
+from torch.nn.utils.rnn import pad_sequence
+from bert_score import BERTScorer
+from bert_score.utils import get_bert_embedding, greedy_cos_idf
+from metrics import Metric
+
+class BertScore(Metric):
+    """
+    BERTScore with the model, tokenizer and baseline loaded once and kept resident.
+
+    Reference token embeddings are cached, since the same references (gold answers
+    and the "I don't know" answers) repeat across models and prompt combos; at most
+    `max_cached` of them are held in memory, least recently used first out. Candidates
+    are encoded per call and not cached. With `cache_dir` set, reference embeddings
+    are also appended to one float32 file, indexed by index.jsonl, which later runs
+    memory-map instead of re-encoding.
+    """
+    chunkable = False
+
+    def __init__(
+        self,
+        batch_size: int = 64,
+        max_length: int | None = None,
+        lang: str = 'en',
+        device: str | None = None,
+        cache_dir: str | None = None,
+        max_cached: int = 10_000
+    ):
+        super().__init__('bert_score')
+        self.batch_size = batch_size
+        self.max_length = max_length
+        self.lang = lang
+        self.device = device
+        self.cache_dir = cache_dir
+        self.max_cached = max_cached
+        self._scorer: BERTScorer | None = None
+        self._idf_dict = None
+        self._embeddings: OrderedDict[str, tuple[torch.Tensor, torch.Tensor]] = OrderedDict()
+        # sentence key -> (float offset, rows, width) in the disk cache
+        self._index: dict[str, tuple[int, int, int]] | None = None
+        self._mmap: np.memmap | None = None
+
+    @property
+    def version(self) -> str:
+        return f"1|lang={self.lang}|max_length={self.max_length}"
+
+    @property
+    def scorer(self) -> BERTScorer:
+        if self._scorer is None:
+            self._scorer = BERTScorer(
+                lang=self.lang, rescale_with_baseline=True, use_fast_tokenizer=True,
+                batch_size=self.batch_size, device=self.device
+            )
+            tokenizer = self._scorer._tokenizer
+            if self.max_length is not None:
+                tokenizer.model_max_length = self.max_length
+            self._idf_dict = defaultdict(lambda: 1.0)
+            self._idf_dict[tokenizer.sep_token_id] = 0
+            self._idf_dict[tokenizer.cls_token_id] = 0
+        return self._scorer
+
+    def __getstate__(self):
+        # Ship the configuration, not the loaded model or caches, to worker processes
+        return self.__dict__ | {"_scorer": None, "_idf_dict": None, "_embeddings": OrderedDict(), "_index": None, "_mmap": None}
+
+    def _cache_path(self, name: str) -> Path:
+        return Path(self.cache_dir) / self.scorer.hash / name
+
+    def _key(self, sentence: str) -> str:
+        return hashlib.sha1(f"{self.max_length}|{sentence}".encode("utf-8")).hexdigest()
+
+    def _disk_index(self) -> dict[str, tuple[int, int, int]]:
+        if self._index is None:
+            self._index = {}
+            path = self._cache_path("index.jsonl")
+            if path.exists():
+                with open(path, "r", encoding="utf-8") as f:
+                    for line in f:
+                        try:
+                            entry = json.loads(line)
+                        except json.JSONDecodeError:
+                            # Torn last line of an interrupted run; its rows are simply re-encoded
+                            continue
+                        self._index[entry["key"]] = (entry["offset"], entry["rows"], entry["width"])
+        return self._index
+
+    def _load(self, sentence: str) -> tuple[torch.Tensor, torch.Tensor] | None:
+        if self.cache_dir is None:
+            return None
+        entry = self._disk_index().get(self._key(sentence))
+        if entry is None:
+            return None
+        offset, rows, width = entry
+        if self._mmap is None or len(self._mmap) < offset + rows * width:
+            # Copy-on-write, so torch can wrap the pages without copying them
+            self._mmap = np.memmap(self._cache_path("embeddings.f32"), dtype=np.float32, mode="c")
+        stats = torch.from_numpy(self._mmap[offset:offset + rows * width].reshape(rows, width))
+        return stats[:, :-1], stats[:, -1]
+
+    def _save(self, embeddings: dict[str, tuple[torch.Tensor, torch.Tensor]]) -> None:
+        """
+        Appends the embeddings to the disk cache, data before index, so a crash never
+        leaves an index entry pointing past the data.
+        """
+        data_path, index_path = self._cache_path("embeddings.f32"), self._cache_path("index.jsonl")
+        data_path.parent.mkdir(parents=True, exist_ok=True)
+        index = self._disk_index()
+        entries = []
+        with open(data_path, "ab") as f:
+            size = f.tell()
+            # Realign after a torn write, so every entry starts on a whole float
+            f.write(b"\0" * (-size % 4))
+            offset = (size + 3) // 4
+            for sentence, (emb, idf) in embeddings.items():
+                stats = torch.cat([emb, idf.unsqueeze(-1)], dim=-1).numpy().astype(np.float32)
+                f.write(stats.tobytes())
+                entries.append({"key": self._key(sentence), "offset": offset, "rows": stats.shape[0], "width": stats.shape[1]})
+                offset += stats.size
+        with open(index_path, "ab+") as f:
+            # Start on a fresh line after a torn last entry
+            if f.seek(0, 2) > 0:
+                f.seek(-1, 2)
+                if f.read(1) != b"\n":
+                    f.write(b"\n")
+            for entry in entries:
+                f.write((json.dumps(entry) + "\n").encode("utf-8"))
+                index[entry["key"]] = (entry["offset"], entry["rows"], entry["width"])
+
+    def _remember(self, sentence: str, embedding: tuple[torch.Tensor, torch.Tensor]) -> None:
+        self._embeddings[sentence] = embedding
+        self._embeddings.move_to_end(sentence)
+        while len(self._embeddings) > self.max_cached:
+            self._embeddings.popitem(last=False)
+
+    def _encode(self, sentences: list[str]) -> dict[str, tuple[torch.Tensor, torch.Tensor]]:
+        """
+        Token embeddings and idf weights of each sentence, encoded longest first like bert_score.
+        """
+        scorer = self.scorer
+        encoded = {}
+        sentences = sorted(set(sentences), key=lambda x: len(x.split(" ")), reverse=True)
+        for start in range(0, len(sentences), self.batch_size):
+            batch = sentences[start:start + self.batch_size]
+            embs, masks, padded_idf = get_bert_embedding(
+                batch, scorer._model, scorer._tokenizer, self._idf_dict,
+                device=scorer.device, all_layers=scorer.all_layers
+            )
+            embs, masks, padded_idf = embs.cpu(), masks.cpu(), padded_idf.cpu()
+            for i, sentence in enumerate(batch):
+                length = masks[i].sum().item()
+                encoded[sentence] = (embs[i, :length].float(), padded_idf[i, :length].float())
+        return encoded
+
+    def embed(self, references: list[str]) -> dict[str, tuple[torch.Tensor, torch.Tensor]]:
+        """
+        Embeddings of the references, from memory, the disk cache or the model, in
+        that order; newly encoded ones are added to both caches.
+        """
+        embeddings, missing = {}, []
+        for sentence in set(references):
+            embedding = self._embeddings.get(sentence) or self._load(sentence)
+            if embedding is None:
+                missing.append(sentence)
+            else:
+                embeddings[sentence] = embedding
+                self._remember(sentence, embedding)
+
+        encoded = self._encode(missing)
+        if encoded and self.cache_dir is not None:
+            self._save(encoded)
+        for sentence, embedding in encoded.items():
+            self._remember(sentence, embedding)
+        return embeddings | encoded
+
+    def _pad(
+        self,
+        sentences: list[str],
+        embeddings: dict[str, tuple[torch.Tensor, torch.Tensor]]
+    ) -> tuple[torch.Tensor, torch.Tensor, torch.Tensor]:
+        emb, idf = zip(*(embeddings[s] for s in sentences))
+        device = self.scorer.device
+        lens = torch.tensor([e.size(0) for e in emb], dtype=torch.long)
+        emb_pad = pad_sequence([e.to(device) for e in emb], batch_first=True, padding_value=2.0)
+        idf_pad = pad_sequence([i.to(device) for i in idf], batch_first=True)
+        mask = (torch.arange(int(lens.max())).expand(len(lens), -1) < lens.unsqueeze(1)).to(device)
+        return emb_pad, mask, idf_pad
+
+    def score_many(self, references: pl.Series, candidates: pl.Series) -> dict[str, list[float]]:
+        if len(candidates) == 0:
+            return {self.name + "_precision": [], self.name + "_recall": []}
+
+        cands, refs, boundaries = [], [], []
+        for ref_group, cand in zip(references.to_list(), candidates.fill_null("").to_list()):
+            ref_group = [ref_group] if isinstance(ref_group, str) else ref_group
+            boundaries.append((len(refs), len(refs) + len(ref_group)))
+            cands += [cand] * len(ref_group)
+            refs += ref_group
+
+        ref_embeddings = self.embed(refs)
+        cand_embeddings = self._encode(cands)
+        preds = []
+        with torch.no_grad():
+            for start in range(0, len(refs), self.batch_size):
+                P, R, F = greedy_cos_idf(
+                    *self._pad(refs[start:start + self.batch_size], ref_embeddings),
+                    *self._pad(cands[start:start + self.batch_size], cand_embeddings),
+                    self.scorer.all_layers
+                )
+                preds.append(torch.stack((P, R, F), dim=-1).cpu())
+        preds = torch.cat(preds, dim=0)
+        preds = torch.stack([preds[start:end].max(dim=0)[0] for start, end in boundaries], dim=0)
+        preds = (preds - self.scorer.baseline_vals) / (1 - self.scorer.baseline_vals)
+
+        result = {
+            self.name + "_precision": preds[:, 0].tolist(),
+            self.name + "_recall": preds[:, 1].tolist()
+        }
+        
+        return result
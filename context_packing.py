@@ -0,0 +1,105 @@
+import math
+import random
+import threading
+from collections.abc import Callable
+
+from backends import GeminiBackend, OpenAIBackend, get_backend
+
+# Hugging Face tokenizers matching the Ollama models, by model family
+HF_TOKENIZERS = {
+    "llama2": "meta-llama/Llama-2-7b-hf",
+    "llama3.2": "meta-llama/Llama-3.2-1B",
+    "qwen3": "Qwen/Qwen3-4B",
+}
+POLICIES = ("relevant_first", "original", "shuffled")
+# Tokens spent on the "\n\n" between two documents
+SEPARATOR_TOKENS = 1
+
+def heuristic_count(text: str) -> int:
+    # ~4 characters per token for English text with BPE tokenizers
+    return math.ceil(len(text) / 4)
+
+def _load_tokenizer(model_name: str) -> Callable[[str], int] | None:
+    """
+    Exact token counting for the model if its tokenizer can be loaded, else None.
+    """
+    backend = get_backend(model_name)
+    try:
+        if isinstance(backend, OpenAIBackend):
+            import tiktoken
+            encoding = tiktoken.encoding_for_model(model_name)
+            return lambda text: len(encoding.encode(text))
+        family = model_name.split(":")[0]
+        if isinstance(backend, GeminiBackend) or family not in HF_TOKENIZERS:
+            return None
+
+        from transformers import AutoTokenizer
+        tokenizer = AutoTokenizer.from_pretrained(HF_TOKENIZERS[family])
+        return lambda text: len(tokenizer.encode(text, add_special_tokens=False))
+    except Exception:
+        return None
+
+class TokenCounter:
+    """
+    Counts tokens with the model's own tokenizer, falling back to heuristic_count when
+    it is not available offline. Counts are cached per text, since the same documents
+    come back for every prompt variant and model.
+    """
+    def __init__(self, model_name: str, tokenizer: Callable[[str], int] | None = None):
+        self.model_name = model_name
+        self._tokenizer = tokenizer or _load_tokenizer(model_name)
+        self.exact = self._tokenizer is not None
+        self._counts: dict[str, int] = {}
+
+    def count(self, text: str) -> int:
+        if text not in self._counts:
+            self._counts[text] = (self._tokenizer or heuristic_count)(text)
+        return self._counts[text]
+
+_counters: dict[str, TokenCounter] = {}
+_counters_lock = threading.Lock()
+
+def get_counter(model_name: str) -> TokenCounter:
+    if model_name not in _counters:
+        with _counters_lock:
+            if model_name not in _counters:
+                _counters[model_name] = TokenCounter(model_name)
+    return _counters[model_name]
+
+def pack_documents(
+    docs: list[dict[str, str]],
+    counter: TokenCounter,
+    budget: int,
+    policy: str = "relevant_first",
+    rng: random.Random | None = None
+) -> list[dict[str, any]]:
+    """
+    Marks which documents fit in `budget` context tokens. Documents are considered in
+    policy order and each is kept if it still fits:
+    - 'relevant_first' -> relevant documents before irrelevant ones
+    - 'original'       -> the order the context was built in
+    - 'shuffled'       -> a random order drawn from `rng`
+
+    Kept documents stay in their original order, so packing only drops documents and
+    never moves them. Returns copies of `docs` with an `included` flag.
+    """
+    if policy not in POLICIES:
+        raise ValueError(f"Unknown packing policy {policy!r}, expected one of {POLICIES}")
+
+    order = list(range(len(docs)))
+    if policy == "relevant_first":
+        order.sort(key=lambda i: docs[i]["label"] != "relevant")
+    elif policy == "shuffled":
+        (rng or random).shuffle(order)
+
+    included = set()
+    used = 0
+    for i in order:
+        cost = counter.count(docs[i]["text"]) + (SEPARATOR_TOKENS if included else 0)
+        if used + cost <= budget:
+            included.add(i)
+            used += cost
+    return [doc | {"included": i in included} for i, doc in enumerate(docs)]
+
+def packed_context(docs: list[dict[str, any]]) -> str:
+    return "\n\n".join(d["text"] for d in docs if d.get("included", True))
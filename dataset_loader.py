@@ -0,0 +1,109 @@
+import json
+from collections.abc import Iterator, Sequence
+from itertools import islice
+from pathlib import Path
+
+import polars as pl
+
+class DocumentStore:
+    """
+    Interns document texts: every distinct text is stored once and referenced by an
+    integer ID, so distractors repeated across items cost one copy.
+    """
+    def __init__(self):
+        self._texts: list[str] = []
+        self._ids: dict[str, int] = {}
+
+    def intern(self, text: str) -> int:
+        doc_id = self._ids.get(text)
+        if doc_id is None:
+            doc_id = self._ids[text] = len(self._texts)
+            self._texts.append(text)
+        return doc_id
+
+    def get(self, doc_id: int) -> str:
+        return self._texts[doc_id]
+
+    def refs(self, texts: list[str] | None) -> "DocumentRefs":
+        return DocumentRefs(self, [self.intern(text) for text in texts or []])
+
+    def __len__(self) -> int:
+        return len(self._texts)
+
+class DocumentRefs(Sequence):
+    """
+    Document IDs that read as the list of texts they point to, resolved from the
+    store on access; build_context iterates them like the original lists.
+    """
+    __slots__ = ("store", "ids")
+
+    def __init__(self, store: DocumentStore, ids: list[int]):
+        self.store = store
+        self.ids = ids
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self.store.get(doc_id) for doc_id in self.ids[index]]
+        return self.store.get(self.ids[index])
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __repr__(self) -> str:
+        return f"DocumentRefs({self.ids})"
+
+def _compact(raw: dict[str, any], store: DocumentStore) -> dict[str, any]:
+    return raw | {
+        "relevant_docs": store.refs(raw.get("relevant_docs")),
+        "irrelevant_docs": store.refs(raw.get("irrelevant_docs")),
+    }
+
+def _raw_items(path: str, batch_size: int) -> Iterator[dict[str, any]]:
+    suffix = Path(path).suffix
+    if suffix == ".jsonl":
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+    elif suffix == ".parquet":
+        # Scanned lazily in batches; polars memory-maps local Parquet files
+        for batch in pl.scan_parquet(path).collect_batches(chunk_size=batch_size):
+            yield from batch.iter_rows(named=True)
+    elif suffix == ".json":
+        # The original {"items": [...]} format has to be parsed whole
+        with open(path, "r", encoding="utf-8") as f:
+            yield from json.load(f)["items"]
+    else:
+        raise ValueError(f"Unsupported dataset format {suffix!r}, expected .jsonl, .parquet or .json")
+
+def iter_items(path: str, store: DocumentStore | None = None, batch_size: int = 10_000) -> Iterator[tuple[int, dict[str, any]]]:
+    """
+    Streams (item_index, item) from a JSONL, Parquet or legacy JSON dataset. Each
+    item's relevant_docs / irrelevant_docs become DocumentRefs into `store`.
+    """
+    store = store if store is not None else DocumentStore()
+    for idx, raw in enumerate(_raw_items(path, batch_size)):
+        yield idx, _compact(raw, store)
+
+def iter_windows(items: Iterator[tuple[int, dict[str, any]]], size: int) -> Iterator[list[tuple[int, dict[str, any]]]]:
+    items = iter(items)
+    while window := list(islice(items, size)):
+        yield window
+
+def convert_dataset(src: str, dst: str) -> None:
+    """
+    Rewrites a dataset as JSONL or Parquet (by `dst` suffix) for streaming.
+    """
+    rows = (
+        item | {"relevant_docs": list(item["relevant_docs"]), "irrelevant_docs": list(item["irrelevant_docs"])}
+        for _, item in iter_items(src)
+    )
+    if Path(dst).suffix == ".parquet":
+        pl.DataFrame(list(rows)).write_parquet(dst, compression="zstd")
+    else:
+        with open(dst, "w", encoding="utf-8") as f:
+            for row in rows:
+                f.write(json.dumps(row, ensure_ascii=False) + "\n")
+
+if __name__ == "__main__":
+    convert_dataset("data/input_data.json", "data/input_data.jsonl")
@@ -0,0 +1,149 @@
+import asyncio
+import json
+
+import polars as pl
+from tqdm import tqdm
+
+from backends import get_backend
+from rate_limit import backoff_delay
+from score_cache import ScoreCache
+from score_responses import IDK_ANSWERS
+
+JUDGE_PROMPT_TEMPLATE = """
+You are grading an answer to a question.
+
+Question:
+{question}
+
+Gold/reference answer:
+{gold}
+
+Model's answer:
+{pred}
+
+Please do the following:
+1. Decide if the model's answer is factually correct with respect to the gold answer.
+2. Return ONLY a JSON object with two fields:
+   - "correct": a boolean (true or false)
+   - "score": a number between 0 and 1, where 1 means fully correct and 0 means completely incorrect.
+
+Do not add any explanation, just the JSON.
+"""
+
+def parse_verdict(text: str) -> dict[str, float]:
+    """
+    Strictly parses the judge's reply; anything but the expected JSON object raises ValueError.
+    """
+    verdict = json.loads(text)
+    if not isinstance(verdict, dict):
+        raise ValueError(f"Expected a JSON object, got {text!r}")
+    correct, score = verdict.get("correct"), verdict.get("score")
+    if not isinstance(correct, bool):
+        raise ValueError(f"'correct' must be a boolean, got {correct!r}")
+    if isinstance(score, bool) or not isinstance(score, (int, float)) or not 0 <= score <= 1:
+        raise ValueError(f"'score' must be a number between 0 and 1, got {score!r}")
+    return {"llm_correct": float(correct), "llm_score": float(score)}
+
+class Judge:
+    """
+    LLM-as-judge with a bounded number of requests in flight, JSON-mode output and
+    verdicts cached by (judge model, question, gold, answer). Failed or invalid
+    replies are retried after a jittered backoff of about `retry_delay` seconds.
+    """
+    def __init__(self, model_name: str, max_in_flight: int = 16, max_retries: int = 3, cache: ScoreCache | None = None, retry_delay: float = 1.0):
+        self.model_name = model_name
+        self.max_in_flight = max_in_flight
+        self.max_retries = max_retries
+        self.cache = cache
+        self.retry_delay = retry_delay
+
+    @property
+    def version(self) -> str:
+        return f"1|{self.model_name}"
+
+    async def _chat_json(self, prompt: str) -> str:
+        messages = [{"role": "user", "content": prompt}]
+        backend = get_backend(self.model_name)
+        answer, _ = await backend.acall(
+            lambda: backend.achat(self.model_name, messages, {"temperature": 0}, json_mode=True)
+        )
+        return answer
+
+    async def judge_one(self, question: str, gold: str, answer: str) -> dict[str, float | None]:
+        prompt = JUDGE_PROMPT_TEMPLATE.format(question=question, gold=gold, pred=answer)
+        error = None
+        for attempt in range(self.max_retries):
+            try:
+                return parse_verdict(await self._chat_json(prompt))
+            except Exception as e:
+                error = e
+            # Backends without a rate controller (e.g. Ollama) would otherwise retry at once
+            if attempt + 1 < self.max_retries:
+                await asyncio.sleep(backoff_delay(attempt, self.retry_delay))
+        print(f"[ERROR] judge gave no valid verdict for '{question}': {error}")
+        return {"llm_correct": None, "llm_score": None}
+
+    async def judge_many(self, triples: list[tuple[str, str, str]]) -> list[dict[str, float | None]]:
+        keys = [ScoreCache.make_key([question, gold], answer) for question, gold, answer in triples]
+        known = self.cache.get_many("llm_judge", self.version, list(set(keys))) if self.cache else {}
+
+        todo = {key: triple for key, triple in zip(keys, triples) if key not in known}
+        # Fed through a bounded queue like async_engine.run_grid, so only the triples
+        # being judged have a coroutine
+        queue: asyncio.Queue = asyncio.Queue(maxsize=2 * self.max_in_flight)
+        verdicts: dict[str, dict[str, float | None]] = {}
+        progress = tqdm(total=len(todo))
+
+        async def producer():
+            for item in todo.items():
+                await queue.put(item)
+            for _ in range(self.max_in_flight):
+                await queue.put(None)
+
+        async def worker():
+            while (item := await queue.get()) is not None:
+                key, triple = item
+                verdicts[key] = await self.judge_one(*triple)
+                progress.update()
+
+        try:
+            async with asyncio.TaskGroup() as group:
+                group.create_task(producer())
+                for _ in range(self.max_in_flight):
+                    group.create_task(worker())
+        except ExceptionGroup as errors:
+            raise errors.exceptions[0] from errors
+        finally:
+            progress.close()
+
+        if self.cache is not None:
+            self.cache.put_many("llm_judge", self.version, {k: v for k, v in verdicts.items() if v["llm_score"] is not None})
+
+        verdicts |= known
+        return [verdicts[key] for key in keys]
+
+def judge_frame(df: pl.DataFrame, judge: Judge) -> pl.DataFrame:
+    gold = pl.when(pl.col("context_condition") == "irrelevant_only").then(
+        pl.lit(" OR ".join(IDK_ANSWERS))
+    ).otherwise(pl.col("gold_answer"))
+    triples = df.select("question", gold.alias("gold"), "model_answer").rows()
+
+    verdicts = asyncio.run(judge.judge_many(triples))
+    return pl.concat([df, pl.from_dicts(verdicts, schema={"llm_correct": pl.Float64, "llm_score": pl.Float64})], how="horizontal")
+
+def main(judge_model: str = "qwen3:4b", max_in_flight: int = 16, results_path: str = "results/rag_results.jsonl"):
+    RESULTS_PATH = results_path
+    JUDGED_PATH = "results/rag_results_judged.jsonl"
+    SCORE_CACHE_PATH = "results/score_cache.sqlite"
+
+    cache = ScoreCache(SCORE_CACHE_PATH)
+    judge = Judge(judge_model, max_in_flight=max_in_flight, cache=cache)
+
+    df = judge_frame(pl.read_ndjson(RESULTS_PATH), judge)
+    df.write_ndjson(JUDGED_PATH)
+    print(f"Judged {len(df)} answers with {judge_model} -> {JUDGED_PATH}")
+    print(f"Judge cache: {cache.stats()}")
+    cache.close()
+
+if __name__ == "__main__":
+    main()
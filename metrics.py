@@ -1,55 +1,422 @@
+import multiprocessing
+import os
+import re
+import numpy as np
 import polars as pl
-from rouge_score import rouge_scorer
-from nltk.translate import bleu_score
-from bert_score import score as score_bert
-from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from plugins import load_object
+
+_TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
 
 class Metric:
+    # Whether score_many can be split into row chunks and run in worker processes.
+    # Metrics that hold a large model set this to False and run once in the main process.
+    chunkable = True
+    # Column of the results that score_many receives as `references`
+    reference_column = "reference_answers"
+
     def __init__(self, name: str):
         self.name = name
     
     def __str__(self) -> str:
         return self.name
+
+    @property
+    def version(self) -> str:
+        """
+        Identifies the metric's implementation and configuration; cached scores are
+        only reused when it matches. Bump or extend it when either changes.
+        """
+        return "1"
     
     def score_many(self, references: pl.Series, candidates: pl.Series) -> dict[str, list[float]]:
         raise NotImplementedError("Please implement this method")
 
+class _LCSScorer:
+    """
+    RougeL precision/recall with a bit-parallel LCS (Hyyro 2004): each reference is
+    a bit vector over its tokens, so one pass over the candidate costs O(n * m / w).
+    Reference tokens and match masks are cached per text, since the same references
+    (e.g. the "I don't know" answers) repeat across most rows; candidates are unique
+    per row and are tokenized without caching.
+    """
+    def __init__(self, use_stemmer: bool = False, max_cached: int = 10_000):
+        from rouge_score import tokenizers
+        self.tokenizer = tokenizers.DefaultTokenizer(use_stemmer)
+        self.max_cached = max_cached
+        self._tokens: dict[str, tuple[str, ...]] = {}
+        self._masks: dict[str, tuple[dict[str, int], int]] = {}
+
+    def tokenize(self, text: str | None) -> tuple[str, ...]:
+        return tuple(self.tokenizer.tokenize(text or ""))
+
+    def tokens(self, text: str) -> tuple[str, ...]:
+        if text not in self._tokens:
+            # Bounded so a long-lived scorer does not keep every reference it has seen
+            if len(self._tokens) >= self.max_cached:
+                self._tokens.clear()
+                self._masks.clear()
+            self._tokens[text] = self.tokenize(text)
+        return self._tokens[text]
+
+    def masks(self, text: str) -> tuple[dict[str, int], int]:
+        if text not in self._masks:
+            masks = {}
+            tokens = self.tokens(text)
+            for i, token in enumerate(tokens):
+                masks[token] = masks.get(token, 0) | (1 << i)
+            self._masks[text] = (masks, len(tokens))
+        return self._masks[text]
+
+    def lcs_length(self, reference: str, candidate_tokens: tuple[str, ...]) -> int:
+        masks, m = self.masks(reference)
+        full = (1 << m) - 1
+        v = full
+        for token in candidate_tokens:
+            u = v & masks.get(token, 0)
+            v = ((v + u) | (v - u)) & full
+        return m - v.bit_count()
+
+    def score(self, references: list[str], candidate: str) -> tuple[float, float]:
+        """
+        Precision and recall against the reference with the highest f-measure, like RougeScorer.score_multi.
+        """
+        candidate_tokens = self.tokenize(candidate)
+        best = (-1.0, 0.0, 0.0)
+        for reference in references:
+            m = len(self.tokens(reference))
+            if m == 0 or not candidate_tokens:
+                precision = recall = fmeasure = 0.0
+            else:
+                lcs = self.lcs_length(reference, candidate_tokens)
+                precision = lcs / len(candidate_tokens)
+                recall = lcs / m
+                fmeasure = 2 * precision * recall / (precision + recall) if precision + recall > 0 else 0.0
+            if fmeasure > best[0]:
+                best = (fmeasure, precision, recall)
+        return best[1], best[2]
+
+    def score_rows(self, references: list[list[str]], candidates: list[str]) -> tuple[list[float], list[float]]:
+        precision, recall = [], []
+        for refs, cand in zip(references, candidates):
+            p, r = self.score([refs] if isinstance(refs, str) else refs, cand)
+            precision.append(p)
+            recall.append(r)
+        return precision, recall
+
+_ROUGE_WORKER: _LCSScorer | None = None
+
+def _init_rouge_worker(use_stemmer: bool) -> None:
+    global _ROUGE_WORKER
+    _ROUGE_WORKER = _LCSScorer(use_stemmer)
+
+def _rouge_chunk(references: list[list[str]], candidates: list[str]) -> tuple[list[float], list[float]]:
+    return _ROUGE_WORKER.score_rows(references, candidates)
+
 class RougeL(Metric):
-    def __init__(self, use_stemmer: bool = False):
+    def __init__(self, use_stemmer: bool = False, n_jobs: int | None = None, chunk_size: int = 20_000):
         super().__init__('rougeL')
-        self.scorer = rouge_scorer.RougeScorer([self.name], use_stemmer=use_stemmer)
+        self.use_stemmer = use_stemmer
+        self.n_jobs = n_jobs or os.cpu_count() or 1
+        self.chunk_size = chunk_size
+        self.scorer = _LCSScorer(use_stemmer)
+
+    @property
+    def version(self) -> str:
+        return f"1|stemmer={self.use_stemmer}"
 
     def score_many(self, references: pl.Series, candidates: pl.Series) -> dict[str, list[float]]:
-        result = defaultdict(list)
-        for refs, cand in zip(references, candidates):
-            score = self.scorer.score_multi(refs, cand)[self.name]
-            result[self.name + "_precision"].append(score.precision)
-            result[self.name + "_recall"].append(score.recall)
-        
-        return result
+        refs, cands = references.to_list(), candidates.to_list()
+        if self.n_jobs == 1 or len(cands) <= self.chunk_size:
+            precision, recall = self.scorer.score_rows(refs, cands)
+        else:
+            precision, recall = [], []
+            # Spawned like score_responses.metric_pool: forking a process that already runs threads is unsafe
+            with ProcessPoolExecutor(
+                self.n_jobs,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_rouge_worker,
+                initargs=(self.use_stemmer,)
+            ) as pool:
+                chunks = pool.map(
+                    _rouge_chunk,
+                    [refs[i:i + self.chunk_size] for i in range(0, len(refs), self.chunk_size)],
+                    [cands[i:i + self.chunk_size] for i in range(0, len(cands), self.chunk_size)],
+                )
+                for p, r in chunks:
+                    precision += p
+                    recall += r
+
+        return {
+            self.name + "_precision": precision,
+            self.name + "_recall": recall
+        }
+
+def _tokenize(text: str | None, lowercase: bool = False) -> list[str]:
+    if text is None:
+        return []
+    if lowercase:
+        text = text.lower()
+    return _TOKEN_PATTERN.findall(text)
+
+def _factorize(keys: np.ndarray) -> tuple[np.ndarray, int]:
+    uniques, inverse = np.unique(keys, return_inverse=True)
+    return inverse.astype(np.int64), len(uniques)
+
+class _BLEUCounts:
+    """
+    Clipped n-gram matches and totals for every row, counted over one flat token
+    stream holding all candidates followed by all references.
+    """
+    def __init__(self, references: list[list[str]], candidates: list[str], max_order: int, lowercase: bool):
+        vocab: dict[str, int] = {}
+        token_cache: dict[str, list[int]] = {}
+
+        def encode(text: str | None) -> list[int]:
+            if text not in token_cache:
+                token_cache[text] = [vocab.setdefault(tok, len(vocab)) for tok in _tokenize(text, lowercase)]
+            return token_cache[text]
+
+        n_rows = len(candidates)
+        segments = [encode(cand) for cand in candidates]
+        segment_rows = list(range(n_rows))
+        for row, refs in enumerate(references):
+            for ref in refs or []:
+                segments.append(encode(ref))
+                segment_rows.append(row)
+
+        lengths = np.fromiter((len(seg) for seg in segments), dtype=np.int64, count=len(segments))
+        segment_rows = np.asarray(segment_rows, dtype=np.int64)
+        ids = np.fromiter((tok for seg in segments for tok in seg), dtype=np.int64, count=int(lengths.sum()))
+        position_segment = np.repeat(np.arange(len(segments)), lengths)
+
+        self.n_rows = n_rows
+        self.max_order = max_order
+        self.matches = np.zeros((n_rows, max_order), dtype=np.float64)
+        self.totals = np.zeros((n_rows, max_order), dtype=np.float64)
+        self.hyp_lengths = lengths[:n_rows].astype(np.float64)
+        self.ref_lengths = self._closest_ref_lengths(lengths[n_rows:], segment_rows[n_rows:])
+
+        vocab_size = max(len(vocab), 1)
+        keys, n_keys = _factorize(ids)
+        for n in range(1, max_order + 1):
+            if n > 1:
+                keys, n_keys = _factorize(keys[:-1] * vocab_size + ids[n - 1:])
+            if len(keys) == 0:
+                break
+            start_segment = position_segment[:len(keys)]
+            valid = start_segment == position_segment[n - 1:]
+            is_candidate = start_segment < n_rows
+
+            cand = valid & is_candidate
+            cand_rows = start_segment[cand]
+            cand_keys, cand_counts = np.unique(cand_rows * n_keys + keys[cand], return_counts=True)
+
+            ref = valid & ~is_candidate
+            ref_segments = start_segment[ref]
+            seg_keys, seg_counts = np.unique(ref_segments * n_keys + keys[ref], return_counts=True)
+            ref_row_keys = segment_rows[seg_keys // n_keys] * n_keys + seg_keys % n_keys
+            order = np.argsort(ref_row_keys, kind="stable")
+            ref_row_keys, seg_counts = ref_row_keys[order], seg_counts[order]
+            ref_keys, first = np.unique(ref_row_keys, return_index=True)
+            ref_max = np.maximum.reduceat(seg_counts, first) if len(first) else seg_counts
+
+            clipped = np.zeros(len(cand_keys), dtype=np.int64)
+            if len(ref_keys):
+                pos = np.minimum(np.searchsorted(ref_keys, cand_keys), len(ref_keys) - 1)
+                found = ref_keys[pos] == cand_keys
+                clipped[found] = np.minimum(cand_counts[found], ref_max[pos[found]])
+
+            rows = cand_keys // n_keys
+            self.matches[:, n - 1] = np.bincount(rows, weights=clipped, minlength=n_rows)
+            self.totals[:, n - 1] = np.maximum(self.hyp_lengths - n + 1, 0)
+
+    def _closest_ref_lengths(self, ref_lengths: np.ndarray, ref_rows: np.ndarray) -> np.ndarray:
+        """
+        Reference length closest to the hypothesis length, preferring the shorter on ties (as nltk does).
+        """
+        closest = np.zeros(self.n_rows, dtype=np.float64)
+        if len(ref_lengths) == 0:
+            return closest
+        distance = np.abs(ref_lengths - self.hyp_lengths[ref_rows])
+        order = np.lexsort((ref_lengths, distance, ref_rows))
+        rows, first = np.unique(ref_rows[order], return_index=True)
+        closest[rows] = ref_lengths[order][first]
+        return closest
 
 class BLEU(Metric):
-    def __init__(self):
+    """
+    Token-level BLEU over whole columns at once. Each row may have several references.
+
+    smoothing:
+        None      -> nltk's default (any empty n-gram order gives a score of 0)
+        "epsilon" -> nltk method1, adds `epsilon` to zero n-gram matches
+        "add1"    -> nltk method2, add-one smoothing for orders above 1
+    """
+    def __init__(self, max_order: int = 4, smoothing: str | None = None, epsilon: float = 0.1, lowercase: bool = False):
         super().__init__('bleu')
+        if smoothing not in (None, "epsilon", "add1"):
+            raise ValueError(f"Unknown smoothing '{smoothing}'")
+        self.max_order = max_order
+        self.smoothing = smoothing
+        self.epsilon = epsilon
+        self.lowercase = lowercase
+
+    @property
+    def version(self) -> str:
+        return f"1|order={self.max_order}|smoothing={self.smoothing}|epsilon={self.epsilon}|lowercase={self.lowercase}"
+
+    def _counts(self, references: pl.Series, candidates: pl.Series) -> _BLEUCounts:
+        refs = [[r] if isinstance(r, str) else r for r in references.to_list()]
+        return _BLEUCounts(refs, candidates.to_list(), self.max_order, self.lowercase)
+
+    def _combine(self, matches: np.ndarray, totals: np.ndarray, hyp_lengths: np.ndarray, ref_lengths: np.ndarray) -> np.ndarray:
+        numerators = matches.copy()
+        denominators = np.maximum(totals, 1)
+        if self.smoothing == "epsilon":
+            numerators = np.where(numerators == 0, self.epsilon, numerators)
+        elif self.smoothing == "add1":
+            numerators[:, 1:] += 1
+            denominators = denominators.copy()
+            denominators[:, 1:] += 1
+
+        with np.errstate(divide="ignore"):
+            log_precision = np.log(numerators / denominators).mean(axis=1)
+            brevity = np.where(
+                hyp_lengths > ref_lengths, 0.0, 1 - ref_lengths / np.maximum(hyp_lengths, 1)
+            )
+        scores = np.exp(log_precision + brevity)
+
+        zero = (matches[:, 0] == 0) | (hyp_lengths == 0)
+        if self.smoothing is None:
+            zero |= (matches == 0).any(axis=1)
+        return np.where(zero, 0.0, scores)
 
     def score_many(self, references: pl.Series, candidates: pl.Series) -> dict[str, list[float]]:
-        result = defaultdict(list)
-        for refs, cand in zip(references, candidates):
-            score = bleu_score.sentence_bleu(refs, cand)
-            result[self.name].append(score)
-        
-        return result
+        counts = self._counts(references, candidates)
+        scores = self._combine(counts.matches, counts.totals, counts.hyp_lengths, counts.ref_lengths)
+        return {self.name: scores.tolist()}
+
+    def corpus_score(self, references: pl.Series, candidates: pl.Series) -> float:
+        counts = self._counts(references, candidates)
+        score = self._combine(
+            counts.matches.sum(axis=0, keepdims=True),
+            np.maximum(counts.totals, 1).sum(axis=0, keepdims=True),
+            counts.hyp_lengths.sum(keepdims=True),
+            counts.ref_lengths.sum(keepdims=True),
+        )
+        return float(score[0])
 
-class BertScore(Metric):
-    def __init__(self):
-        super().__init__('bert_score')
+class _NGramIndex:
+    """
+    The token n-grams of a set of documents, for O(1) span lookups. Grams shorter
+    than n are only built when an answer shorter than n asks for them.
+    """
+    def __init__(self, token_lists: list[tuple[str, ...]], n: int):
+        self.token_lists = token_lists
+        self.n = n
+        self._grams: dict[int, set[tuple[str, ...]]] = {}
+
+    def grams(self, k: int) -> set[tuple[str, ...]]:
+        if k not in self._grams:
+            self._grams[k] = {tokens[i:i + k] for tokens in self.token_lists for i in range(len(tokens) - k + 1)}
+        return self._grams[k]
+
+    def supported(self, tokens: tuple[str, ...]) -> float | None:
+        """
+        Share of `tokens` inside an n-token span (the whole answer if shorter) that
+        occurs in the documents, in one pass over the answer.
+        """
+        if not tokens or not self.token_lists:
+            return None
+        k = min(self.n, len(tokens))
+        grams = self.grams(k)
+        covered, reach = 0, 0
+        for i in range(len(tokens) - k + 1):
+            if tokens[i:i + k] in grams:
+                covered += i + k - max(reach, i)
+                reach = i + k
+        return covered / len(tokens)
+
+class Faithfulness(Metric):
+    """
+    Share of the answer supported by the documents the model was shown: an answer
+    token counts as supported if it lies inside a span of `n` consecutive tokens that
+    also occurs in a document. Reported separately for the relevant and irrelevant
+    documents; None when the context had no documents of that label.
+
+    Each distinct document set gets its n-gram index once, and documents left out by
+    context packing (`included` False) are not part of it.
+    """
+    reference_column = "documents"
+
+    def __init__(self, n: int = 3, lowercase: bool = True, max_indexes: int = 10_000):
+        super().__init__('faithfulness')
+        self.n = n
+        self.lowercase = lowercase
+        self.max_indexes = max_indexes
+        self._tokens: dict[str, tuple[str, ...]] = {}
+        self._indexes: dict[tuple, dict[str, _NGramIndex]] = {}
+
+    @property
+    def version(self) -> str:
+        return f"1|n={self.n}|lowercase={self.lowercase}"
+
+    def __getstate__(self):
+        return self.__dict__ | {"_tokens": {}, "_indexes": {}}
+
+    def tokens(self, text: str | None) -> tuple[str, ...]:
+        if text not in self._tokens:
+            self._tokens[text] = tuple(_tokenize(text, self.lowercase))
+        return self._tokens[text]
+
+    def index(self, documents: list[dict[str, any]] | None) -> dict[str, _NGramIndex]:
+        shown = tuple(sorted(
+            (doc["text"], doc["label"]) for doc in documents or []
+            if doc.get("text") is not None and doc.get("included") is not False
+        ))
+        if shown not in self._indexes:
+            # Bounded so scoring a large results set does not keep every item's index alive
+            if len(self._indexes) >= self.max_indexes:
+                self._indexes.clear()
+                self._tokens.clear()
+            self._indexes[shown] = {
+                label: _NGramIndex([self.tokens(text) for text, doc_label in shown if doc_label == label], self.n)
+                for label in ("relevant", "irrelevant")
+            }
+        return self._indexes[shown]
 
     def score_many(self, references: pl.Series, candidates: pl.Series) -> dict[str, list[float]]:
-        scores = score_bert(candidates.to_list(), references.to_list(), 
-                            rescale_with_baseline=True, lang='en', use_fast_tokenizer=True)
-        result = {
-            self.name + "_precision": scores[0].tolist(),
-            self.name + "_recall": scores[1].tolist()
+        relevant, irrelevant = [], []
+        for documents, candidate in zip(references.to_list(), candidates.to_list()):
+            index = self.index(documents)
+            tokens = self.tokens(candidate)
+            relevant.append(index["relevant"].supported(tokens))
+            irrelevant.append(index["irrelevant"].supported(tokens))
+        return {
+            self.name + "_relevant": relevant,
+            self.name + "_irrelevant": irrelevant
         }
-        
-        return result
+
+# Metric name -> "module:Class"; the module is only imported when the metric is selected,
+# so lexical scoring never loads torch
+METRICS = {
+    "rougeL": "metrics:RougeL",
+    "bleu": "metrics:BLEU",
+    "faithfulness": "metrics:Faithfulness",
+    "bert_score": "bertscore:BertScore",
+}
+
+def register_metric(name: str, target: str) -> None:
+    METRICS[name] = target
+
+def get_metric(name: str, **kwargs) -> Metric:
+    if name not in METRICS:
+        raise ValueError(f"Unknown metric {name!r}, expected one of {sorted(METRICS)}")
+    return load_object(METRICS[name])(**kwargs)
+
+def __getattr__(name: str):
+    # `from metrics import BertScore` keeps working without importing torch up front
+    if name == "BertScore":
+        return load_object(METRICS["bert_score"])
+    raise AttributeError(f"module 'metrics' has no attribute {name!r}")
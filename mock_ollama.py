@@ -0,0 +1,227 @@
+import json
+import random
+import socket
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    # The default backlog of 5 drops connections under fan-out, which shows up as 1s SYN retries
+    request_queue_size = 1024
+
+class MockConfig:
+    """
+    Behaviour of the stub server.
+
+    latency:      seconds before the first token (prompt evaluation)
+    token_rate:   generated tokens per second
+    answer_tokens: tokens in each answer (capped by options.num_predict)
+    error_rate:   fraction of chat requests answered with HTTP 500
+    load_time:    seconds to "load" a model that is not the resident one
+    """
+    def __init__(
+        self,
+        latency: float = 0.05,
+        token_rate: float = 200.0,
+        answer_tokens: int = 24,
+        error_rate: float = 0.0,
+        load_time: float = 0.0,
+        seed: int = 0
+    ):
+        self.latency = latency
+        self.token_rate = token_rate
+        self.answer_tokens = answer_tokens
+        self.error_rate = error_rate
+        self.load_time = load_time
+        self.rng = random.Random(seed)
+
+class MockOllamaServer:
+    """
+    Local HTTP server speaking enough of the Ollama API (/api/chat, /api/generate,
+    /api/tags) for prompting_script to run against it. Point clients at it with
+    OLLAMA_HOST=<server.host>.
+    """
+    def __init__(self, config: MockConfig | None = None, port: int = 0):
+        self.config = config or MockConfig()
+        self.lock = threading.Lock()
+        self.resident_model = None
+        self.requests = 0
+        self.errors = 0
+        self.model_loads = 0
+        self.latencies: list[float] = []
+        self.httpd = _Server(("127.0.0.1", port), self._handler())
+        self._thread = None
+
+    @property
+    def host(self) -> str:
+        return f"http://127.0.0.1:{self.httpd.server_address[1]}"
+
+    def start(self) -> "MockOllamaServer":
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def reset_stats(self) -> None:
+        with self.lock:
+            self.requests = 0
+            self.errors = 0
+            self.model_loads = 0
+            self.latencies = []
+
+    def _load(self, model: str) -> float:
+        with self.lock:
+            if self.resident_model == model:
+                return 0.0
+            self.resident_model = model
+            self.model_loads += 1
+        time.sleep(self.config.load_time)
+        return self.config.load_time
+
+    def _answer_tokens(self, messages: list[dict[str, str]], options: dict[str, any]) -> list[str]:
+        n = self.config.answer_tokens
+        if options.get("num_predict") is not None and options["num_predict"] >= 0:
+            n = min(n, options["num_predict"])
+        prompt = " ".join(m.get("content", "") for m in messages)
+        # One answer line, then rambling on like a small model that ignores "one sentence maximum"
+        words = ["FINAL", "ANSWER:"] if "FINAL ANSWER:" in prompt else []
+        words += ["The", "answer", "is", "mock.\n"] + ["More"] + ["mock"] * max(n, 0)
+        return [w if w.endswith("\n") else w + " " for w in words[:n]]
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def setup(self):
+                super().setup()
+                self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+            def log_message(self, *args):
+                pass
+
+            def _json(self, status: int, body: dict[str, any]) -> None:
+                data = json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                if self.path == "/api/tags":
+                    self._json(200, {"models": []})
+                elif self.path == "/api/version":
+                    self._json(200, {"version": "mock"})
+                else:
+                    self._json(404, {"error": "not found"})
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                if self.path == "/api/chat":
+                    self._chat(body)
+                elif self.path == "/api/generate":
+                    self._generate(body)
+                else:
+                    self._json(404, {"error": "not found"})
+
+            def _generate(self, body: dict[str, any]) -> None:
+                start = time.perf_counter()
+                load = server._load(body["model"])
+                self._json(200, {
+                    "model": body["model"],
+                    "created_at": datetime.now(timezone.utc).isoformat(),
+                    "response": "",
+                    "done": True,
+                    "done_reason": "load",
+                    "total_duration": int((time.perf_counter() - start) * 1e9),
+                    "load_duration": int(load * 1e9),
+                })
+
+            def _chat(self, body: dict[str, any]) -> None:
+                start = time.perf_counter()
+                config = server.config
+                with server.lock:
+                    server.requests += 1
+                    failed = config.rng.random() < config.error_rate
+                if failed:
+                    with server.lock:
+                        server.errors += 1
+                    self._json(500, {"error": "mock failure"})
+                    return
+
+                # Recorded however the request ends, including clients that close the stream early
+                try:
+                    self._reply(body, start)
+                finally:
+                    with server.lock:
+                        server.latencies.append(time.perf_counter() - start)
+
+            def _reply(self, body: dict[str, any], start: float) -> None:
+                config = server.config
+                model = body["model"]
+                messages = body.get("messages", [])
+                load = server._load(model)
+                prompt_tokens = sum(len(m.get("content", "").split()) for m in messages)
+                tokens = server._answer_tokens(messages, body.get("options") or {})
+                time.sleep(config.latency)
+
+                base = {"model": model, "created_at": datetime.now(timezone.utc).isoformat()}
+                stream = body.get("stream", True)
+                if stream:
+                    self.send_response(200)
+                    self.send_header("Content-Type", "application/x-ndjson")
+                    self.send_header("Transfer-Encoding", "chunked")
+                    self.end_headers()
+                for token in tokens:
+                    time.sleep(1 / config.token_rate)
+                    if stream:
+                        try:
+                            self._chunk(base | {"message": {"role": "assistant", "content": token}, "done": False})
+                        except (BrokenPipeError, ConnectionResetError):
+                            return
+
+                total = time.perf_counter() - start
+                final = base | {
+                    "message": {"role": "assistant", "content": "" if stream else "".join(tokens).strip()},
+                    "done": True,
+                    "done_reason": "stop",
+                    "total_duration": int(total * 1e9),
+                    "load_duration": int(load * 1e9),
+                    "prompt_eval_count": prompt_tokens,
+                    "prompt_eval_duration": int(config.latency * 1e9),
+                    "eval_count": len(tokens),
+                    "eval_duration": int(len(tokens) / config.token_rate * 1e9),
+                }
+                if stream:
+                    try:
+                        self._chunk(final)
+                        self.wfile.write(b"0\r\n\r\n")
+                    except (BrokenPipeError, ConnectionResetError):
+                        return
+                else:
+                    self._json(200, final)
+
+            def _chunk(self, body: dict[str, any]) -> None:
+                data = (json.dumps(body) + "\n").encode("utf-8")
+                self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+                self.wfile.flush()
+
+        return Handler
+
+if __name__ == "__main__":
+    with MockOllamaServer(port=11435) as server:
+        print(f"Mock Ollama listening on {server.host}")
+        threading.Event().wait()
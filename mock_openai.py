@@ -0,0 +1,203 @@
+import json
+import socket
+import threading
+import time
+import uuid
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+def mock_answer(messages: list[dict[str, str]]) -> str:
+    prompt = " ".join(m.get("content", "") for m in messages)
+    answer = "The answer is mock."
+    return f"FINAL ANSWER: {answer}" if "FINAL ANSWER:" in prompt else answer
+
+def completion(model: str, messages: list[dict[str, str]]) -> dict[str, any]:
+    answer = mock_answer(messages)
+    prompt_tokens = sum(len(m.get("content", "").split()) for m in messages)
+    return {
+        "id": f"chatcmpl-{uuid.uuid4().hex}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": answer}, "finish_reason": "stop"}],
+        "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": len(answer.split()), "total_tokens": prompt_tokens + len(answer.split())},
+    }
+
+class MockOpenAIServer:
+    """
+    Local HTTP server speaking enough of the OpenAI API (chat completions, files and
+    batches) to run backends.OpenAIBackend and batch_mode against it. Point clients
+    at it with OPENAI_BASE_URL=<server.base_url> and any OPENAI_API_KEY.
+
+    Batches complete `batch_time` seconds after they are created. `fail_ids` lists
+    custom_ids answered with a 500, reported in the batch's error file as the real
+    API does.
+    """
+    def __init__(self, batch_time: float = 0.5, fail_ids: set[str] | None = None, port: int = 0):
+        self.batch_time = batch_time
+        self.fail_ids = fail_ids or set()
+        self.lock = threading.Lock()
+        self.files: dict[str, bytes] = {}
+        self.batches: dict[str, dict[str, any]] = {}
+        self.httpd = _Server(("127.0.0.1", port), self._handler())
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.httpd.server_address[1]}/v1"
+
+    def start(self) -> "MockOpenAIServer":
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _run_batch(self, batch_id: str) -> None:
+        time.sleep(self.batch_time)
+        with self.lock:
+            batch = self.batches[batch_id]
+            requests = [json.loads(line) for line in self.files[batch["input_file_id"]].decode("utf-8").splitlines() if line.strip()]
+
+        lines, error_lines = [], []
+        for request in requests:
+            failed = request["custom_id"] in self.fail_ids
+            body = completion(request["body"]["model"], request["body"]["messages"])
+            (error_lines if failed else lines).append(json.dumps({
+                "id": f"batch_req_{uuid.uuid4().hex}",
+                "custom_id": request["custom_id"],
+                "response": {
+                    "status_code": 500 if failed else 200,
+                    "request_id": uuid.uuid4().hex,
+                    "body": {"error": {"message": "mock failure"}} if failed else body,
+                },
+                "error": None,
+            }))
+
+        output_id, error_id = f"file-{uuid.uuid4().hex}", f"file-{uuid.uuid4().hex}"
+        with self.lock:
+            if lines:
+                self.files[output_id] = ("\n".join(lines) + "\n").encode("utf-8")
+            if error_lines:
+                self.files[error_id] = ("\n".join(error_lines) + "\n").encode("utf-8")
+            batch |= {
+                "status": "completed",
+                "output_file_id": output_id if lines else None,
+                "error_file_id": error_id if error_lines else None,
+                "completed_at": int(time.time()),
+                "request_counts": {"total": len(requests), "completed": len(lines), "failed": len(error_lines)},
+            }
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def setup(self):
+                super().setup()
+                self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+            def log_message(self, *args):
+                pass
+
+            def _send(self, status: int, data: bytes, content_type: str) -> None:
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _json(self, status: int, body: dict[str, any]) -> None:
+                self._send(status, json.dumps(body).encode("utf-8"), "application/json")
+
+            def _body(self) -> bytes:
+                return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+            def do_GET(self):
+                parts = self.path.split("?")[0].strip("/").split("/")
+                with server.lock:
+                    if parts[:2] == ["v1", "batches"] and len(parts) == 3 and parts[2] in server.batches:
+                        self._json(200, dict(server.batches[parts[2]]))
+                    elif parts[:2] == ["v1", "files"] and len(parts) == 4 and parts[3] == "content" and parts[2] in server.files:
+                        self._send(200, server.files[parts[2]], "application/octet-stream")
+                    else:
+                        self._json(404, {"error": {"message": f"not found: {self.path}"}})
+
+            def do_POST(self):
+                if self.path == "/v1/chat/completions":
+                    self._chat(json.loads(self._body()))
+                elif self.path == "/v1/files":
+                    self._upload()
+                elif self.path == "/v1/batches":
+                    self._create_batch(json.loads(self._body()))
+                else:
+                    self._json(404, {"error": {"message": f"not found: {self.path}"}})
+
+            def _chat(self, body: dict[str, any]) -> None:
+                response = completion(body["model"], body["messages"])
+                if not body.get("stream"):
+                    self._json(200, response)
+                    return
+
+                answer = response["choices"][0]["message"]["content"]
+                base = {"id": response["id"], "object": "chat.completion.chunk", "created": response["created"], "model": body["model"]}
+                events = [
+                    base | {"choices": [{"index": 0, "delta": {"content": word + " "}, "finish_reason": None}]}
+                    for word in answer.split()
+                ]
+                events.append(base | {"choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]})
+                if (body.get("stream_options") or {}).get("include_usage"):
+                    events.append(base | {"choices": [], "usage": response["usage"]})
+                data = "".join(f"data: {json.dumps(event)}\n\n" for event in events) + "data: [DONE]\n\n"
+                self._send(200, data.encode("utf-8"), "text/event-stream")
+
+            def _upload(self) -> None:
+                header = f"Content-Type: {self.headers['Content-Type']}\r\n\r\n".encode("utf-8")
+                message = BytesParser(policy=HTTP).parsebytes(header + self._body())
+                fields = {part.get_param("name", header="content-disposition"): part for part in message.iter_parts()}
+                file_id = f"file-{uuid.uuid4().hex}"
+                content = fields["file"].get_payload(decode=True)
+                with server.lock:
+                    server.files[file_id] = content
+                self._json(200, {
+                    "id": file_id, "object": "file", "bytes": len(content), "created_at": int(time.time()),
+                    "filename": fields["file"].get_filename(), "purpose": fields["purpose"].get_content().strip(),
+                })
+
+            def _create_batch(self, body: dict[str, any]) -> None:
+                if body["input_file_id"] not in server.files:
+                    self._json(404, {"error": {"message": "input file not found"}})
+                    return
+                batch_id = f"batch_{uuid.uuid4().hex}"
+                batch = {
+                    "id": batch_id, "object": "batch", "endpoint": body["endpoint"], "errors": None,
+                    "input_file_id": body["input_file_id"], "completion_window": body["completion_window"],
+                    "status": "in_progress", "output_file_id": None, "error_file_id": None,
+                    "created_at": int(time.time()), "metadata": body.get("metadata"),
+                    "request_counts": {"total": 0, "completed": 0, "failed": 0},
+                }
+                with server.lock:
+                    server.batches[batch_id] = batch
+                threading.Thread(target=server._run_batch, args=(batch_id,), daemon=True).start()
+                self._json(200, dict(batch))
+
+        return Handler
+
+if __name__ == "__main__":
+    with MockOpenAIServer(port=11436) as server:
+        print(f"Mock OpenAI listening on {server.base_url}")
+        threading.Event().wait()
@@ -0,0 +1,10 @@
+import importlib
+
+def load_object(target: str):
+    """
+    'module:attribute' -> the attribute, importing the module on first use.
+    """
+    module, _, attribute = target.partition(":")
+    if not module or not attribute:
+        raise ValueError(f"Expected 'module:attribute', got {target!r}")
+    return getattr(importlib.import_module(module), attribute)
@@ -1,16 +1,26 @@
-from ollama import chat
-from ollama import ChatResponse
-from tqdm.contrib.itertools import product
-from joblib import Parallel, delayed
+from itertools import product
+from tqdm import tqdm
 #import time
+import argparse
 import json
 import random
+import re
+from collections.abc import Iterator
 from pathlib import Path
-import dill as pickle
+from backends import empty_telemetry, get_backend
+from context_packing import get_counter, pack_documents, packed_context
+from dataset_loader import DocumentStore, iter_items, iter_windows
+from rate_limit import estimate_tokens
+from response_cache import ResponseCache
+from result_writer import ResultWriter, is_error_record, load_completed_keys
+from results_store import convert_jsonl
+from scheduler import Cell, schedule_by_model, warm_model, unload_model, is_local_model, avoided_load_time
+from sharding import cell_rng, in_shard, parse_shard, shard_path
 
 def load_dataset(path: str) -> list[dict[str, any]]:
     """
-    Expects a JSON file of the form:
+    Expects a JSON file of the form below, or one item per line in JSONL / Parquet.
+    Documents are interned in a shared DocumentStore (see dataset_loader.py).
     {
       "items": [
         {
@@ -23,9 +33,7 @@ def load_dataset(path: str) -> list[dict[str, any]]:
       ]
     }
     """
-    with open(path, "r", encoding="utf-8") as f:
-        data = json.load(f)
-    return data["items"]
+    return [item for _, item in iter_items(path)]
 
 def prompt_combos(prompts_dict: dict[str, dict[str, str]]):
     combos = []
@@ -45,16 +53,47 @@ def prompt_combos(prompts_dict: dict[str, dict[str, str]]):
     
     return combos
 
+def select_combos(names: list[str] | None = None) -> list[dict[str, str]]:
+    """
+    The prompt combos called `names` (e.g. 'langchain_system'), or all of them.
+    """
+    combos = prompt_combos(PROMPT_VARIANTS)
+    if names is None:
+        return combos
+    by_name = {combo["name"]: combo for combo in combos}
+    unknown = [name for name in names if name not in by_name]
+    if unknown:
+        raise ValueError(f"Unknown prompt variants {unknown}, expected some of {list(by_name)}")
+    return [by_name[name] for name in names]
+
+def select_conditions(names: list[str] | None = None) -> list[str]:
+    """
+    The context conditions called `names`, or CONTEXT_CONDITIONS; the optional
+    'retrieved' condition only runs when it is named.
+    """
+    if not names:
+        return CONTEXT_CONDITIONS
+    known = CONTEXT_CONDITIONS + ["retrieved"]
+    unknown = [name for name in names if name not in known]
+    if unknown:
+        raise ValueError(f"Unknown context conditions {unknown}, expected some of {known}")
+    return list(names)
+
 def build_context(
     item: dict[str, any],
     condition: str = "relevant_only",
-    shuffle: bool = False
+    shuffle: bool = False,
+    rng: random.Random | None = None
 ):
     """
     Build a context string according to the condition:
     - 'relevant_only'   -> only relevant_docs
     - 'irrelevant_only' -> only irrelevant_docs
     - 'mixed'           -> both (original behavior, if you want it)
+    - 'retrieved'       -> the item's retrieved_docs in rank order (see retrieval.Retriever),
+                           labelled relevant if they are among its relevant_docs
+
+    Shuffling uses `rng` when given (see sharding.cell_rng), else the global RNG.
 
     Returns:
         context_str: str
@@ -70,8 +109,15 @@ def build_context(
         for d in item.get("irrelevant_docs", []):
             docs.append({"text": d, "label": "irrelevant"})
 
+    if condition == "retrieved":
+        if "retrieved_docs" not in item:
+            raise ValueError("The 'retrieved' condition needs retrieved_docs, attach them with retrieval.Retriever.attach")
+        relevant = set(item.get("relevant_docs", []))
+        for d in item["retrieved_docs"]:
+            docs.append({"text": d, "label": "relevant" if d in relevant else "irrelevant"})
+
     if shuffle:
-        random.shuffle(docs)
+        (rng or random).shuffle(docs)
 
     context_str = "\n\n".join(d["text"] for d in docs)
     return context_str, docs
@@ -100,22 +146,7 @@ def build_prompt_messages(question: str, context: str, template: dict[str, str])
             ]
     return messages
 
-def call_model(prompt_messages: list[dict[str, str]], is_gemini: bool, model_name: str, answer_start: str | None = None) -> str:
-    """
-    Single-call wrapper around google.colab.ai.generate_text.
-    """
-    if is_gemini:
-        from google.colab import ai
-
-        prompt = "\n".join([message["content"] for message in prompt_messages])
-        answer = ai.generate_text(prompt, model_name=model_name).strip()
-        # return client.models.generate_content(
-        #     model=model_name, contents=prompt
-        # ).text.strip()
-    else:
-        response: ChatResponse = chat(model=model_name, messages=prompt_messages)
-        answer = response.message.content.strip()
-    
+def extract_answer(answer: str, answer_start: str | None = None) -> str:
     if answer_start is not None:
         start_ind = answer.lower().find(answer_start.lower())
         if start_ind == -1:
@@ -124,45 +155,162 @@ def call_model(prompt_messages: list[dict[str, str]], is_gemini: bool, model_nam
 
     return answer
 
+_THINK_BLOCK = re.compile(r"<think>.*?</think>", re.DOTALL)
+
+def answer_complete(text: str, answer_start: str | None = None) -> bool:
+    """
+    True once the streamed text holds a finished answer line: the first non-empty
+    line after `answer_start` (or after any <think> block) has been ended by a newline.
+    """
+    visible = _THINK_BLOCK.sub("", text)
+    if "<think>" in visible:
+        return False
+    if answer_start is not None:
+        start_ind = visible.lower().find(answer_start.lower())
+        if start_ind == -1:
+            return False
+        visible = visible[start_ind + len(answer_start):]
+
+    line, newline, _ = visible.lstrip().partition("\n")
+    # A line ending in ':' is a heading such as 'Answer:', the answer itself follows
+    return bool(newline) and bool(line.strip()) and not line.rstrip().endswith(":")
+
+class AnswerSpan:
+    """
+    Accumulates a streamed completion; `feed` is passed to a backend as `until`
+    so generation stops as soon as the answer span is complete.
+    """
+    def __init__(self, answer_start: str | None = None):
+        self.answer_start = answer_start
+        self.text = ""
+
+    def feed(self, chunk: str) -> bool:
+        self.text += chunk
+        # An answer line can only finish on a chunk that carries a newline
+        return "\n" in chunk and answer_complete(self.text, self.answer_start)
+
+def generate(
+    prompt_messages: list[dict[str, str]],
+    model_name: str,
+    options: dict[str, any] | None = None,
+    answer_start: str | None = None,
+    stop_on_answer: bool = False
+) -> tuple[str, dict[str, any]]:
+    backend = get_backend(model_name)
+
+    def attempt() -> tuple[str, dict[str, any]]:
+        # A fresh span per attempt, so a retried stream does not see the failed one's text
+        until = AnswerSpan(answer_start).feed if stop_on_answer else None
+        return backend.chat(model_name, prompt_messages, options, until=until)
+
+    return backend.call(attempt, estimate_tokens(prompt_messages, options))
+
+def call_model(
+    prompt_messages: list[dict[str, str]],
+    model_name: str,
+    answer_start: str | None = None,
+    options: dict[str, any] | None = None,
+    cache: ResponseCache | None = None,
+    stop_on_answer: bool = False
+) -> tuple[str, dict[str, any]]:
+    """
+    Single-call wrapper around the backend serving `model_name` (see backends.py).
+    With `stop_on_answer` the completion is streamed and cut off once the answer
+    span is complete (see AnswerSpan). Remote backends retry 429s and timeouts.
+
+    When a cache is given, the raw answer is looked up by (model_name,
+    prompt_messages, options) before any backend is called. A cached answer
+    comes back with the telemetry of the call that produced it, marked cached.
+
+    Returns:
+        answer, telemetry
+    """
+    cached = None
+    if cache is not None:
+        cache_options = (options or {}) | ({"stop_on_answer": True} if stop_on_answer else {})
+        cache_key = ResponseCache.make_key(model_name, prompt_messages, cache_options)
+        cached = cache.get(cache_key)
+
+    if cached is not None:
+        answer, telemetry = cached
+        telemetry = (telemetry or empty_telemetry()) | {"cached": True}
+    else:
+        answer, telemetry = generate(prompt_messages, model_name, options, answer_start, stop_on_answer)
+        if cache is not None:
+            cache.put(cache_key, model_name, answer, telemetry)
+    
+    return extract_answer(answer, answer_start), telemetry
+
 def save_jsonl(records: list[dict[str, any]], path: str) -> None:
     with open(path, "w", encoding="utf-8") as f:
         for r in records:
             f.write(json.dumps(r, ensure_ascii=False) + "\n")
 
-def rag_evaluation(dataset_item: tuple[int, dict[str, any]], context_condition: str, model: str, prompt_combo: dict[str, str]) -> dict[str, any]:
-    idx, item = dataset_item
-    question = item["question"]
-    gold_answer = item.get("gold_answer", "")
+def prepare_evaluation(
+    dataset_item: tuple[int, dict[str, any]],
+    context_condition: str,
+    prompt_combo: dict[str, str],
+    seed: int = 42,
+    model: str | None = None
+) -> tuple[str, list[dict[str, any]], list[dict[str, str]], str | None]:
+    """
+    Builds the context and packs it into the model's CONTEXT_BUDGETS token budget.
+    Every entry of docs_metadata says whether the document made it into the context.
 
-    context_str, docs_metadata = build_context(
+    Returns:
+        context_str, docs_metadata, prompt_messages, answer_start
+    """
+    idx, item = dataset_item
+    rng = cell_rng(seed, idx, context_condition)
+    _, docs_metadata = build_context(
         item,
         condition=context_condition,
         shuffle=(context_condition == "mixed"),
+        rng=rng,
     )
 
-    prompt_messages = build_prompt_messages(question, context_str, prompt_combo)
-    is_gemini = (model.startswith("gemini"))
+    budget = CONTEXT_BUDGETS.get(model, CONTEXT_BUDGETS["default"]) if model is not None else None
+    if budget is not None:
+        docs_metadata = pack_documents(docs_metadata, get_counter(model), budget, PACKING_POLICY, rng)
+    else:
+        docs_metadata = [d | {"included": True} for d in docs_metadata]
+    context_str = packed_context(docs_metadata)
+
+    prompt_messages = build_prompt_messages(item["question"], context_str, prompt_combo)
     answer_start = "FINAL ANSWER:" if prompt_combo["name"].startswith("mastra_cot") else None
-    try:
-        model_answer = call_model(prompt_messages, is_gemini, model, answer_start)
-        #time.sleep(10)
-    except Exception as e:
-        print(f"[ERROR] item {idx}, variant '{prompt_combo["name"]}', "
-                f"context '{context_condition}': {e}")
-        model_answer = f"[ERROR] {e}"
-    
+    return context_str, docs_metadata, prompt_messages, answer_start
+
+def generation_options(prompt_combo: dict[str, str]) -> dict[str, any]:
+    """
+    Output-token cap and stop sequences for a prompt combo, from its family in GENERATION_LIMITS.
+    """
+    return dict(GENERATION_LIMITS[prompt_combo["name"].rsplit("_", 1)[0]])
+
+def build_record(
+    dataset_item: tuple[int, dict[str, any]],
+    context_condition: str,
+    model: str,
+    prompt_combo: dict[str, str],
+    context_str: str,
+    docs_metadata: list[dict[str, any]],
+    model_answer: str,
+    telemetry: dict[str, any] | None = None
+) -> dict[str, any]:
+    idx, item = dataset_item
+    question = item["question"]
     record = {
         "item_index": idx,
         "model_name": model,
         "prompt_variant": prompt_combo["name"],
         "context_condition": context_condition,  # <--- key for analysis
         "question": question,
-        "gold_answer": gold_answer,
+        "gold_answer": item.get("gold_answer", ""),
         "context": context_str,
-        "documents": docs_metadata,   # each has text + label
+        "documents": docs_metadata,   # each has text + label + included
         "system_prompt": prompt_combo.get("system", None),
         "user_prompt": prompt_combo.get("user", None),
         "model_answer": model_answer,
+        "telemetry": telemetry,       # token counts and timings of the call, None on error
     }
 
     print(
@@ -171,6 +319,34 @@ def rag_evaluation(dataset_item: tuple[int, dict[str, any]], context_condition:
 
     return record
 
+def rag_evaluation(
+    dataset_item: tuple[int, dict[str, any]],
+    context_condition: str,
+    model: str,
+    prompt_combo: dict[str, str],
+    cache: ResponseCache | None = None,
+    seed: int = 42
+) -> dict[str, any]:
+    idx, item = dataset_item
+    context_str, docs_metadata, prompt_messages, answer_start = prepare_evaluation(
+        dataset_item, context_condition, prompt_combo, seed, model
+    )
+
+    telemetry = None
+    try:
+        model_answer, telemetry = call_model(
+            prompt_messages, model, answer_start, generation_options(prompt_combo), cache=cache, stop_on_answer=True
+        )
+        #time.sleep(10)
+    except Exception as e:
+        print(f"[ERROR] item {idx}, variant '{prompt_combo["name"]}', "
+                f"context '{context_condition}': {e}")
+        model_answer = f"[ERROR] {e}"
+
+    return build_record(
+        dataset_item, context_condition, model, prompt_combo, context_str, docs_metadata, model_answer, telemetry
+    )
+
 MODELS = [
     "llama2:7b",
     "llama3.2",
@@ -261,31 +437,168 @@ PROMPT_VARIANTS = {
     }
 }
 
+# Ollama-style options per prompt family. Every variant asks for one sentence, so the
+# caps only bound runaway generations (thinking models spend tokens before answering);
+# the stop sequences catch a model starting to echo the prompt template.
+GENERATION_LIMITS = {
+    "langchain": {"num_predict": 256, "stop": ["\nQuestion:"]},
+    "llamaindex": {"num_predict": 256, "stop": ["---------------------"]},
+    "claude_rag": {"num_predict": 256, "stop": ["<query>", "<documents>"]},
+    "mastra_cot": {"num_predict": 1024, "stop": ["\nQuestion:"]},
+}
+
+# Context tokens per prompt by model name ("default" for the rest); None keeps every
+# document. Documents are dropped in PACKING_POLICY order (see context_packing.py).
+CONTEXT_BUDGETS: dict[str, int | None] = {
+    "default": None,
+}
+PACKING_POLICY = "relevant_first"
+
+# Top-k retrieval for the optional 'retrieved' condition; build the index with
+# retrieval.py. N_PROBE only applies to an index with IVF lists (None = exact search).
+RETRIEVAL_INDEX_DIR = "results/retrieval_index"
+RETRIEVAL_TOP_K = 5
+RETRIEVAL_N_PROBE: int | None = 8
 
-def main():
+KEEP_ALIVE = "30m"
+
+def grid_cells(
+    window: list[tuple[int, dict[str, any]]],
+    conditions: list[str],
+    models: list[str],
+    combos: list[dict[str, str]],
+    completed: set[tuple] = frozenset(),
+    shard: tuple[int, int] | None = None
+) -> list[Cell]:
+    """
+    The cells of `window` that are not in `completed` and belong to `shard`.
+    """
+    return [
+        (dataset_item, condition, model, prompt_combo)
+        for dataset_item, condition, model, prompt_combo in product(window, conditions, models, combos)
+        if (dataset_item[0], model, prompt_combo["name"], condition) not in completed
+        and in_shard((dataset_item[0], model, prompt_combo["name"], condition), shard)
+    ]
+
+def run_batches(
+    batches: list[tuple[str, list[tuple]]],
+    cache: ResponseCache | None = None,
+    seed: int = 42,
+    load_times: dict[str, float] | None = None,
+    desc: str = "",
+    manage_models: bool = True
+) -> Iterator[dict[str, any]]:
+    """
+    Runs schedule_by_model batches one model at a time, loading each local model
+    before its batch and unloading it after, and yields records (errors included)
+    as they complete. Model load times are recorded in `load_times`.
+
+    With `manage_models=False` local models are neither loaded nor unloaded here, for
+    callers that keep them resident across several calls.
+    """
+    from joblib import Parallel, delayed
+
+    load_times = load_times if load_times is not None else {}
+    for model, batch in batches:
+        if manage_models and is_local_model(model):
+            load_times[model] = warm_model(model, keep_alive=KEEP_ALIVE)
+            print(f"Loaded {model} in {load_times[model]:.1f}s")
+
+        results = Parallel(n_jobs=-1, prefer="threads", return_as="generator_unordered")(
+            delayed(rag_evaluation)(*cell, cache, seed) for cell in batch
+        )
+        yield from tqdm(results, total=len(batch), desc=desc + model)
+
+        if is_local_model(model):
+            if manage_models:
+                unload_model(model)
+        elif get_backend(model).controller is not None:
+            print(f"{model} rate control: {get_backend(model).controller.stats()}")
+
+def main(
+    shard: tuple[int, int] | None = None,
+    models: list[str] | None = None,
+    prompt_variants: list[str] | None = None,
+    dataset_path: str = "data/input_data.json",
+    output_path: str = "results/rag_results.jsonl",
+    conditions: list[str] | None = None
+):
+    """
+    Runs the grid of `models` x `prompt_variants` x `conditions` (default MODELS, every
+    combo and CONTEXT_CONDITIONS), or with `shard=(i, N)` only the cells hashed to
+    shard i of N (merge the shard outputs with sharding.py afterwards). The 'retrieved'
+    condition retrieves each window's documents from RETRIEVAL_INDEX_DIR.
+
+    Items are streamed from the dataset WINDOW_SIZE at a time, so only one window of
+    cells is held in memory. The dataset is streamed once per model, so each local
+    model stays loaded for all of its windows and Ollama never swaps models.
+    """
     SEED = 42
-    DATASET_PATH = "data/input_data.json"
-    OUTPUT_PATH = f"results/rag_results.jsonl"
-
-    random.seed(SEED)
-
-    PROMPT_COMBOS = prompt_combos(PROMPT_VARIANTS)
-    dataset = load_dataset(DATASET_PATH)
-
-    results = Parallel(n_jobs=-1, prefer="threads")(delayed(rag_evaluation)(
-            dataset_item, 
-            condition, 
-            model, 
-            prompt_combo
-        ) for dataset_item, condition, model, prompt_combo in product(
-                list(enumerate(dataset)), 
-                CONTEXT_CONDITIONS, 
-                MODELS, 
-                PROMPT_COMBOS
-            ))
-    
-    save_jsonl(results, OUTPUT_PATH)
-    print(f"\nSaved {len(results)} generations to {OUTPUT_PATH}")
+    DATASET_PATH = dataset_path
+    OUTPUT_PATH = shard_path(output_path, shard)
+    STORE_DIR = "results/store"
+    CACHE_PATH = "results/response_cache.sqlite"
+    WINDOW_SIZE = 1000
+
+    cache = ResponseCache(CACHE_PATH)
+
+    models = models or MODELS
+    conditions = select_conditions(conditions)
+    PROMPT_COMBOS = select_combos(prompt_variants)
+    documents = DocumentStore()
+
+    retriever = None
+    if "retrieved" in conditions:
+        from retrieval import Retriever
+        retriever = Retriever(RETRIEVAL_INDEX_DIR, RETRIEVAL_TOP_K, RETRIEVAL_N_PROBE)
+
+    completed = load_completed_keys(OUTPUT_PATH)
+    if completed:
+        print(f"Resuming: {len(completed)} cells already in {OUTPUT_PATH}")
+
+    load_times = {}
+    naive_order, scheduled_order = [], []
+    failed = 0
+    with ResultWriter(OUTPUT_PATH) as writer:
+        # Models run one after another over the whole dataset, so each local model is
+        # loaded once per run instead of once per window
+        for position, model in enumerate(models):
+            loaded = False
+            try:
+                for window in iter_windows(iter_items(DATASET_PATH, documents), WINDOW_SIZE):
+                    if retriever is not None:
+                        retriever.attach(window)
+                    if position == 0:
+                        naive_order += [cell[2] for cell in grid_cells(window, conditions, models, PROMPT_COMBOS, completed, shard)]
+                    batches = schedule_by_model(grid_cells(window, conditions, [model], PROMPT_COMBOS, completed, shard))
+                    if batches and not loaded and is_local_model(model):
+                        load_times[model] = warm_model(model, keep_alive=KEEP_ALIVE)
+                        print(f"Loaded {model} in {load_times[model]:.1f}s")
+                        loaded = True
+                    scheduled_order += [cell[2] for _, batch in batches for cell in batch]
+                    for record in run_batches(batches, cache, SEED, desc=f"items {window[0][0]}-{window[-1][0]} ", manage_models=False):
+                        # Failed cells are left out so the next run retries them
+                        if is_error_record(record):
+                            failed += 1
+                        else:
+                            writer.write(record)
+            finally:
+                if loaded:
+                    unload_model(model)
+
+    saved = avoided_load_time(naive_order, scheduled_order, load_times)
+    print(f"Model-affinity scheduling avoided ~{saved:.1f}s of model loading")
+    print(f"\nSaved {writer.written} generations to {OUTPUT_PATH} ({len(documents)} distinct documents)")
+    if failed:
+        print(f"{failed} cells failed after retries and will be retried on the next run")
+    if shard is None:
+        convert_jsonl(OUTPUT_PATH, STORE_DIR)
+    else:
+        print(f"Shard {shard[0]}/{shard[1]} done; run `python sharding.py {shard[1]}` once every shard has finished")
+    print(f"Response cache: {cache.stats()}")
+    cache.close()
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Run the RAG prompting grid")
+    parser.add_argument("--shard", type=parse_shard, default=None, help="run only shard i of N, given as i/N")
+    main(parser.parse_args().shard)
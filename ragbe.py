@@ -0,0 +1,149 @@
+"""
+Single entry point for the RAGBE pipeline:
+
+    python ragbe.py generate --models llama3.2 qwen3:4b --variants langchain_base
+    python ragbe.py generate --async --max-in-flight 16
+    python ragbe.py score --metrics rougeL bleu
+    python ragbe.py list
+
+Each subcommand imports its module only when it runs, and metrics and backends are
+resolved by name through their registries, so a lexical-only scoring run never pays
+for torch, and generation does not import a metric library.
+"""
+import argparse
+
+def _grid_options(parser: argparse.ArgumentParser, models: bool = True) -> None:
+    if models:
+        parser.add_argument("--models", nargs="+", default=None, help="models to run (default: prompting_script.MODELS)")
+    parser.add_argument("--variants", nargs="+", default=None, help="prompt combos to run, e.g. langchain_base (default: all)")
+    parser.add_argument("--dataset", default="data/input_data.json", help="dataset in JSON, JSONL or Parquet")
+    parser.add_argument("--output", default="results/rag_results.jsonl", help="generations JSONL")
+
+def _backend(value: str) -> tuple[tuple[str, ...], str]:
+    prefixes, _, target = value.partition("=")
+    if not prefixes or ":" not in target:
+        raise argparse.ArgumentTypeError(f"Expected PREFIX[,PREFIX...]=module:Class, got {value!r}")
+    return tuple(prefixes.split(",")), target
+
+def _shard(value: str) -> tuple[int, int]:
+    from sharding import parse_shard
+    return parse_shard(value)
+
+def generate(args: argparse.Namespace) -> None:
+    if args.use_async:
+        from async_engine import main
+        main(args.max_in_flight, args.shard, args.models, args.variants, args.dataset, args.output, args.conditions)
+        return
+    from prompting_script import main
+    main(args.shard, args.models, args.variants, args.dataset, args.output, args.conditions)
+
+def adaptive(args: argparse.Namespace) -> None:
+    from adaptive import main
+    main(args.models, args.variants, args.dataset, args.output)
+
+def batch(args: argparse.Namespace) -> None:
+    from batch_mode import main
+    main(args.model, args.poll_interval, args.variants, args.dataset, args.output)
+
+def merge_shards(args: argparse.Namespace) -> None:
+    from sharding import main
+    main(args.n_shards, args.models, args.variants, args.dataset, args.output, args.conditions)
+
+def score(args: argparse.Namespace) -> None:
+    from score_responses import main
+    main(args.streaming, args.batch_size, args.metrics, args.results, args.output, args.timings)
+
+def judge(args: argparse.Namespace) -> None:
+    from judge import main
+    main(args.judge_model, args.max_in_flight, args.results)
+
+def telemetry(args: argparse.Namespace) -> None:
+    from telemetry import main
+    main(args.store)
+
+def index(args: argparse.Namespace) -> None:
+    from retrieval import main
+    main(args.dataset, args.corpus, args.index_dir, args.embedder, args.n_lists)
+
+def list_choices(args: argparse.Namespace) -> None:
+    from metrics import METRICS
+    from prompting_script import CONTEXT_CONDITIONS, MODELS, select_combos
+    print("metrics:    " + " ".join(METRICS))
+    print("models:     " + " ".join(MODELS))
+    print("variants:   " + " ".join(combo["name"] for combo in select_combos()))
+    print("conditions: " + " ".join(CONTEXT_CONDITIONS) + " (optional: retrieved)")
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="ragbe", description="RAG prompting benchmark")
+    parser.add_argument(
+        "--backend", type=_backend, action="append", default=[], metavar="PREFIX=MODULE:CLASS",
+        help="route models starting with PREFIX to a backend class, imported on first use (repeatable)"
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    command = commands.add_parser("generate", help="run the prompting grid")
+    _grid_options(command)
+    command.add_argument("--shard", type=_shard, default=None, help="run only shard i of N, given as i/N")
+    command.add_argument("--conditions", nargs="+", default=None, help="context conditions, e.g. mixed retrieved (default: CONTEXT_CONDITIONS)")
+    command.add_argument("--async", dest="use_async", action="store_true", help="send requests through async_engine instead of thread batches")
+    command.add_argument("--max-in-flight", type=int, default=8, help="concurrent requests per model with --async")
+    command.set_defaults(run=generate)
+
+    command = commands.add_parser("adaptive", help="run the grid until every comparison is settled")
+    _grid_options(command)
+    command.set_defaults(run=adaptive)
+
+    command = commands.add_parser("batch", help="run one OpenAI model through the batch API")
+    # One batch job serves a single model, given with --model
+    _grid_options(command, models=False)
+    command.add_argument("--model", default="gpt-4.1-mini")
+    command.add_argument("--poll-interval", type=float, default=30.0, help="seconds between batch status checks")
+    command.set_defaults(run=batch)
+
+    command = commands.add_parser("merge-shards", help="merge and validate the outputs of a sharded run")
+    _grid_options(command)
+    command.add_argument("n_shards", type=int)
+    command.add_argument("--conditions", nargs="+", default=None, help="context conditions the shards ran (default: CONTEXT_CONDITIONS)")
+    command.set_defaults(run=merge_shards)
+
+    command = commands.add_parser("score", help="score the generations with reference-based metrics")
+    command.add_argument("--metrics", nargs="+", default=None, help="metric names (default: rougeL bleu faithfulness bert_score)")
+    command.add_argument("--results", default="results/rag_results.jsonl")
+    command.add_argument("--streaming", action="store_true", help="score in row batches written as Parquet parts")
+    command.add_argument("--batch-size", type=int, default=50_000)
+    command.add_argument("--output", default=None, help="scores Parquet file, or with --streaming a directory of parts (default: results/metric_scores)")
+    command.add_argument("--timings", default="results/metric_timings.json", help="per-metric timings JSON")
+    command.set_defaults(run=score)
+
+    command = commands.add_parser("judge", help="grade the generations with an LLM judge")
+    command.add_argument("--judge-model", default="qwen3:4b")
+    command.add_argument("--max-in-flight", type=int, default=16)
+    command.add_argument("--results", default="results/rag_results.jsonl")
+    command.set_defaults(run=judge)
+
+    command = commands.add_parser("telemetry", help="summarize token throughput and latency")
+    command.add_argument("--store", default="results/store")
+    command.set_defaults(run=telemetry)
+
+    command = commands.add_parser("index", help="embed the document pool for the 'retrieved' condition")
+    command.add_argument("--dataset", default="data/input_data.json")
+    command.add_argument("--corpus", default=None, help="extra JSONL or Parquet documents with a 'text' column")
+    command.add_argument("--index-dir", default="results/retrieval_index")
+    command.add_argument("--embedder", default="sentence-transformers/all-MiniLM-L6-v2", help="Hugging Face encoder, or 'hashing' to index offline")
+    command.add_argument("--n-lists", type=int, default=None, help="IVF lists of the coarse quantizer (default: exact search only)")
+    command.set_defaults(run=index)
+
+    command = commands.add_parser("list", help="list the registered metrics, models and prompt variants")
+    command.set_defaults(run=list_choices)
+    return parser
+
+def main(argv: list[str] | None = None) -> None:
+    args = build_parser().parse_args(argv)
+    if args.backend:
+        from backends import register_backend
+        for prefixes, target in args.backend:
+            register_backend(prefixes, target)
+    args.run(args)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,262 @@
+import asyncio
+import os
+import random
+import sys
+import threading
+import time
+from collections.abc import Awaitable, Callable
+
+import httpx
+
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+def _status(exc: Exception) -> int | None:
+    # openai/ollama errors carry status_code, google-genai errors carry code
+    status = getattr(exc, "status_code", None) or getattr(exc, "code", None)
+    return status if isinstance(status, int) else None
+
+def is_rate_limit(exc: Exception) -> bool:
+    return _status(exc) == 429
+
+def is_retryable(exc: Exception) -> bool:
+    """
+    Rate limits, overloaded servers, timeouts and dropped connections are worth retrying;
+    anything else (bad request, auth, unknown model) fails the same way every time.
+    """
+    if _status(exc) in RETRYABLE_STATUS:
+        return True
+    if isinstance(exc, (TimeoutError, ConnectionError, httpx.TimeoutException, httpx.NetworkError, httpx.RemoteProtocolError)):
+        return True
+    # Only check openai's transport errors if the client library is in use at all
+    openai = sys.modules.get("openai")
+    return openai is not None and isinstance(exc, openai.APIConnectionError)
+
+def retry_after(exc: Exception) -> float | None:
+    response = getattr(exc, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+def backoff_delay(attempt: int, base_delay: float = 1.0, max_delay: float = 60.0) -> float:
+    """
+    Exponential backoff with full jitter, so throttled clients do not retry in lockstep.
+    """
+    return random.uniform(0, min(max_delay, base_delay * 2 ** attempt))
+
+def estimate_tokens(messages: list[dict[str, str]], options: dict[str, any] | None = None) -> int:
+    """
+    Rough prompt + completion token count for tokens/min budgeting (~4 characters per token).
+    """
+    prompt = sum(len(message["content"]) for message in messages) // 4
+    return prompt + (options or {}).get("num_predict", 256)
+
+class TokenBucket:
+    """
+    Refills at `per_minute` units per minute up to `burst`. Reservations may overdraw
+    the bucket; the caller then waits until the debt has been refilled.
+    """
+    def __init__(self, per_minute: float, burst: float | None = None):
+        self.rate = per_minute / 60
+        self.capacity = burst or per_minute
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, amount: float = 1) -> float:
+        """
+        Takes `amount` from the bucket and returns the seconds to wait before using it.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= amount
+            return max(0.0, -self.tokens / self.rate)
+
+    def acquire(self, amount: float = 1) -> None:
+        time.sleep(self.reserve(amount))
+
+    async def aacquire(self, amount: float = 1) -> None:
+        await asyncio.sleep(self.reserve(amount))
+
+class AIMDController:
+    """
+    Concurrency limit that grows by about one slot per window of successful calls and
+    is cut multiplicatively on a rate limit or when latency exceeds `latency_target`.
+    Cuts are at most one per `cooldown` seconds, so a burst of 429s from one window
+    counts once.
+    """
+    def __init__(
+        self,
+        initial: int = 4,
+        minimum: int = 1,
+        maximum: int = 64,
+        backoff: float = 0.5,
+        latency_target: float | None = None,
+        cooldown: float = 1.0
+    ):
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.backoff = backoff
+        self.latency_target = latency_target
+        self.cooldown = cooldown
+        self.in_flight = 0
+        self._last_decrease = 0.0
+        self._cond = threading.Condition()
+
+    def _try_acquire(self) -> bool:
+        if self.in_flight < int(self.limit):
+            self.in_flight += 1
+            return True
+        return False
+
+    def acquire(self) -> None:
+        with self._cond:
+            while not self._try_acquire():
+                self._cond.wait()
+
+    async def aacquire(self, poll: float = 0.01) -> None:
+        # Polls instead of waiting on the condition, which would block the event loop
+        while True:
+            with self._cond:
+                if self._try_acquire():
+                    return
+            await asyncio.sleep(poll)
+
+    def release(self) -> None:
+        with self._cond:
+            self.in_flight -= 1
+            self._cond.notify_all()
+
+    def _decrease(self) -> None:
+        now = time.monotonic()
+        if now - self._last_decrease >= self.cooldown:
+            self.limit = max(self.minimum, self.limit * self.backoff)
+            self._last_decrease = now
+
+    def record_success(self, latency: float) -> None:
+        with self._cond:
+            if self.latency_target is not None and latency > self.latency_target:
+                self._decrease()
+            else:
+                self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            self._cond.notify_all()
+
+    def record_throttle(self) -> None:
+        with self._cond:
+            self._decrease()
+
+class RateLimits:
+    """
+    Limits for one backend. rpm/tpm are the provider's requests and tokens per minute
+    (None for no bucket); the AIMD controller finds the concurrency below them.
+    """
+    def __init__(
+        self,
+        rpm: float | None = None,
+        tpm: float | None = None,
+        initial_concurrency: int = 4,
+        max_concurrency: int = 64,
+        latency_target: float | None = None,
+        max_retries: int = 6,
+        base_delay: float = 1.0,
+        max_delay: float = 60.0
+    ):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.initial_concurrency = initial_concurrency
+        self.max_concurrency = max_concurrency
+        self.latency_target = latency_target
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    @classmethod
+    def from_env(cls, prefix: str, **defaults) -> "RateLimits":
+        """
+        Reads <prefix>_RPM, <prefix>_TPM and <prefix>_MAX_CONCURRENCY, e.g. OPENAI_RPM=500.
+        """
+        rpm, tpm = os.getenv(f"{prefix}_RPM"), os.getenv(f"{prefix}_TPM")
+        max_concurrency = os.getenv(f"{prefix}_MAX_CONCURRENCY")
+        if rpm is not None:
+            defaults["rpm"] = float(rpm)
+        if tpm is not None:
+            defaults["tpm"] = float(tpm)
+        if max_concurrency is not None:
+            defaults["max_concurrency"] = int(max_concurrency)
+        return cls(**defaults)
+
+class RateController:
+    """
+    Runs backend calls under the request and token buckets and the AIMD concurrency
+    limit, retrying retryable failures with jittered exponential backoff (or the
+    server's Retry-After). Non-retryable errors and the last failed attempt are raised.
+    """
+    def __init__(self, limits: RateLimits):
+        self.limits = limits
+        self.requests = TokenBucket(limits.rpm) if limits.rpm else None
+        self.tokens = TokenBucket(limits.tpm) if limits.tpm else None
+        self.concurrency = AIMDController(
+            initial=min(limits.initial_concurrency, limits.max_concurrency),
+            maximum=limits.max_concurrency,
+            latency_target=limits.latency_target,
+        )
+        self.retries = 0
+        self.throttles = 0
+
+    def _delay(self, attempt: int, exc: Exception) -> float:
+        self.retries += 1
+        if is_rate_limit(exc):
+            self.throttles += 1
+            self.concurrency.record_throttle()
+        return retry_after(exc) or backoff_delay(attempt, self.limits.base_delay, self.limits.max_delay)
+
+    def call(self, fn: Callable[[], any], tokens: int = 0) -> any:
+        for attempt in range(self.limits.max_retries + 1):
+            if self.requests is not None:
+                self.requests.acquire(1)
+            if self.tokens is not None:
+                self.tokens.acquire(tokens)
+            self.concurrency.acquire()
+            start = time.perf_counter()
+            try:
+                result = fn()
+            except Exception as e:
+                if not is_retryable(e) or attempt == self.limits.max_retries:
+                    raise
+                delay = self._delay(attempt, e)
+            else:
+                self.concurrency.record_success(time.perf_counter() - start)
+                return result
+            finally:
+                self.concurrency.release()
+            time.sleep(delay)
+
+    async def acall(self, fn: Callable[[], Awaitable[any]], tokens: int = 0) -> any:
+        for attempt in range(self.limits.max_retries + 1):
+            if self.requests is not None:
+                await self.requests.aacquire(1)
+            if self.tokens is not None:
+                await self.tokens.aacquire(tokens)
+            await self.concurrency.aacquire()
+            start = time.perf_counter()
+            try:
+                result = await fn()
+            except Exception as e:
+                if not is_retryable(e) or attempt == self.limits.max_retries:
+                    raise
+                delay = self._delay(attempt, e)
+            else:
+                self.concurrency.record_success(time.perf_counter() - start)
+                return result
+            finally:
+                self.concurrency.release()
+            await asyncio.sleep(delay)
+
+    def stats(self) -> dict[str, any]:
+        return {"concurrency_limit": int(self.concurrency.limit), "retries": self.retries, "throttles": self.throttles}
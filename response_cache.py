@@ -0,0 +1,98 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+class ResponseCache:
+    """
+    On-disk cache of model answers and the telemetry of the call that produced
+    them, keyed on a hash of the model name, the exact prompt messages and the
+    generation options.
+
+    Entries are evicted least-recently-used first once the stored answers grow
+    past `max_bytes`. Safe to share between the threads of a joblib run.
+    """
+    def __init__(self, path: str, max_bytes: int = 512 * 1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, "
+            "model_name TEXT NOT NULL, "
+            "answer TEXT NOT NULL, "
+            "size INTEGER NOT NULL, "
+            "last_access REAL NOT NULL, "
+            "telemetry TEXT)"
+        )
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(responses)")]
+        if "telemetry" not in columns:
+            self._conn.execute("ALTER TABLE responses ADD COLUMN telemetry TEXT")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access)")
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(model_name: str, prompt_messages: list[dict[str, str]], options: dict[str, any] | None = None) -> str:
+        payload = json.dumps(
+            {"model": model_name, "messages": prompt_messages, "options": options or {}},
+            sort_keys=True,
+            ensure_ascii=False,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> tuple[str, dict[str, any] | None] | None:
+        """
+        Returns:
+            (answer, telemetry) or None on a miss
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT answer, telemetry FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (time.time(), key))
+            self._conn.commit()
+            return row[0], json.loads(row[1]) if row[1] is not None else None
+
+    def put(self, key: str, model_name: str, answer: str, telemetry: dict[str, any] | None = None) -> None:
+        size = len(answer.encode("utf-8"))
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, model_name, answer, size, last_access, telemetry) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, model_name, answer, size, time.time(), json.dumps(telemetry) if telemetry is not None else None),
+            )
+            self._evict()
+            self._conn.commit()
+
+    def size(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    def _evict(self) -> None:
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        rows = self._conn.execute("SELECT key, size FROM responses ORDER BY last_access ASC").fetchall()
+        stale = []
+        for key, size in rows:
+            if total <= self.max_bytes:
+                break
+            stale.append((key,))
+            total -= size
+        self._conn.executemany("DELETE FROM responses WHERE key = ?", stale)
+
+    def stats(self) -> dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "bytes": self.size()}
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,94 @@
+import json
+import os
+from pathlib import Path
+
+RECORD_KEY_FIELDS = ("item_index", "model_name", "prompt_variant", "context_condition")
+
+ERROR_PREFIX = "[ERROR]"
+
+def record_key(record: dict[str, any]) -> tuple:
+    return tuple(record[field] for field in RECORD_KEY_FIELDS)
+
+def is_error_record(record: dict[str, any]) -> bool:
+    return str(record.get("model_answer", "")).startswith(ERROR_PREFIX)
+
+def load_completed_keys(path: str) -> set[tuple]:
+    """
+    Keys of the records already on disk. A trailing line cut off by a crash is ignored,
+    and so are error rows from older runs, so those cells are generated again.
+    """
+    keys = set()
+    if not Path(path).exists():
+        return keys
+
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+                if not is_error_record(record):
+                    keys.add(record_key(record))
+            except (json.JSONDecodeError, KeyError):
+                continue
+    return keys
+
+class ResultWriter:
+    """
+    Appends records to a JSONL file as they arrive, fsyncing every `sync_every`
+    records so at most one batch is lost on a crash.
+    """
+    def __init__(self, path: str, sync_every: int = 32):
+        self.path = path
+        self.sync_every = sync_every
+        self.written = 0
+        self._pending = 0
+
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._truncate_partial_line()
+        self._file = open(path, "a", encoding="utf-8")
+
+    def _truncate_partial_line(self, block_size: int = 65_536) -> None:
+        """
+        Cuts a trailing line left unfinished by a crash, scanning back from the end
+        of the file one block at a time rather than reading it whole.
+        """
+        if not Path(self.path).exists():
+            return
+        with open(self.path, "rb+") as f:
+            end = f.seek(0, os.SEEK_END)
+            if end == 0:
+                return
+            f.seek(end - 1)
+            if f.read(1) == b"\n":
+                return
+            position = end
+            while position > 0:
+                start = max(position - block_size, 0)
+                f.seek(start)
+                newline = f.read(position - start).rfind(b"\n")
+                if newline >= 0:
+                    f.truncate(start + newline + 1)
+                    return
+                position = start
+            f.truncate(0)
+
+    def write(self, record: dict[str, any]) -> None:
+        self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self.written += 1
+        self._pending += 1
+        if self._pending >= self.sync_every:
+            self.sync()
+
+    def sync(self) -> None:
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._pending = 0
+
+    def close(self) -> None:
+        self.sync()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
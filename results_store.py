@@ -0,0 +1,158 @@
+import polars as pl
+from pathlib import Path
+
+KEY_COLUMNS = ["item_index", "model_name", "prompt_variant", "context_condition"]
+CATEGORICAL_COLUMNS = ["model_name", "prompt_variant", "context_condition"]
+RECORD_COLUMNS = [
+    "item_index", "model_name", "prompt_variant", "context_condition", "question", "gold_answer",
+    "context", "documents", "system_prompt", "user_prompt", "model_answer",
+]
+
+def _write(df: pl.DataFrame, path: Path) -> None:
+    df.write_parquet(path, compression="zstd", statistics=True)
+
+def _ids(values: pl.Series, table: pl.DataFrame | None, column: str, id_column: str) -> tuple[pl.Series, pl.DataFrame]:
+    """
+    Looks up (and appends new) values in a lookup table, returning their IDs; nulls
+    get a null ID and no entry.
+    """
+    if table is None:
+        table = pl.DataFrame(schema={id_column: pl.UInt32, column: values.dtype})
+    new = values.drop_nulls().unique(maintain_order=True).to_frame(column).join(table, on=column, how="anti", nulls_equal=True)
+    new = new.with_columns(pl.int_range(pl.len(), dtype=pl.UInt32).alias(id_column) + len(table))
+    table = pl.concat([table, new.select(id_column, column)])
+    ids = values.to_frame(column).join(table, on=column, how="left", nulls_equal=True, maintain_order="left")[id_column]
+    return ids, table
+
+def normalize(df: pl.DataFrame, store_dir: str) -> dict[str, pl.DataFrame]:
+    """
+    Splits generation records into a runs table and lookup tables for items, prompts
+    and documents, extending the lookup tables already in `store_dir`.
+    """
+    store = Path(store_dir)
+    existing = {
+        name: pl.read_parquet(store / f"{name}.parquet") if (store / f"{name}.parquet").exists() else None
+        for name in ("items", "prompts", "documents")
+    }
+
+    items = df.select("item_index", "question", "gold_answer").unique("item_index", keep="first", maintain_order=True)
+    if existing["items"] is not None:
+        items = pl.concat([existing["items"], items.join(existing["items"], on="item_index", how="anti")])
+
+    prompts_key = df.select(
+        pl.struct(pl.col("system_prompt"), pl.col("user_prompt")).alias("prompt")
+    )["prompt"]
+    prompt_table = existing["prompts"]
+    if prompt_table is not None:
+        prompt_table = prompt_table.select("prompt_id", pl.struct("system_prompt", "user_prompt").alias("prompt"))
+    prompt_ids, prompt_table = _ids(prompts_key, prompt_table, "prompt", "prompt_id")
+    prompts = prompt_table.unnest("prompt")
+
+    # Rows without documents (e.g. irrelevant_only on an item with none) must keep their row
+    docs = df.select(pl.int_range(pl.len()).alias("_row"), "documents").explode("documents", empty_as_null=True).unnest("documents")
+    doc_ids, documents = _ids(docs["text"], existing["documents"], "text", "doc_id")
+    # Records from before context packing have no `included` flag on their documents
+    packed = "included" in docs.columns
+    doc_lists = (
+        docs.with_columns(doc_ids.alias("doc_id"))
+        .group_by("_row", maintain_order=True)
+        .agg(
+            pl.col("doc_id").filter(pl.col("text").is_not_null()).alias("doc_ids"),
+            pl.col("label").filter(pl.col("text").is_not_null()).alias("doc_labels"),
+            *([pl.col("included").filter(pl.col("text").is_not_null()).alias("doc_included")] if packed else []),
+        )
+        .sort("_row")
+    )
+
+    extra = [c for c in df.columns if c not in RECORD_COLUMNS]
+    runs = df.select(
+        pl.col("item_index"),
+        *[pl.col(c).cast(pl.Categorical) for c in CATEGORICAL_COLUMNS],
+        prompt_ids.alias("prompt_id"),
+        doc_lists["doc_ids"],
+        doc_lists["doc_labels"].cast(pl.List(pl.Categorical)),
+        *([doc_lists["doc_included"]] if packed else []),
+        pl.col("model_answer"),
+        *extra,
+    )
+    return {"runs": runs, "items": items, "prompts": prompts, "documents": documents}
+
+def write_results(df: pl.DataFrame, store_dir: str, append: bool = False) -> None:
+    """
+    Writes generation records as zstd Parquet with items, prompts and documents in
+    separate lookup tables referenced by ID.
+    """
+    store = Path(store_dir)
+    store.mkdir(parents=True, exist_ok=True)
+    if not append:
+        for name in ("runs", "items", "prompts", "documents"):
+            (store / f"{name}.parquet").unlink(missing_ok=True)
+
+    tables = normalize(df, store_dir)
+    if append and (store / "runs.parquet").exists():
+        tables["runs"] = pl.concat([pl.read_parquet(store / "runs.parquet"), tables["runs"]], how="diagonal_relaxed")
+    for name, table in tables.items():
+        _write(table, store / f"{name}.parquet")
+
+def convert_jsonl(jsonl_path: str, store_dir: str) -> None:
+    # Error rows from older runs are superseded by their retried records
+    write_results(pl.read_ndjson(jsonl_path).filter(~pl.col("model_answer").str.starts_with("[ERROR]")), store_dir)
+
+def scan_results(store_dir: str) -> pl.LazyFrame:
+    """
+    Lazily rebuilds the denormalised frame that prompting_script writes as JSONL.
+    """
+    store = Path(store_dir)
+    runs = pl.scan_parquet(store / "runs.parquet").with_row_index("_row")
+    items = pl.scan_parquet(store / "items.parquet")
+    prompts = pl.scan_parquet(store / "prompts.parquet")
+    documents = pl.scan_parquet(store / "documents.parquet")
+
+    packed = "doc_included" in runs.collect_schema().names()
+    doc_columns = ["doc_ids", "doc_labels"] + (["doc_included"] if packed else [])
+    # The context holds only the documents that fit the packing budget
+    in_context = pl.col("text").is_not_null() & (pl.col("doc_included").fill_null(True) if packed else True)
+    docs = (
+        runs.select("_row", *doc_columns).with_columns(pl.col("doc_labels").cast(pl.List(pl.String)))
+        .explode(doc_columns, empty_as_null=True)
+        .join(documents, left_on="doc_ids", right_on="doc_id", how="left")
+        .group_by("_row")
+        .agg(
+            pl.struct(
+                pl.col("text"), pl.col("doc_labels").alias("label"),
+                *([pl.col("doc_included").alias("included")] if packed else []),
+            ).filter(pl.col("text").is_not_null()).alias("documents"),
+            pl.col("text").filter(in_context).str.join("\n\n").alias("context"),
+        )
+    )
+
+    frame = (
+        runs.join(items, on="item_index", how="left")
+        .join(prompts, on="prompt_id", how="left")
+        .join(docs, on="_row", how="left")
+        .sort("_row")
+        .with_columns(pl.col(c).cast(pl.String) for c in CATEGORICAL_COLUMNS)
+    )
+    extra = [c for c in runs.collect_schema().names() if c not in RECORD_COLUMNS + ["_row", "prompt_id", "doc_ids", "doc_labels", "doc_included"]]
+    return frame.select(RECORD_COLUMNS + extra)
+
+def write_metric_scores(df: pl.DataFrame, path: str) -> None:
+    """
+    Stores only the record keys, reference answers and metric columns; the rest of
+    the frame is rebuilt from the results store on read.
+    """
+    drop = [c for c in RECORD_COLUMNS if c not in KEY_COLUMNS]
+    _write(df.drop(drop, strict=False).with_columns(pl.col(c).cast(pl.Categorical) for c in CATEGORICAL_COLUMNS), Path(path))
+
+def scan_metric_scores(store_dir: str, path: str) -> pl.LazyFrame:
+    """
+    Rebuilds the frame score_responses used to write to metric_scores.json. `path`
+    may also be a directory of parts written by score_responses.score_stream.
+    """
+    if Path(path).is_dir():
+        path = str(Path(path) / "part-*.parquet")
+    scores = pl.scan_parquet(path).with_columns(pl.col(c).cast(pl.String) for c in CATEGORICAL_COLUMNS)
+    return scan_results(store_dir).join(scores, on=KEY_COLUMNS, how="inner", maintain_order="right")
+
+if __name__ == "__main__":
+    convert_jsonl("results/rag_results.jsonl", "results/store")
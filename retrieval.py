@@ -0,0 +1,286 @@
+import json
+import re
+import zlib
+from pathlib import Path
+
+import numpy as np
+import polars as pl
+
+from dataset_loader import DocumentStore, iter_items
+
+_WORD_PATTERN = re.compile(r"\w+")
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return (vectors / np.maximum(norms, 1e-12)).astype(np.float32)
+
+class HashingEmbedder:
+    """
+    Feature-hashed bag of words and word bigrams. Needs no model download, so an index
+    can be built offline; lexical rather than semantic retrieval.
+    """
+    def __init__(self, dim: int = 384):
+        self.name = "hashing"
+        self.dim = dim
+
+    def _features(self, text: str) -> list[str]:
+        words = _WORD_PATTERN.findall((text or "").lower())
+        return words + [a + " " + b for a, b in zip(words, words[1:])]
+
+    def embed(self, texts: list[str]) -> np.ndarray:
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            # crc32 rather than hash(): the buckets must not change between processes
+            hashes = np.array([zlib.crc32(f.encode("utf-8")) for f in self._features(text)], dtype=np.uint64)
+            if len(hashes):
+                signs = np.where(hashes & (1 << 31), -1.0, 1.0).astype(np.float32)
+                np.add.at(vectors[row], (hashes % self.dim).astype(np.int64), signs)
+        return _normalize(vectors)
+
+class TransformerEmbedder:
+    """
+    Mean-pooled Hugging Face encoder on CPU; sentence-transformers checkpoints such
+    as all-MiniLM-L6-v2 load as-is.
+    """
+    def __init__(self, model_name: str, max_length: int = 256, device: str = "cpu"):
+        from transformers import AutoModel, AutoTokenizer
+
+        self.name = model_name
+        self.max_length = max_length
+        self.device = device
+        self.tokenizer = AutoTokenizer.from_pretrained(model_name)
+        self.model = AutoModel.from_pretrained(model_name).to(device).eval()
+        self.dim = self.model.config.hidden_size
+
+    def embed(self, texts: list[str]) -> np.ndarray:
+        import torch
+
+        with torch.inference_mode():
+            batch = self.tokenizer(
+                texts, padding=True, truncation=True, max_length=self.max_length, return_tensors="pt"
+            ).to(self.device)
+            hidden = self.model(**batch).last_hidden_state
+            mask = batch["attention_mask"].unsqueeze(-1).to(hidden.dtype)
+            vectors = (hidden * mask).sum(dim=1) / mask.sum(dim=1).clamp(min=1e-9)
+        return _normalize(vectors.float().cpu().numpy())
+
+def get_embedder(name: str) -> HashingEmbedder | TransformerEmbedder:
+    return HashingEmbedder() if name == "hashing" else TransformerEmbedder(name)
+
+def kmeans(
+    vectors: np.ndarray,
+    n_lists: int,
+    n_iter: int = 20,
+    sample_size: int = 256,
+    block_size: int = 65_536,
+    seed: int = 0
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Spherical k-means for the IVF coarse quantizer, trained on at most `sample_size`
+    vectors per list. Every vector is then assigned to its closest centroid, one
+    block of rows at a time so a memory-mapped matrix is never loaded whole.
+
+    Returns:
+        centroids (n_lists, dim), list of every vector (n,)
+    """
+    rng = np.random.default_rng(seed)
+    n = len(vectors)
+    sample = np.asarray(vectors[np.sort(rng.choice(n, min(n, n_lists * sample_size), replace=False))])
+    centroids = sample[rng.choice(len(sample), n_lists, replace=False)].copy()
+    for _ in range(n_iter):
+        labels = np.argmax(sample @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, sample)
+        counts = np.bincount(labels, minlength=n_lists)
+        # Empty lists restart from a random training vector
+        empty = counts == 0
+        sums[empty] = sample[rng.choice(len(sample), int(empty.sum()))]
+        centroids = _normalize(sums)
+
+    assignments = np.concatenate([
+        np.argmax(np.asarray(vectors[start:start + block_size]) @ centroids.T, axis=1)
+        for start in range(0, n, block_size)
+    ])
+    return centroids, assignments
+
+def _merge_top_k(
+    best_scores: np.ndarray,
+    best_ids: np.ndarray,
+    scores: np.ndarray,
+    ids: np.ndarray,
+    k: int
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Keeps the k best of the current top-k (q, k) and new candidates (q, m).
+    """
+    all_scores = np.concatenate([best_scores, scores], axis=1)
+    all_ids = np.concatenate([best_ids, np.broadcast_to(ids, scores.shape)], axis=1)
+    top = np.argpartition(-all_scores, k - 1, axis=1)[:, :k]
+    return np.take_along_axis(all_scores, top, axis=1), np.take_along_axis(all_ids, top, axis=1)
+
+class VectorIndex:
+    """
+    Unit-length float32 document vectors in one contiguous, memory-mapped .npy matrix.
+
+    With an IVF quantizer the rows are stored grouped by list, so each probed list is
+    a contiguous slice; `ids` maps rows back to document IDs. Scores are inner
+    products, i.e. cosine similarity.
+    """
+    def __init__(self, index_dir: str):
+        index = Path(index_dir)
+        with open(index / "meta.json", "r", encoding="utf-8") as f:
+            self.meta = json.load(f)
+        self.vectors = np.load(index / "vectors.npy", mmap_mode="r")
+        self.ids = np.load(index / "ids.npy")
+        self.texts = pl.read_parquet(index / "documents.parquet")["text"].to_list()
+        self.centroids = np.load(index / "centroids.npy") if self.meta["n_lists"] else None
+        self.offsets = np.load(index / "offsets.npy") if self.meta["n_lists"] else None
+
+    def __len__(self) -> int:
+        return len(self.vectors)
+
+    @staticmethod
+    def build(
+        texts: list[str],
+        embedder: HashingEmbedder | TransformerEmbedder,
+        index_dir: str,
+        n_lists: int | None = None,
+        batch_size: int = 256
+    ) -> "VectorIndex":
+        """
+        Embeds `texts` once into index_dir/vectors.npy, batch by batch straight into
+        the memory map, and with `n_lists` trains an IVF quantizer and regroups the
+        rows by list.
+        """
+        index = Path(index_dir)
+        index.mkdir(parents=True, exist_ok=True)
+        pl.DataFrame({"text": texts}).write_parquet(index / "documents.parquet", compression="zstd")
+
+        path = index / ("vectors.unsorted.npy" if n_lists else "vectors.npy")
+        vectors = np.lib.format.open_memmap(path, mode="w+", dtype=np.float32, shape=(len(texts), embedder.dim))
+        for start in range(0, len(texts), batch_size):
+            vectors[start:start + batch_size] = embedder.embed(texts[start:start + batch_size])
+        vectors.flush()
+
+        ids = np.arange(len(texts), dtype=np.int64)
+        n_lists = min(n_lists or 0, len(texts))
+        if n_lists:
+            centroids, assignments = kmeans(vectors, n_lists)
+            ids = np.argsort(assignments, kind="stable")
+            offsets = np.searchsorted(assignments[ids], np.arange(n_lists + 1))
+            grouped = np.lib.format.open_memmap(index / "vectors.npy", mode="w+", dtype=np.float32, shape=vectors.shape)
+            for start in range(0, len(ids), 65_536):
+                grouped[start:start + 65_536] = vectors[ids[start:start + 65_536]]
+            grouped.flush()
+            del vectors, grouped
+            path.unlink()
+            np.save(index / "centroids.npy", centroids)
+            np.save(index / "offsets.npy", offsets)
+        np.save(index / "ids.npy", ids)
+
+        with open(index / "meta.json", "w", encoding="utf-8") as f:
+            json.dump({"embedder": embedder.name, "dim": embedder.dim, "count": len(texts), "n_lists": n_lists}, f)
+        return VectorIndex(index_dir)
+
+    def search(
+        self,
+        queries: np.ndarray,
+        k: int,
+        n_probe: int | None = None,
+        block_size: int = 65_536
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Top-k documents for each query row, best first. Exact search scores the
+        queries against blocks of rows with one matrix product per block; with an IVF
+        quantizer and `n_probe`, each list is scored once against the queries that
+        probe it.
+
+        Returns:
+            document IDs (q, k), scores (q, k); unfilled slots score -inf
+        """
+        k = min(k, len(self))
+        # Placeholders that any real candidate beats; only left over if the probed lists hold fewer than k rows
+        best_scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        best_rows = np.zeros((len(queries), k), dtype=np.int64)
+
+        if self.centroids is None or n_probe is None:
+            for start in range(0, len(self), block_size):
+                block = np.asarray(self.vectors[start:start + block_size])
+                best_scores, best_rows = _merge_top_k(
+                    best_scores, best_rows, queries @ block.T, np.arange(start, start + len(block)), k
+                )
+        else:
+            n_probe = min(n_probe, len(self.centroids))
+            probes = np.argpartition(-(queries @ self.centroids.T), n_probe - 1, axis=1)[:, :n_probe]
+            for list_id in np.unique(probes):
+                start, end = self.offsets[list_id], self.offsets[list_id + 1]
+                if start == end:
+                    continue
+                rows = np.flatnonzero((probes == list_id).any(axis=1))
+                scores, merged = _merge_top_k(
+                    best_scores[rows], best_rows[rows], queries[rows] @ np.asarray(self.vectors[start:end]).T, np.arange(start, end), k
+                )
+                best_scores[rows], best_rows[rows] = scores, merged
+
+        order = np.argsort(-best_scores, axis=1)
+        return self.ids[np.take_along_axis(best_rows, order, axis=1)], np.take_along_axis(best_scores, order, axis=1)
+
+class Retriever:
+    """
+    Top-k documents from a VectorIndex for batches of questions, embedded with the
+    embedder the index was built with.
+    """
+    def __init__(self, index_dir: str, k: int = 5, n_probe: int | None = None, batch_size: int = 256):
+        self.index = VectorIndex(index_dir)
+        self.embedder = get_embedder(self.index.meta["embedder"])
+        self.k = k
+        self.n_probe = n_probe
+        self.batch_size = batch_size
+
+    def retrieve(self, questions: list[str]) -> list[list[str]]:
+        results = []
+        for start in range(0, len(questions), self.batch_size):
+            ids, scores = self.index.search(self.embedder.embed(questions[start:start + self.batch_size]), self.k, self.n_probe)
+            results += [
+                [self.index.texts[i] for i, score in zip(id_row, score_row) if score > -np.inf]
+                for id_row, score_row in zip(ids.tolist(), scores.tolist())
+            ]
+        return results
+
+    def attach(self, items: list[tuple[int, dict[str, any]]]) -> None:
+        """
+        Stores each item's retrieved documents under 'retrieved_docs', ranked, for the
+        'retrieved' context condition of prompting_script.build_context.
+        """
+        for (_, item), docs in zip(items, self.retrieve([item["question"] for _, item in items])):
+            item["retrieved_docs"] = docs
+
+def document_pool(dataset_path: str, corpus_path: str | None = None) -> list[str]:
+    """
+    Every distinct document of the dataset, plus the 'text' column of an optional
+    JSONL or Parquet corpus of extra distractors.
+    """
+    store = DocumentStore()
+    # Streaming the items interns their documents
+    for _ in iter_items(dataset_path, store):
+        pass
+    if corpus_path is not None:
+        corpus = pl.scan_parquet(corpus_path) if corpus_path.endswith(".parquet") else pl.scan_ndjson(corpus_path)
+        for batch in corpus.select("text").collect_batches(chunk_size=10_000):
+            for text in batch["text"].drop_nulls():
+                store.intern(text)
+    return [store.get(doc_id) for doc_id in range(len(store))]
+
+def main(
+    dataset_path: str = "data/input_data.json",
+    corpus_path: str | None = None,
+    index_dir: str = "results/retrieval_index",
+    embedder: str = "sentence-transformers/all-MiniLM-L6-v2",
+    n_lists: int | None = None
+):
+    texts = document_pool(dataset_path, corpus_path)
+    index = VectorIndex.build(texts, get_embedder(embedder), index_dir, n_lists)
+    print(f"Indexed {len(index)} documents ({index.meta['dim']}-d, {n_lists or 'no'} IVF lists) in {index_dir}")
+
+if __name__ == "__main__":
+    main()
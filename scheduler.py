@@ -0,0 +1,71 @@
+from collections import Counter, defaultdict
+
+from backends import OllamaBackend, get_backend
+
+Cell = tuple[tuple[int, dict[str, any]], str, str, dict[str, str]]
+
+def prompt_family(prompt_combo: dict[str, str]) -> str:
+    """
+    'langchain_base', 'langchain_system' and 'langchain_user' all open with the
+    langchain system prompt, so they share a prompt prefix.
+    """
+    return prompt_combo["name"].rsplit("_", 1)[0]
+
+def prefix_key(cell: Cell) -> tuple:
+    (idx, _), condition, model, prompt_combo = cell
+    return (prompt_family(prompt_combo), idx, condition)
+
+def schedule_by_model(cells: list[Cell], models: list[str] | None = None) -> list[tuple[str, list[Cell]]]:
+    """
+    Groups cells by model (in `models` order when given), then orders each batch by
+    shared prefix (system prompt + context) so consecutive requests can reuse the
+    backend's prompt cache.
+    """
+    batches = defaultdict(list)
+    for cell in cells:
+        batches[cell[2]].append(cell)
+
+    order = list(models or []) + [model for model in batches if model not in (models or [])]
+    return [
+        (model, sorted(batches[model], key=prefix_key))
+        for model in order if model in batches
+    ]
+
+def count_model_loads(models_in_order: list[str]) -> Counter:
+    """
+    Number of times each model has to be (re)loaded when requests arrive in this order
+    and the backend keeps one model resident.
+    """
+    loads = Counter()
+    previous = None
+    for model in models_in_order:
+        if model != previous:
+            loads[model] += 1
+        previous = model
+    return loads
+
+def is_local_model(model_name: str) -> bool:
+    return isinstance(get_backend(model_name), OllamaBackend)
+
+def warm_model(model_name: str, keep_alive: str | int = "30m") -> float:
+    """
+    Loads the model into the Ollama server and keeps it resident for `keep_alive`.
+
+    Returns:
+        load time in seconds as reported by the server
+    """
+    return get_backend(model_name).warm(model_name, keep_alive)
+
+def unload_model(model_name: str) -> None:
+    get_backend(model_name).unload(model_name)
+
+def avoided_load_time(naive_order: list[str], scheduled_order: list[str], load_times: dict[str, float]) -> float:
+    """
+    Estimated seconds of model loading saved by running `scheduled_order` instead of `naive_order`.
+    """
+    naive_loads = count_model_loads(naive_order)
+    scheduled_loads = count_model_loads(scheduled_order)
+    return sum(
+        (naive_loads[model] - scheduled_loads[model]) * load_times.get(model, 0.0)
+        for model in naive_loads
+    )
@@ -0,0 +1,58 @@
+import hashlib
+import json
+import sqlite3
+from pathlib import Path
+
+class ScoreCache:
+    """
+    On-disk metric scores keyed by (metric name, metric version, hash of references
+    and candidate), so rescoring only pays for pairs that have not been seen before.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(path)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS scores ("
+            "metric TEXT NOT NULL, "
+            "version TEXT NOT NULL, "
+            "key TEXT NOT NULL, "
+            "value TEXT NOT NULL, "
+            "PRIMARY KEY (metric, version, key))"
+        )
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(references: list[str] | str | None, candidate: str | None) -> str:
+        payload = json.dumps([references, candidate], ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get_many(self, metric: str, version: str, keys: list[str]) -> dict[str, dict[str, float]]:
+        found = {}
+        for start in range(0, len(keys), 500):
+            batch = keys[start:start + 500]
+            rows = self._conn.execute(
+                f"SELECT key, value FROM scores WHERE metric = ? AND version = ? AND key IN ({','.join('?' * len(batch))})",
+                (metric, version, *batch),
+            ).fetchall()
+            found.update((key, json.loads(value)) for key, value in rows)
+        self.hits += len(found)
+        self.misses += len(keys) - len(found)
+        return found
+
+    def put_many(self, metric: str, version: str, values: dict[str, dict[str, float]]) -> None:
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO scores (metric, version, key, value) VALUES (?, ?, ?, ?)",
+            [(metric, version, key, json.dumps(value)) for key, value in values.items()],
+        )
+        self._conn.commit()
+
+    def stats(self) -> dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses}
+
+    def close(self) -> None:
+        self._conn.close()
@@ -1,33 +1,242 @@
 import polars as pl
-from metrics import Metric, RougeL, BLEU, BertScore
+from metrics import Metric, get_metric
+from results_store import write_metric_scores
+from score_cache import ScoreCache
 import json
+import time
+import multiprocessing
+from collections import defaultdict
+from contextlib import nullcontext
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 from tqdm import tqdm
 
-def main():
-    RESULTS_PATH = "results/rag_results.jsonl"
-    METRICS_PATH = "results/metric_scores.json"
-    metrics: list[Metric] = [RougeL(), BLEU(), BertScore()]
-    
-    df: pl.DataFrame = pl.read_ndjson(RESULTS_PATH)
-    
-    idk = ["I don't know", "The retrieved context does not contain information to answer the question"]
-    df = df.with_columns(
+def _score_chunk(metric: Metric, references: pl.Series, candidates: pl.Series) -> dict[str, list[float]]:
+    # The executor already spreads chunks over processes, don't nest another pool
+    if hasattr(metric, "n_jobs"):
+        metric.n_jobs = 1
+    return metric.score_many(references, candidates)
+
+def metric_pool(n_jobs: int | None = None) -> ProcessPoolExecutor:
+    """
+    Process pool for chunkable metrics. Workers are spawned rather than forked: by the
+    time they start, BertScore's thread, torch and polars already run threads in this
+    process, and a forked child can inherit one of their locks held.
+    """
+    return ProcessPoolExecutor(n_jobs, mp_context=multiprocessing.get_context("spawn"))
+
+def run_metrics(
+    metrics: list[Metric],
+    references: pl.Series,
+    candidates: pl.Series,
+    n_jobs: int | None = None,
+    chunk_size: int = 10_000,
+    cache: ScoreCache | None = None,
+    reference_columns: dict[str, pl.Series] | None = None,
+    pool: ProcessPoolExecutor | None = None
+) -> tuple[list[pl.DataFrame], dict[str, dict[str, float]]]:
+    """
+    Runs every metric concurrently. Chunkable metrics are split into row chunks over a
+    process pool, the others (e.g. BertScore) run whole on a thread of this process so
+    their model stays resident.
+
+    Only unique (references, candidate) pairs are scored, and with a cache only the
+    pairs it has not seen for that metric version. Scores are joined back to every row.
+
+    A metric is scored against `references` unless its reference_column is one of
+    `reference_columns` (e.g. Faithfulness against each row's documents).
+
+    Pass a metric_pool as `pool` to reuse it across calls; otherwise one is created
+    for this call.
+
+    Returns:
+        one DataFrame of columns per metric, and per-metric wall time and rows/sec
+    """
+    n_rows = len(candidates)
+    reference_columns = {"reference_answers": references} | (reference_columns or {})
+    column_of = {
+        metric.name: metric.reference_column if metric.reference_column in reference_columns else "reference_answers"
+        for metric in metrics
+    }
+    # Per reference column in use: the key of every row and the first row of each key
+    keyed: dict[str, tuple[list[str], dict[str, int]]] = {}
+    for column in set(column_of.values()):
+        row_keys = [ScoreCache.make_key(r, c) for r, c in zip(reference_columns[column].to_list(), candidates.to_list())]
+        first_index = {}
+        for i, key in enumerate(row_keys):
+            first_index.setdefault(key, i)
+        keyed[column] = (row_keys, first_index)
+
+    start = time.perf_counter()
+    finished: dict[str, float] = {}
+    known: dict[str, dict[str, dict[str, float]]] = {}
+    todo: dict[str, list[str]] = {}
+    parts: dict[str, list[dict[str, list[float]]]] = {}
+
+    with nullcontext(pool) if pool is not None else metric_pool(n_jobs) as pool, ThreadPoolExecutor() as threads:
+        futures = {}
+        for metric in sorted(metrics, key=lambda m: m.chunkable):
+            _, first_index = keyed[column_of[metric.name]]
+            known[metric.name] = cache.get_many(metric.name, metric.version, list(first_index)) if cache else {}
+            todo[metric.name] = [key for key in first_index if key not in known[metric.name]]
+            indices = [first_index[key] for key in todo[metric.name]]
+            todo_refs, todo_cands = reference_columns[column_of[metric.name]].gather(indices), candidates.gather(indices)
+
+            if not indices:
+                parts[metric.name] = []
+                finished[metric.name] = time.perf_counter()
+            elif metric.chunkable:
+                offsets = range(0, len(indices), chunk_size)
+                parts[metric.name] = [None] * len(offsets)
+                for i, offset in enumerate(offsets):
+                    future = pool.submit(
+                        _score_chunk, metric,
+                        todo_refs.slice(offset, chunk_size), todo_cands.slice(offset, chunk_size)
+                    )
+                    futures[future] = (metric.name, i)
+            else:
+                parts[metric.name] = [None]
+                futures[threads.submit(metric.score_many, todo_refs, todo_cands)] = (metric.name, 0)
+
+        for future in tqdm(as_completed(futures), total=len(futures)):
+            name, i = futures[future]
+            parts[name][i] = future.result()
+            finished[name] = time.perf_counter()
+
+    columns, timings = [], {}
+    for metric in metrics:
+        row_keys, _ = keyed[column_of[metric.name]]
+        merged = defaultdict(list)
+        for part in parts[metric.name]:
+            for column, values in part.items():
+                merged[column] += values
+        scored = {
+            key: {column: values[i] for column, values in merged.items()}
+            for i, key in enumerate(todo[metric.name])
+        }
+        if cache is not None and scored:
+            cache.put_many(metric.name, metric.version, scored)
+
+        values = known[metric.name] | scored
+        names = next(iter(values.values())).keys() if values else []
+        columns.append(pl.DataFrame({column: [values[key][column] for key in row_keys] for column in names}))
+
+        wall = finished[metric.name] - start
+        timings[metric.name] = {
+            "wall_time_s": wall,
+            "rows_per_s": n_rows / wall if wall > 0 else float("inf"),
+            "scored_rows": len(scored),
+        }
+        print(f"{metric.name}: {wall:.2f}s ({timings[metric.name]['rows_per_s']:.0f} rows/s, {len(scored)} scored)")
+
+    return columns, timings
+
+IDK_ANSWERS = ["I don't know", "The retrieved context does not contain information to answer the question"]
+
+def with_reference_answers(df: pl.DataFrame | pl.LazyFrame) -> pl.DataFrame | pl.LazyFrame:
+    return df.with_columns(
         pl.when(
             pl.col("context_condition") == "irrelevant_only"
-        ).then(idk).otherwise(pl.concat_list(pl.col("gold_answer"))).alias("reference_answers")
+        ).then(IDK_ANSWERS).otherwise(pl.concat_list(pl.col("gold_answer"))).alias("reference_answers")
     )
 
+def _reference_columns(df: pl.DataFrame, metrics: list[Metric]) -> dict[str, pl.Series]:
+    missing = [m.name for m in metrics if m.reference_column not in df.columns]
+    if missing:
+        raise ValueError(f"Metrics {missing} need columns missing from the results")
+    return {m.reference_column: df[m.reference_column] for m in metrics}
+
+def scan_results(path: str) -> pl.LazyFrame:
+    if path.endswith(".parquet"):
+        return pl.scan_parquet(path)
+    return pl.scan_ndjson(path)
+
+def score_stream(
+    results_path: str,
+    output_dir: str,
+    metrics: list[Metric],
+    batch_size: int = 50_000,
+    cache: ScoreCache | None = None
+) -> dict[str, dict[str, float]]:
+    """
+    Scores the results in fixed-size row batches, writing each scored batch as its own
+    Parquet part under `output_dir`, so memory use does not grow with the input. One
+    process pool serves every batch.
+
+    Returns:
+        per-metric wall time and rows/sec summed over all batches
+    """
+    output = Path(output_dir)
+    output.mkdir(parents=True, exist_ok=True)
+    for part in output.glob("part-*.parquet"):
+        part.unlink()
+
+    totals = defaultdict(lambda: {"wall_time_s": 0.0, "rows": 0})
+    batches = with_reference_answers(scan_results(results_path)).collect_batches(chunk_size=batch_size)
+    with metric_pool() as pool:
+        for i, batch in enumerate(batches):
+            metric_columns, timings = run_metrics(
+                metrics, batch["reference_answers"], batch["model_answer"], cache=cache,
+                reference_columns=_reference_columns(batch, metrics), pool=pool
+            )
+            write_metric_scores(pl.concat([batch] + metric_columns, how="horizontal"), output / f"part-{i:05d}.parquet")
+            for name, timing in timings.items():
+                totals[name]["wall_time_s"] += timing["wall_time_s"]
+                totals[name]["rows"] += len(batch)
+
+    return {
+        name: {"wall_time_s": t["wall_time_s"], "rows_per_s": t["rows"] / t["wall_time_s"] if t["wall_time_s"] > 0 else float("inf")}
+        for name, t in totals.items()
+    }
+
+DEFAULT_METRICS = ["rougeL", "bleu", "faithfulness", "bert_score"]
+
+def main(
+    streaming: bool = False,
+    batch_size: int = 50_000,
+    metric_names: list[str] | None = None,
+    results_path: str = "results/rag_results.jsonl",
+    output_path: str | None = None,
+    timings_path: str = "results/metric_timings.json"
+):
+    """
+    Scores `results_path` into `output_path`: a Parquet file, or with `streaming` a
+    directory of Parquet parts (default results/metric_scores[.parquet]).
+    """
+    RESULTS_PATH = results_path
+    METRICS_PATH = output_path or "results/metric_scores.parquet"
+    METRICS_DIR = output_path or "results/metric_scores"
+    TIMINGS_PATH = timings_path
+    BERT_CACHE_DIR = "results/bert_score_cache"
+    SCORE_CACHE_PATH = "results/score_cache.sqlite"
+    METRIC_OPTIONS = {"bert_score": {"cache_dir": BERT_CACHE_DIR}}
+    metrics: list[Metric] = [get_metric(name, **METRIC_OPTIONS.get(name, {})) for name in metric_names or DEFAULT_METRICS]
+    cache = ScoreCache(SCORE_CACHE_PATH)
+
+    if streaming:
+        timings = score_stream(RESULTS_PATH, METRICS_DIR, metrics, batch_size, cache=cache)
+        print(f"Score cache: {cache.stats()}")
+        cache.close()
+        with open(TIMINGS_PATH, "w", encoding="utf-8") as f:
+            json.dump(timings, f, indent=2)
+        return
+    
+    df: pl.DataFrame = with_reference_answers(pl.read_ndjson(RESULTS_PATH))
+
     #results = {"item_index": df["item_index"].to_list()}
-    metric_columns = []
-    for metric in tqdm(metrics):
-        #results |= metric.score_many(df["reference_answers"], df["model_answer"])
-        metric_columns.append(pl.from_dict(metric.score_many(df["reference_answers"], df["model_answer"])))
+    metric_columns, timings = run_metrics(
+        metrics, df["reference_answers"], df["model_answer"], cache=cache, reference_columns=_reference_columns(df, metrics)
+    )
+    print(f"Score cache: {cache.stats()}")
+    cache.close()
+    with open(TIMINGS_PATH, "w", encoding="utf-8") as f:
+        json.dump(timings, f, indent=2)
     
     df = pl.concat([df] + metric_columns, how="horizontal")
     
     #print("results:", results)
-    with open(METRICS_PATH, "w", encoding="utf-8") as f:
-        f.write(df.write_json())
+    # Prompts, contexts and documents live in the results store, see results_store.scan_metric_scores
+    write_metric_scores(df, METRICS_PATH)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,126 @@
+import argparse
+import hashlib
+import json
+import random
+from collections import Counter
+from itertools import product
+from pathlib import Path
+
+from result_writer import is_error_record, record_key
+
+def _digest(*parts) -> int:
+    payload = "|".join(str(part) for part in parts)
+    return int.from_bytes(hashlib.sha256(payload.encode("utf-8")).digest()[:8], "big")
+
+def cell_rng(seed: int, item_index: int, condition: str) -> random.Random:
+    """
+    RNG for one (item, condition): the shuffled 'mixed' context is the same for every
+    model and prompt variant, on every machine, whatever order the cells run in.
+    """
+    return random.Random(_digest(seed, item_index, condition))
+
+def parse_shard(value: str) -> tuple[int, int]:
+    """
+    'i/N' -> (i, N) with 0 <= i < N.
+    """
+    index, _, count = value.partition("/")
+    try:
+        index, count = int(index), int(count)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Expected a shard as i/N, got {value!r}")
+    if not 0 <= index < count:
+        raise argparse.ArgumentTypeError(f"Shard index must be in [0, {count}), got {index}")
+    return index, count
+
+def shard_of(key: tuple, n_shards: int) -> int:
+    return _digest(*key) % n_shards
+
+def in_shard(key: tuple, shard: tuple[int, int] | None) -> bool:
+    return shard is None or shard_of(key, shard[1]) == shard[0]
+
+def shard_path(output_path: str, shard: tuple[int, int] | None) -> str:
+    """
+    results/rag_results.jsonl -> results/rag_results.shard-1-of-4.jsonl
+    """
+    if shard is None:
+        return output_path
+    path = Path(output_path)
+    return str(path.with_name(f"{path.stem}.shard-{shard[0]}-of-{shard[1]}{path.suffix}"))
+
+def grid_keys(n_items: int, models: list[str], prompt_variants: list[str], conditions: list[str]) -> set[tuple]:
+    return {
+        (idx, model, variant, condition)
+        for idx, model, variant, condition in product(range(n_items), models, prompt_variants, conditions)
+    }
+
+def merge_shards(output_path: str, n_shards: int, expected: set[tuple]) -> dict[str, int]:
+    """
+    Concatenates the shard files of `output_path` into it after checking that every
+    record sits in the shard its key hashes to, no cell appears twice and every
+    expected cell is present. Raises ValueError (writing nothing) if a check fails.
+    """
+    records, problems = [], []
+    for index in range(n_shards):
+        path = shard_path(output_path, (index, n_shards))
+        if not Path(path).exists():
+            problems.append(f"missing shard file {path}")
+            continue
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if is_error_record(record):
+                    continue
+                if shard_of(record_key(record), n_shards) != index:
+                    problems.append(f"{record_key(record)} is in shard {index} but belongs to shard {shard_of(record_key(record), n_shards)}")
+                records.append(record)
+
+    counts = Counter(record_key(record) for record in records)
+    duplicates = [key for key, count in counts.items() if count > 1]
+    missing = expected - counts.keys()
+    unexpected = counts.keys() - expected
+    problems += [f"{len(duplicates)} cells appear more than once, e.g. {duplicates[0]}"] if duplicates else []
+    problems += [f"{len(missing)} cells are missing, e.g. {min(missing)}"] if missing else []
+    problems += [f"{len(unexpected)} cells are not in the grid, e.g. {min(unexpected)}"] if unexpected else []
+    if problems:
+        raise ValueError("Cannot merge shards:\n" + "\n".join(problems))
+
+    Path(output_path).parent.mkdir(parents=True, exist_ok=True)
+    with open(output_path, "w", encoding="utf-8") as f:
+        for record in sorted(records, key=record_key):
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    return {"records": len(records), "shards": n_shards}
+
+def main(
+    n_shards: int,
+    models: list[str] | None = None,
+    prompt_variants: list[str] | None = None,
+    dataset_path: str = "data/input_data.json",
+    output_path: str = "results/rag_results.jsonl",
+    conditions: list[str] | None = None
+):
+    """
+    Merges the shards of a run over the same grid the shards were started with.
+    """
+    from prompting_script import MODELS, load_dataset, select_combos, select_conditions
+    from results_store import convert_jsonl
+
+    DATASET_PATH = dataset_path
+    OUTPUT_PATH = output_path
+    STORE_DIR = "results/store"
+
+    expected = grid_keys(
+        len(load_dataset(DATASET_PATH)), models or MODELS, [combo["name"] for combo in select_combos(prompt_variants)], select_conditions(conditions)
+    )
+    summary = merge_shards(OUTPUT_PATH, n_shards, expected)
+    print(f"Merged {summary['records']} records from {n_shards} shards into {OUTPUT_PATH}")
+    convert_jsonl(OUTPUT_PATH, STORE_DIR)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Merge the outputs of a sharded run")
+    parser.add_argument("n_shards", type=int)
+    parser.add_argument("--conditions", nargs="+", default=None, help="context conditions the shards ran")
+    args = parser.parse_args()
+    main(args.n_shards, conditions=args.conditions)
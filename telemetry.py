@@ -0,0 +1,64 @@
+import polars as pl
+
+from results_store import scan_results
+
+def _rate(count: str, duration: str) -> pl.Expr:
+    # Ollama durations are in nanoseconds; backends that do not report them give null,
+    # so only calls with both a count and a duration are counted
+    reported = pl.col(count).is_not_null() & pl.col(duration).is_not_null()
+    seconds = pl.col(duration).filter(reported).sum() / 1e9
+    return pl.when(seconds > 0).then(pl.col(count).filter(reported).sum() / seconds)
+
+def summarize_telemetry(results: pl.LazyFrame, by: tuple[str, ...] = ("model_name", "prompt_variant")) -> pl.DataFrame:
+    """
+    Throughput and load overhead per group, from the telemetry stored on each record.
+    Cached answers and errored calls are left out, since they did not hit the model.
+
+    Streams stopped early at the answer have no server counters; their output rate is
+    timed on the client instead, and client_timed_share is the fraction of such calls.
+    """
+    by = list(by)
+    calls = (
+        results.filter(pl.col("telemetry").is_not_null())
+        .select(*by, "telemetry")
+        .unnest("telemetry")
+        .filter(~pl.col("cached"))
+    )
+    if "client_timed" not in calls.collect_schema().names():
+        # Records from before stopped streams were timed on the client
+        calls = calls.with_columns(pl.lit(False).alias("client_timed"))
+    # Client-timed calls know their total but not the load time
+    with_load = pl.col("load_duration").is_not_null() & pl.col("total_duration").is_not_null()
+    return (
+        calls.group_by(by)
+        .agg(
+            pl.len().alias("calls"),
+            pl.col("prompt_eval_count").mean().alias("mean_prompt_tokens"),
+            pl.col("eval_count").mean().alias("mean_output_tokens"),
+            _rate("prompt_eval_count", "prompt_eval_duration").alias("prompt_tokens_per_s"),
+            _rate("eval_count", "eval_duration").alias("output_tokens_per_s"),
+            (pl.col("load_duration").sum() / 1e9).alias("load_time_s"),
+            pl.when(pl.col("total_duration").filter(with_load).sum() > 0)
+            .then(pl.col("load_duration").filter(with_load).sum() / pl.col("total_duration").filter(with_load).sum())
+            .alias("load_share"),
+            pl.col("wall_time_s").median().alias("p50_wall_time_s"),
+            pl.col("wall_time_s").quantile(0.95).alias("p95_wall_time_s"),
+            pl.col("ttft_s").median().alias("p50_ttft_s"),
+            pl.col("client_timed").fill_null(False).mean().alias("client_timed_share"),
+        )
+        .sort(by)
+        .collect()
+    )
+
+def main(store_dir: str = "results/store"):
+    STORE_DIR = store_dir
+    SUMMARY_PATH = "results/telemetry_summary.csv"
+
+    summary = summarize_telemetry(scan_results(STORE_DIR))
+    with pl.Config(tbl_rows=-1, tbl_cols=-1, float_precision=3):
+        print(summary)
+    summary.write_csv(SUMMARY_PATH)
+    print(f"\nSaved telemetry summary to {SUMMARY_PATH}")
+
+if __name__ == "__main__":
+    main()
@@ -1,19 +1,12 @@
-# from google import genai
-import os
 from dotenv import load_dotenv
 
 load_dotenv()
-# gemini_api_key = os.getenv("GEMINI_API_KEY")
 
-# from ollama import chat
-# from ollama import ChatResponse
-from openai import OpenAI
+from backends import get_backend
 
 def main():
-    client = OpenAI()
     #model = "gemini-2.5-flash"
     #model = "gemini-2.5-pro"
-    #client = genai.Client(api_key=gemini_api_key)
     model = "gpt-4.1"
     #model = "llama3.2"
     #model = "llama3.2:1b"
@@ -67,30 +60,13 @@ def main():
     question = "What is the chemical formula for water?"
     prompt = "\n".join([template["system"], template["user"]]).format(question=question, context="\n\n".join(docs))
 
-    # response = client.models.generate_content(
-    #     model=model, contents=prompt
-    # )
+    output_text, telemetry = get_backend(model).chat(model, [{"role": "user", "content": prompt}])
 
-    # print(response.text)
-    # response: ChatResponse = chat(model=model, messages=[
-    #     {
-    #         'role': 'user',
-    #         'content': prompt,
-    #     },
-    # ])
-    response = client.responses.create(
-        model=model,
-        input=prompt
-    )
-
-    print(response.output_text)
+    print(output_text)
+    print(telemetry)
     print("-------------------")
-    final_response_ind = response.output_text.find("FINAL ANSWER:")
-    print(response.output_text[final_response_ind + len("FINAL ANSWER:"):].strip())
-
-    # response = client.models.list()
-    # print("Available models:")
-    # print(response.page)
+    final_response_ind = output_text.find("FINAL ANSWER:")
+    print(output_text[final_response_ind + len("FINAL ANSWER:"):].strip())
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,35 @@
+import pytest
+
+import backends
+from backends import Backend, empty_telemetry, register_backend
+
+class FakeBackend(Backend):
+    """
+    Answers every chat with `reply` and records the calls, for tests that must not
+    reach a model server.
+    """
+    name = "fake"
+
+    def __init__(self, reply: str = "The answer is fake.\nMore text."):
+        super().__init__()
+        self.reply = reply
+        self.calls = []
+
+    def chat(self, model_name, messages, options=None, json_mode=False, until=None):
+        self.calls.append({"model": model_name, "messages": messages, "options": options})
+        return self.reply.strip(), empty_telemetry() | {"eval_count": len(self.reply.split())}
+
+    async def achat(self, model_name, messages, options=None, json_mode=False, until=None):
+        return self.chat(model_name, messages, options, json_mode, until)
+
+@pytest.fixture
+def fake_backend(monkeypatch) -> FakeBackend:
+    """
+    A fresh FakeBackend serving every model whose name starts with 'fake-'; the
+    registration is dropped after the test.
+    """
+    monkeypatch.setattr(backends, "_REGISTRY", list(backends._REGISTRY))
+    monkeypatch.setattr(backends, "_instances", dict(backends._instances))
+    backend = FakeBackend()
+    register_backend(("fake-",), lambda: backend)
+    return backend
@@ -0,0 +1,78 @@
+import json
+
+import numpy as np
+
+import adaptive
+import prompting_script
+from adaptive import SequentialComparison, bootstrap_means
+
+ITEMS = [
+    {"question": f"Question {i}?", "gold_answer": f"Answer {i}", "relevant_docs": [f"Fact {i}."], "irrelevant_docs": ["Noise."]}
+    for i in range(25)
+]
+
+def test_bootstrap_resamples_whole_items():
+    # Three models that always agree: an item's scores carry one observation's worth of information
+    item_scores = np.random.default_rng(0).random(40)
+    by_item = bootstrap_means(3 * item_scores, np.full(40, 3.0), 4000, np.random.default_rng(1))
+    by_score = bootstrap_means(np.repeat(item_scores, 3), np.ones(120), 4000, np.random.default_rng(1))
+
+    assert abs(by_item.mean() - item_scores.mean()) < 0.01
+    assert by_item.std() > 1.5 * by_score.std()
+
+def test_min_items_counts_items_not_scores():
+    comparison = SequentialComparison(["a"], ["mixed"], min_items=30)
+    for idx in range(10):
+        for score in (0.2, 0.5, 0.8):
+            comparison.add("a", "mixed", idx, score)
+
+    row = comparison.update().row(0, named=True)
+    assert (row["items"], row["n"], row["mean"]) == (10, 30, 0.5)
+    assert row["ci_low"] is None and row["status"] == "sampling"
+
+def test_cells_settle_when_separated_or_saturated():
+    rng = np.random.default_rng(0)
+    comparison = SequentialComparison(["a", "b"], ["mixed", "relevant_only"], min_items=30, precision=0.001)
+    for idx in range(40):
+        comparison.add("a", "mixed", idx, 0.5 + rng.random() / 2)
+        comparison.add("b", "mixed", idx, rng.random() / 2)
+        comparison.add("a", "relevant_only", idx, 0.7)
+        comparison.add("b", "relevant_only", idx, 0.7)
+    comparison.update()
+
+    assert comparison.settled == {
+        ("a", "mixed"): "separated", ("b", "mixed"): "separated",
+        ("a", "relevant_only"): "saturated", ("b", "relevant_only"): "saturated",
+    }
+    assert not comparison.active()
+
+def test_local_models_stay_loaded_across_rounds(tmp_path, fake_backend, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "data.json").write_text(json.dumps({"items": ITEMS}), encoding="utf-8")
+    events = []
+    for module in (adaptive, prompting_script):
+        monkeypatch.setattr(module, "is_local_model", lambda model: True)
+        monkeypatch.setattr(module, "warm_model", lambda model, keep_alive, module=module: events.append((module.__name__, "warm", model)) or 0.0)
+        monkeypatch.setattr(module, "unload_model", lambda model, module=module: events.append((module.__name__, "unload", model)))
+
+    adaptive.main(models=["fake-a", "fake-b"], prompt_variants=["langchain_base"], dataset_path="data.json", output_path="out.jsonl")
+
+    # Three rounds of ten items, but each model is loaded once and unloaded at the end
+    assert events == [
+        ("adaptive", "warm", "fake-a"), ("adaptive", "warm", "fake-b"),
+        ("adaptive", "unload", "fake-a"), ("adaptive", "unload", "fake-b"),
+    ]
+    assert len(fake_backend.calls) == len(ITEMS) * len(prompting_script.CONTEXT_CONDITIONS) * 2
+
+def test_differences_are_paired_by_item():
+    # Items vary widely in difficulty, and variant a beats b by a small margin on every one
+    difficulty = np.random.default_rng(0).random(40)
+    comparison = SequentialComparison(["a", "b"], ["mixed"], min_items=30, precision=0.001)
+    for idx, base in enumerate(difficulty):
+        comparison.add("a", "mixed", idx, base + 0.02)
+        comparison.add("b", "mixed", idx, base)
+    rows = comparison.update()
+
+    # Each cell's own interval is far wider than the gap, yet the paired difference excludes 0
+    assert (rows["ci_high"] - rows["ci_low"] > 0.1).all()
+    assert comparison.settled == {("a", "mixed"): "separated", ("b", "mixed"): "separated"}
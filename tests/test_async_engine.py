@@ -0,0 +1,120 @@
+import asyncio
+import json
+
+import pytest
+
+import async_engine
+from async_engine import AsyncGenerator, run_grid
+from dataset_loader import iter_windows
+from prompting_script import grid_cells, select_combos
+from response_cache import ResponseCache
+from result_writer import ResultWriter
+from sharding import in_shard
+
+ITEMS = [
+    {"question": f"Question {i}?", "gold_answer": f"Answer {i}", "relevant_docs": [f"Fact {i}."], "irrelevant_docs": ["Noise."]}
+    for i in range(3)
+]
+
+def cells(models, conditions=("relevant_only", "mixed")):
+    return grid_cells(list(enumerate(ITEMS)), list(conditions), models, select_combos(["langchain_base"]))
+
+def read_jsonl(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+def test_run_grid_writes_one_record_per_cell(tmp_path, fake_backend):
+    grid = cells(["fake-a", "fake-b"])
+    with ResultWriter(str(tmp_path / "out.jsonl")) as writer:
+        failed = asyncio.run(run_grid(grid, AsyncGenerator(2), writer, ["fake-a", "fake-b"]))
+
+    records = read_jsonl(tmp_path / "out.jsonl")
+    assert failed == 0
+    assert len(records) == len(grid) == len(fake_backend.calls)
+    assert {(r["item_index"], r["model_name"], r["context_condition"]) for r in records} == {
+        (item[0], model, condition) for item, condition, model, _ in grid
+    }
+
+def test_run_grid_cancels_the_other_tasks_on_the_first_exception(tmp_path, fake_backend, monkeypatch):
+    def broken(*args):
+        raise RuntimeError("broken cell")
+
+    monkeypatch.setattr(async_engine, "prepare_evaluation", broken)
+    # More cells than the queue holds, so a producer that is not cancelled would block forever
+    grid = cells(["fake-a"]) * 50
+    with ResultWriter(str(tmp_path / "out.jsonl")) as writer:
+        with pytest.raises(RuntimeError, match="broken cell"):
+            asyncio.run(asyncio.wait_for(run_grid(grid, AsyncGenerator(1), writer, ["fake-a"], queue_size=2), timeout=5))
+
+def test_cache_hits_skip_the_backend(tmp_path, fake_backend):
+    cache = ResponseCache(str(tmp_path / "cache.sqlite"))
+    grid = cells(["fake-a"])
+    for path in ("first.jsonl", "second.jsonl"):
+        with ResultWriter(str(tmp_path / path)) as writer:
+            asyncio.run(run_grid(grid, AsyncGenerator(2, cache=cache), writer, ["fake-a"]))
+    cache.close()
+
+    assert len(fake_backend.calls) == len(grid)
+    assert all(r["telemetry"]["cached"] for r in read_jsonl(tmp_path / "second.jsonl"))
+
+def test_main_runs_only_the_requested_shard_models_and_conditions(tmp_path, fake_backend, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "data.json").write_text(json.dumps({"items": ITEMS}), encoding="utf-8")
+
+    async_engine.main(
+        shard=(0, 2), models=["fake-a"], prompt_variants=["langchain_base"],
+        dataset_path="data.json", output_path="out.jsonl", conditions=["mixed"]
+    )
+
+    records = read_jsonl(tmp_path / "out.shard-0-of-2.jsonl")
+    keys = [(r["item_index"], r["model_name"], r["prompt_variant"], r["context_condition"]) for r in records]
+    expected = [(i, "fake-a", "langchain_base", "mixed") for i in range(len(ITEMS))]
+    assert sorted(keys) == sorted(key for key in expected if in_shard(key, (0, 2)))
+
+def test_main_rejects_unknown_conditions(tmp_path, fake_backend, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    with pytest.raises(ValueError, match="Unknown context conditions"):
+        async_engine.main(models=["fake-a"], dataset_path="data.json", conditions=["relevant"])
+
+def test_main_runs_one_model_at_a_time_across_windows(tmp_path, fake_backend, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "data.json").write_text(json.dumps({"items": ITEMS}), encoding="utf-8")
+    monkeypatch.setattr(async_engine, "iter_windows", lambda items, size: iter_windows(items, 1))
+
+    async_engine.main(models=["fake-a", "fake-b"], prompt_variants=["langchain_base"], dataset_path="data.json", output_path="out.jsonl", conditions=["mixed"])
+
+    assert [call["model"] for call in fake_backend.calls] == ["fake-a"] * len(ITEMS) + ["fake-b"] * len(ITEMS)
+
+def test_main_keeps_one_local_model_loaded_at_a_time(tmp_path, fake_backend, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "data.json").write_text(json.dumps({"items": ITEMS}), encoding="utf-8")
+    events = []
+    monkeypatch.setattr(async_engine, "is_local_model", lambda model: True)
+    monkeypatch.setattr(async_engine, "warm_model", lambda model, keep_alive: events.append(("warm", model)) or 0.0)
+    monkeypatch.setattr(async_engine, "unload_model", lambda model: events.append(("unload", model, len(fake_backend.calls))))
+
+    async_engine.main(4, models=["fake-a", "fake-b"], prompt_variants=["langchain_base"], dataset_path="data.json", output_path="out.jsonl", conditions=["mixed"])
+
+    # Every request to a model has finished before it is unloaded and the next one loads
+    n = len(ITEMS)
+    assert events == [("warm", "fake-a"), ("unload", "fake-a", n), ("warm", "fake-b"), ("unload", "fake-b", 2 * n)]
+
+def test_run_grid_starts_the_largest_per_model_limit_of_workers(tmp_path, fake_backend):
+    generator = AsyncGenerator({"fake-a": 2, "fake-b": 3})
+    in_flight, peak = 0, 0
+    call_model = generator.call_model
+
+    async def counting(*args, **kwargs):
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        await asyncio.sleep(0.01)
+        try:
+            return await call_model(*args, **kwargs)
+        finally:
+            in_flight -= 1
+
+    generator.call_model = counting
+    with ResultWriter(str(tmp_path / "out.jsonl")) as writer:
+        asyncio.run(run_grid(cells(["fake-a", "fake-b"]) * 3, generator, writer, ["fake-a", "fake-b"]))
+    assert peak == 3
@@ -0,0 +1,107 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+import pytest
+
+import backends
+from backends import OllamaBackend, OpenAIBackend, get_backend, register_backend
+from mock_ollama import MockConfig, MockOllamaServer
+
+MESSAGES = [{"role": "user", "content": "Question?"}]
+
+@pytest.fixture(autouse=True)
+def registry(monkeypatch):
+    """
+    Registrations made by a test are dropped after it.
+    """
+    monkeypatch.setattr(backends, "_REGISTRY", list(backends._REGISTRY))
+
+@pytest.fixture(scope="module")
+def server():
+    with MockOllamaServer(MockConfig(latency=0.0, token_rate=10_000.0)) as server:
+        yield server
+
+def test_models_are_routed_by_prefix_to_one_shared_instance():
+    assert isinstance(get_backend("gpt-4.1-mini"), OpenAIBackend)
+    assert isinstance(get_backend("llama3.2"), OllamaBackend)
+    assert get_backend("llama3.2") is get_backend("qwen3:4b")
+
+def test_later_registrations_take_precedence():
+    first, second = OllamaBackend(), OllamaBackend()
+    register_backend(("local-",), lambda: first)
+    register_backend(("local-big",), lambda: second)
+
+    assert get_backend("local-small") is first
+    assert get_backend("local-big-1") is second
+
+def test_string_targets_are_imported_on_first_use():
+    register_backend(("plugin-",), "backends:OpenAIBackend")
+    assert isinstance(get_backend("plugin-model"), OpenAIBackend)
+
+    register_backend(("broken-",), "no_such_module:Backend")
+    with pytest.raises(ImportError):
+        get_backend("broken-model")
+
+def test_openai_request_kwargs_translate_ollama_options():
+    kwargs = OpenAIBackend.request_kwargs({"num_predict": 64, "temperature": 0, "stop": ["\n"], "num_ctx": 4096}, json_mode=True)
+    assert kwargs == {"max_tokens": 64, "temperature": 0, "stop": ["\n"], "response_format": {"type": "json_object"}}
+    assert OpenAIBackend.request_kwargs(None, json_mode=False) == {}
+
+def test_ollama_chat_reuses_one_client(server):
+    backend = OllamaBackend(host=server.host)
+    answer, telemetry = backend.chat("mock-a", MESSAGES, {"num_predict": 6})
+    client = backend.client
+    backend.chat("mock-a", MESSAGES, {"num_predict": 6})
+
+    assert backend.client is client
+    assert answer.startswith("The answer is mock.")
+    assert telemetry["eval_count"] == 6 and telemetry["wall_time_s"] > 0
+
+def test_ollama_async_clients_are_kept_per_event_loop(server):
+    backend = OllamaBackend(host=server.host)
+
+    async def run():
+        answer, _ = await backend.achat("mock-a", MESSAGES, {"num_predict": 6})
+        return answer, backend.async_client
+
+    first_answer, first_client = asyncio.run(run())
+    second_answer, second_client = asyncio.run(run())
+    assert first_answer == second_answer
+    assert first_client is not second_client
+
+def test_stopped_streams_are_timed_on_the_client(server):
+    backend = OllamaBackend(host=server.host)
+    answer, telemetry = backend.chat("mock-a", MESSAGES, {"num_predict": 20}, until=lambda text: text.endswith("\n"))
+
+    assert answer == "The answer is mock."
+    assert telemetry["stopped_early"] and telemetry["client_timed"]
+    assert telemetry["eval_count"] == 4
+    assert telemetry["total_duration"] >= telemetry["eval_duration"] > 0
+    assert telemetry["load_duration"] is None
+
+def test_an_empty_stream_gives_empty_telemetry():
+    backend = OllamaBackend()
+    backend._client = SimpleNamespace(chat=lambda **kwargs: iter([]))
+    answer, telemetry = backend.chat("mock-a", MESSAGES)
+
+    assert answer == ""
+    assert telemetry["eval_count"] is None and telemetry["wall_time_s"] >= 0
+
+def test_mock_server_records_the_latency_of_streams_closed_early():
+    with MockOllamaServer(MockConfig(latency=0.0, token_rate=1000.0)) as server:
+        OllamaBackend(host=server.host).chat("mock-a", MESSAGES, {"num_predict": 20}, until=lambda text: True)
+        deadline = time.monotonic() + 5
+        while not server.latencies and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert len(server.latencies) == 1
+
+def test_open_weight_gpt_models_stay_on_ollama():
+    assert isinstance(get_backend("gpt-oss:20b"), OllamaBackend)
+    assert isinstance(get_backend("gpt-5-mini"), OpenAIBackend)
+    assert isinstance(get_backend("o4-mini"), OpenAIBackend)
+
+def test_reasoning_models_get_max_completion_tokens_only():
+    options = {"num_predict": 64, "temperature": 0, "top_p": 0.9, "stop": ["\n"], "seed": 1}
+    assert OpenAIBackend.request_kwargs(options, json_mode=False, model_name="o3-mini") == {"max_completion_tokens": 64, "seed": 1}
+    assert OpenAIBackend.request_kwargs(options, json_mode=False, model_name="gpt-4.1-mini")["max_tokens"] == 64
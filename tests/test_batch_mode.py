@@ -0,0 +1,76 @@
+import json
+
+import pytest
+
+import backends
+import batch_mode
+from backends import OpenAIBackend, register_backend
+from batch_mode import build_batch, custom_id, save_manifest
+from mock_openai import MockOpenAIServer
+from prompting_script import CONTEXT_CONDITIONS, grid_cells, select_combos
+
+ITEMS = [
+    {"question": f"Question {i}?", "gold_answer": f"Answer {i}", "relevant_docs": [f"Fact {i}."], "irrelevant_docs": ["Noise.", "More noise."]}
+    for i in range(2)
+]
+MODEL = "gpt-test"
+
+@pytest.fixture
+def server(tmp_path, monkeypatch):
+    """
+    A mock batch API serving MODEL, run from a scratch directory holding data.json.
+    """
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    monkeypatch.setattr(backends, "_REGISTRY", list(backends._REGISTRY))
+    (tmp_path / "data.json").write_text(json.dumps({"items": ITEMS}), encoding="utf-8")
+    with MockOpenAIServer(batch_time=0.05) as server:
+        register_backend((MODEL,), lambda: OpenAIBackend(base_url=server.base_url))
+        yield server
+
+def run(prompt_variants):
+    batch_mode.main(MODEL, poll_interval=0.01, prompt_variants=prompt_variants, dataset_path="data.json", output_path="out.jsonl")
+
+def read_records():
+    with open("out.jsonl", "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+def test_failed_requests_are_resubmitted_on_the_next_run(server, capsys):
+    server.fail_ids = {f"0|{MODEL}|langchain_base|mixed", f"1|{MODEL}|mastra_cot_base|relevant_only"}
+    run(["langchain_base", "mastra_cot_base"])
+    assert len(read_records()) == len(ITEMS) * len(CONTEXT_CONDITIONS) * 2 - 2
+    # The failures only appear in the batch's error file
+    assert "2 requests failed in the batch" in capsys.readouterr().out
+
+    server.fail_ids = set()
+    run(["langchain_base", "mastra_cot_base"])
+    records = read_records()
+    assert len(records) == len(ITEMS) * len(CONTEXT_CONDITIONS) * 2
+    assert {(r["item_index"], r["prompt_variant"], r["context_condition"]) for r in records[-2:]} == {
+        (0, "langchain_base", "mixed"), (1, "mastra_cot_base", "relevant_only")
+    }
+    # The answer after FINAL ANSWER: is extracted as in rag_evaluation
+    assert {r["model_answer"].strip() for r in records} == {"The answer is mock."}
+
+def test_merged_records_match_the_prompts_that_were_sent(server, tmp_path):
+    run(["mastra_cot_base"])
+    batch_input = [json.loads(line) for path in (tmp_path / "results" / "batches").glob("*.jsonl") for line in open(path, encoding="utf-8")]
+    sent = {request["custom_id"]: request["body"]["messages"] for request in batch_input}
+
+    for record in read_records():
+        key = f"{record['item_index']}|{MODEL}|{record['prompt_variant']}|{record['context_condition']}"
+        assert record["context"] in sent[key][-1]["content"] or record["context"] in sent[key][0]["content"]
+        assert all(doc["included"] for doc in record["documents"])
+
+def test_a_resumed_run_merges_with_the_combos_it_was_built_with(server, tmp_path):
+    combos = select_combos(["llamaindex_base"])
+    cells = grid_cells(list(enumerate(ITEMS)), CONTEXT_CONDITIONS, [MODEL], combos)
+    manifest = build_batch(cells, "results/batches", MODEL)
+    save_manifest(manifest, f"results/batches/{MODEL}.manifest.json")
+
+    # Only the item index, combo name and condition are kept per request
+    assert manifest["requests"][custom_id(cells[0])] == {"item_index": 0, "prompt_variant": "llamaindex_base", "context_condition": cells[0][1]}
+
+    run(["langchain_base"])
+    assert {r["prompt_variant"] for r in read_records()} == {"llamaindex_base"}
+    assert not (tmp_path / "results" / "batches" / f"{MODEL}.manifest.json").exists()
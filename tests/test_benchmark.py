@@ -0,0 +1,46 @@
+import json
+
+import pytest
+
+import benchmark
+from benchmark import percentile, summarize
+from mock_ollama import MockConfig
+
+ITEMS = [
+    {"question": f"Question {i}?", "gold_answer": f"Answer {i}", "relevant_docs": [f"Fact {i}."], "irrelevant_docs": ["Noise."]}
+    for i in range(2)
+]
+
+def test_percentiles_and_summary():
+    latencies = [0.1 * i for i in range(1, 101)]
+    assert percentile(latencies, 0.5) == pytest.approx(5.1) and percentile(latencies, 0.99) == pytest.approx(9.9)
+    assert percentile([], 0.5) != percentile([], 0.5)
+
+    result = summarize("scenario", [0.2, 0.1, 0.3], 1.5, 100.0, items=3)
+    assert result["requests"] == 3 and result["requests_per_s"] == 2.0
+    assert result["p50_latency_s"] == 0.2 and result["mean_latency_s"] == pytest.approx(0.2)
+    assert result["items"] == 3
+
+def test_a_tiny_run_writes_the_report(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    # main points OLLAMA_HOST at its mock server; restored after the test
+    monkeypatch.setenv("OLLAMA_HOST", "http://127.0.0.1:1")
+    (tmp_path / "data").mkdir()
+    (tmp_path / "data" / "input_data.json").write_text(json.dumps({"items": ITEMS}), encoding="utf-8")
+    config = MockConfig(latency=0.0, token_rate=10_000.0, error_rate=0.2)
+
+    # No concurrency levels: only prompting_script.main and the scoring scenarios run
+    report = benchmark.main(grid_sizes=(1,), concurrency=(), models=("mock-a",), config=config, scoring_rows=50)
+
+    saved = json.loads(next((tmp_path / "results" / "benchmarks").glob("benchmark-*.json")).read_text(encoding="utf-8"))
+    assert saved == json.loads(json.dumps(report))
+    assert {"timestamp", "git_revision", "mock_config", "results"} <= saved.keys()
+    assert saved["mock_config"]["error_rate"] == 0.2
+
+    generation, *scoring = saved["results"]
+    assert generation["scenario"] == "prompting_script.main items=1"
+    assert {"requests", "wall_time_s", "p50_latency_s", "p99_latency_s", "peak_rss_mb", "model_loads", "server_errors"} <= generation.keys()
+    # The injected HTTP 500s are counted in the report
+    assert generation["server_errors"] > 0 and generation["requests"] > 0
+    assert [s["scenario"].rsplit("=", 1)[-1] for s in scoring] == ["False", "True"]
+    assert all(s["rows"] > 0 and {"rougeL", "bleu"} <= s["metrics"].keys() for s in scoring)
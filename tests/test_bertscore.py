@@ -0,0 +1,96 @@
+from types import SimpleNamespace
+
+import numpy as np
+import polars as pl
+import pytest
+import torch
+
+from bertscore import BertScore
+
+def fake_encode(sentences):
+    """
+    One token row per word between [CLS] and [SEP], derived from the word, so equal
+    words embed equally.
+    """
+    encoded = {}
+    for sentence in set(sentences):
+        words = ["[CLS]"] + sentence.split() + ["[SEP]"]
+        emb = torch.stack([torch.tensor([float(len(w)), float(hash(w) % 7), 1.0, 0.5]) for w in words])
+        encoded[sentence] = (emb / emb.norm(dim=-1, keepdim=True), torch.ones(len(words)))
+    return encoded
+
+@pytest.fixture
+def make_metric(monkeypatch):
+    """
+    BertScore with a fake scorer and encoder, so no model is downloaded; `encoded`
+    collects every sentence sent to the encoder.
+    """
+    encoded = []
+
+    def make(**kwargs):
+        metric = BertScore(batch_size=4, **kwargs)
+        metric._scorer = SimpleNamespace(hash="fake-model", device="cpu", all_layers=False, baseline_vals=torch.zeros(3))
+
+        def encode(sentences):
+            encoded.extend(sentences)
+            return fake_encode(sentences)
+
+        monkeypatch.setattr(metric, "_encode", encode)
+        return metric
+
+    make.encoded = encoded
+    return make
+
+def test_only_references_are_cached(make_metric):
+    metric = make_metric()
+    references = pl.Series([["the cell"], ["I don't know"], ["the cell"]])
+    scores = metric.score_many(references, pl.Series(["the cell", "no idea", "a cell"]))
+
+    assert set(metric._embeddings) == {"the cell", "I don't know"}
+    assert scores["bert_score_precision"][0] == pytest.approx(1.0)
+    assert scores["bert_score_recall"][0] == pytest.approx(1.0)
+
+def test_memory_cache_is_lru_bounded(make_metric):
+    metric = make_metric(max_cached=2)
+    metric.embed(["a"])
+    metric.embed(["b"])
+    metric.embed(["a"])
+    embeddings = metric.embed(["c"])
+
+    assert list(metric._embeddings) == ["a", "c"]
+    assert set(embeddings) == {"c"}
+    # Everything a call asked for is returned, even past the bound
+    assert set(metric.embed(["x", "y", "z"])) == {"x", "y", "z"}
+    assert len(metric._embeddings) == 2
+
+def test_disk_cache_is_one_memory_mapped_file(make_metric, tmp_path):
+    first = make_metric(cache_dir=str(tmp_path))
+    expected = first.embed(["the cell produces ATP", "I don't know"])
+    make_metric.encoded.clear()
+
+    second = make_metric(cache_dir=str(tmp_path))
+    loaded = second.embed(["the cell produces ATP", "I don't know"])
+
+    assert make_metric.encoded == []
+    assert sorted(p.name for p in (tmp_path / "fake-model").iterdir()) == ["embeddings.f32", "index.jsonl"]
+    for sentence, (emb, idf) in expected.items():
+        assert torch.equal(loaded[sentence][0], emb)
+        assert torch.equal(loaded[sentence][1], idf)
+        assert np.shares_memory(loaded[sentence][0].numpy(), second._mmap)
+
+def test_disk_cache_survives_a_torn_write(make_metric, tmp_path):
+    make_metric(cache_dir=str(tmp_path)).embed(["a b"])
+    with open(tmp_path / "fake-model" / "embeddings.f32", "ab") as f:
+        f.write(b"\x01\x02")
+    with open(tmp_path / "fake-model" / "index.jsonl", "a", encoding="utf-8") as f:
+        f.write('{"key": "torn')
+
+    metric = make_metric(cache_dir=str(tmp_path))
+    metric.embed(["c d e"])
+    reloaded = make_metric(cache_dir=str(tmp_path))
+    make_metric.encoded.clear()
+    embeddings = reloaded.embed(["a b", "c d e"])
+
+    assert make_metric.encoded == []
+    assert b"\n\n" not in (tmp_path / "fake-model" / "index.jsonl").read_bytes()
+    assert torch.equal(embeddings["c d e"][0], fake_encode(["c d e"])["c d e"][0])
@@ -0,0 +1,47 @@
+import random
+import warnings
+
+import polars as pl
+import pytest
+from nltk.translate.bleu_score import SmoothingFunction, corpus_bleu, sentence_bleu
+
+from metrics import BLEU, _tokenize
+
+WORDS = ["the", "cell", "energy", "ATP", "mitochondria", "produce", "is", "a", ",", "."]
+
+def random_rows(n_rows: int, seed: int = 0) -> tuple[list[list[str]], list[str]]:
+    rng = random.Random(seed)
+    sentence = lambda: " ".join(rng.choices(WORDS, k=rng.randint(0, 12)))
+    references = [[sentence() for _ in range(rng.randint(1, 3))] for _ in range(n_rows)]
+    return references, [sentence() for _ in range(n_rows)]
+
+NLTK_SMOOTHING = {None: SmoothingFunction().method0, "epsilon": SmoothingFunction(epsilon=0.1).method1, "add1": SmoothingFunction().method2}
+
+@pytest.mark.parametrize("smoothing", [None, "epsilon", "add1"])
+def test_score_many_matches_nltk_sentence_bleu(smoothing):
+    references, candidates = random_rows(300)
+    scores = BLEU(smoothing=smoothing).score_many(pl.Series(references), pl.Series(candidates))["bleu"]
+
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        expected = [
+            sentence_bleu([_tokenize(r) for r in refs], _tokenize(cand), smoothing_function=NLTK_SMOOTHING[smoothing])
+            if _tokenize(cand) else 0.0
+            for refs, cand in zip(references, candidates)
+        ]
+    assert scores == pytest.approx(expected, abs=1e-9)
+
+def test_corpus_score_matches_nltk_corpus_bleu():
+    references, candidates = random_rows(200, seed=1)
+    expected = corpus_bleu([[_tokenize(r) for r in refs] for refs in references], [_tokenize(c) for c in candidates])
+    assert BLEU().corpus_score(pl.Series(references), pl.Series(candidates)) == pytest.approx(expected, abs=1e-9)
+
+def test_plain_string_references_and_edge_rows():
+    scores = BLEU(smoothing="epsilon").score_many(
+        pl.Series(["a b c d e", "a b c d e", None]), pl.Series(["a b c d e", "", "a b"])
+    )["bleu"]
+    assert scores == pytest.approx([1.0, 0.0, 0.0])
+
+def test_unknown_smoothing_is_rejected():
+    with pytest.raises(ValueError):
+        BLEU(smoothing="method7")
@@ -0,0 +1,64 @@
+import random
+
+import pytest
+
+from context_packing import SEPARATOR_TOKENS, TokenCounter, heuristic_count, pack_documents, packed_context
+
+def word_counter():
+    """
+    A counter that charges one token per word and records each text it tokenizes.
+    """
+    seen = []
+
+    def tokenize(text):
+        seen.append(text)
+        return len(text.split())
+
+    counter = TokenCounter("test-model", tokenizer=tokenize)
+    counter.seen = seen
+    return counter
+
+DOCS = [
+    {"text": "noise " * 5, "label": "irrelevant"},
+    {"text": "fact " * 4, "label": "relevant"},
+    {"text": "noise " * 2, "label": "irrelevant"},
+    {"text": "fact " * 3, "label": "relevant"},
+]
+
+def tokens_used(packed, counter):
+    kept = [counter.count(d["text"]) for d in packed if d["included"]]
+    return sum(kept) + SEPARATOR_TOKENS * max(len(kept) - 1, 0)
+
+@pytest.mark.parametrize("budget", range(0, 20))
+@pytest.mark.parametrize("policy", ["relevant_first", "original", "shuffled"])
+def test_kept_documents_never_exceed_the_budget(budget, policy):
+    counter = word_counter()
+    packed = pack_documents(DOCS, counter, budget, policy, random.Random(budget))
+
+    assert tokens_used(packed, counter) <= budget
+    # Packing only flags documents, it never reorders or edits them
+    assert [{k: v for k, v in d.items() if k != "included"} for d in packed] == DOCS
+
+def test_relevant_documents_are_packed_first():
+    packed = pack_documents(DOCS, word_counter(), budget=8)
+    assert [d["included"] for d in packed] == [False, True, False, True]
+    assert packed_context(packed) == DOCS[1]["text"] + "\n\n" + DOCS[3]["text"]
+
+def test_original_order_keeps_whatever_fits_in_turn():
+    packed = pack_documents(DOCS, word_counter(), budget=8, policy="original")
+    assert [d["included"] for d in packed] == [True, False, True, False]
+
+def test_token_counts_are_cached_per_text():
+    counter = word_counter()
+    for _ in range(3):
+        pack_documents(DOCS, counter, budget=100)
+    assert sorted(counter.seen) == sorted(d["text"] for d in DOCS)
+    assert counter.exact
+
+def test_unknown_policy_is_rejected():
+    with pytest.raises(ValueError):
+        pack_documents(DOCS, word_counter(), 10, policy="longest_first")
+
+def test_heuristic_count_and_unpacked_context():
+    assert heuristic_count("abcdefgh") == 2 and heuristic_count("abcdefghi") == 3
+    assert packed_context([{"text": "a"}, {"text": "b", "included": False}, {"text": "c"}]) == "a\n\nc"
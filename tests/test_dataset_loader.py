@@ -0,0 +1,56 @@
+import json
+
+import pytest
+
+from dataset_loader import DocumentStore, convert_dataset, iter_items, iter_windows
+
+ITEMS = [
+    {"question": f"Question {i}?", "gold_answer": f"Answer {i}", "relevant_docs": [f"Fact {i}."], "irrelevant_docs": ["Shared noise.", f"Noise {i}."]}
+    for i in range(5)
+]
+
+def write_json(path):
+    path.write_text(json.dumps({"items": ITEMS}), encoding="utf-8")
+    return str(path)
+
+def as_lists(item):
+    return item | {"relevant_docs": list(item["relevant_docs"]), "irrelevant_docs": list(item["irrelevant_docs"])}
+
+def test_repeated_texts_are_stored_once():
+    store = DocumentStore()
+    first, second = store.intern("Shared noise."), store.intern("Other.")
+    assert store.intern("Shared noise.") == first != second
+    assert store.get(second) == "Other." and len(store) == 2
+
+    refs = store.refs(["Other.", "Shared noise.", "Other."])
+    assert refs.ids == [second, first, second]
+    assert list(refs) == ["Other.", "Shared noise.", "Other."]
+    assert refs[1:] == ["Shared noise.", "Other."] and refs[-1] == "Other."
+    assert len(store.refs(None)) == 0
+
+def test_items_share_one_store(tmp_path):
+    store = DocumentStore()
+    items = list(iter_items(write_json(tmp_path / "data.json"), store))
+
+    assert [idx for idx, _ in items] == list(range(len(ITEMS)))
+    assert [as_lists(item) for _, item in items] == ITEMS
+    # One shared distractor plus one fact and one noise text per item
+    assert len(store) == 1 + 2 * len(ITEMS)
+    assert len({item["irrelevant_docs"].ids[0] for _, item in items}) == 1
+
+@pytest.mark.parametrize("suffix", [".jsonl", ".parquet"])
+def test_converted_datasets_stream_the_same_items(tmp_path, suffix):
+    src = write_json(tmp_path / "data.json")
+    dst = str(tmp_path / f"data{suffix}")
+    convert_dataset(src, dst)
+
+    assert [as_lists(item) for _, item in iter_items(dst, batch_size=2)] == ITEMS
+
+def test_unsupported_formats_are_rejected(tmp_path):
+    with pytest.raises(ValueError, match="Unsupported dataset format"):
+        next(iter_items(str(tmp_path / "data.csv")))
+
+def test_windows_cover_every_item_in_order():
+    windows = list(iter_windows(enumerate("abcde"), 2))
+    assert windows == [[(0, "a"), (1, "b")], [(2, "c"), (3, "d")], [(4, "e")]]
+    assert list(iter_windows(iter([]), 3)) == []
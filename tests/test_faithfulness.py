@@ -0,0 +1,72 @@
+import pickle
+import random
+
+import polars as pl
+import pytest
+
+from metrics import Faithfulness
+
+def naive_supported(answer, documents, n):
+    """
+    Marks every answer token inside a matching k-token span, k = min(n, len(answer)).
+    """
+    if not answer or not documents:
+        return None
+    k = min(n, len(answer))
+    spans = {doc[i:i + k] for doc in documents for i in range(len(doc) - k + 1)}
+    covered = [False] * len(answer)
+    for i in range(len(answer) - k + 1):
+        if answer[i:i + k] in spans:
+            covered[i:i + k] = [True] * k
+    return sum(covered) / len(answer)
+
+def docs(relevant=(), irrelevant=(), excluded=()):
+    return (
+        [{"text": t, "label": "relevant"} for t in relevant]
+        + [{"text": t, "label": "irrelevant"} for t in irrelevant]
+        + [{"text": t, "label": "relevant", "included": False} for t in excluded]
+    )
+
+def score(metric, documents, answers):
+    return metric.score_many(pl.Series([documents] * len(answers)), pl.Series(answers))
+
+@pytest.mark.parametrize("n", [1, 2, 3, 4])
+def test_spans_match_a_naive_token_cover(n):
+    rng = random.Random(n)
+    words = "a b c d e".split()
+    metric = Faithfulness(n=n)
+    for _ in range(200):
+        relevant = [" ".join(rng.choices(words, k=rng.randint(0, 12))) for _ in range(rng.randint(0, 3))]
+        answer = " ".join(rng.choices(words, k=rng.randint(0, 10)))
+        result = score(metric, docs(relevant), [answer])
+        expected = naive_supported(tuple(answer.split()), [tuple(t.split()) for t in relevant], n)
+        if expected is None:
+            assert result["faithfulness_relevant"][0] is None
+        else:
+            assert result["faithfulness_relevant"][0] == pytest.approx(expected)
+
+def test_scores_are_split_by_label_and_skip_excluded_documents():
+    documents = docs(["Paris is the capital of France."], ["The Moon orbits the Earth."], ["Berlin is the capital of Germany."])
+    result = score(Faithfulness(), documents, ["paris is the capital of france", "The Moon orbits the Earth", "Berlin is the capital of Germany"])
+
+    assert result["faithfulness_relevant"][:2] == [1.0, 0.0]
+    assert result["faithfulness_irrelevant"][:2] == [0.0, 1.0]
+    # "is the capital of" is shown through the Paris document; "Berlin" and "Germany" only through the left-out one
+    assert result["faithfulness_relevant"][2] == pytest.approx(4 / 6)
+
+def test_missing_documents_or_answers_score_none():
+    result = score(Faithfulness(), docs(["Some fact."]), ["", None])
+    assert result["faithfulness_relevant"] == [None, None]
+    assert result["faithfulness_irrelevant"] == [None, None]
+
+def test_indexes_are_shared_bounded_and_not_pickled():
+    metric = Faithfulness(max_indexes=2)
+    score(metric, docs(["One fact."]), ["one fact"] * 3)
+    assert len(metric._indexes) == 1
+
+    score(metric, docs(["Two facts."]), ["two"])
+    score(metric, docs(["Three facts."]), ["three"])
+    assert len(metric._indexes) == 1
+
+    restored = pickle.loads(pickle.dumps(metric))
+    assert restored._indexes == {} and restored.n == metric.n
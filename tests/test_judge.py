@@ -0,0 +1,74 @@
+import asyncio
+
+import polars as pl
+import pytest
+
+from judge import Judge, judge_frame, parse_verdict
+from score_cache import ScoreCache
+
+VERDICT = '{"correct": true, "score": 0.75}'
+
+def test_parse_verdict_accepts_only_the_expected_object():
+    assert parse_verdict(VERDICT) == {"llm_correct": 1.0, "llm_score": 0.75}
+    for reply in ['["correct"]', '{"correct": "yes", "score": 1}', '{"correct": false, "score": 2}', '{"correct": false, "score": true}', "not json"]:
+        with pytest.raises(ValueError):
+            parse_verdict(reply)
+
+def test_judge_frame_adds_verdict_columns(fake_backend):
+    fake_backend.reply = VERDICT
+    df = pl.DataFrame({
+        "question": ["Q1?", "Q2?"], "gold_answer": ["A1", "A2"],
+        "context_condition": ["mixed", "irrelevant_only"], "model_answer": ["A1", "I don't know"],
+    })
+    judged = judge_frame(df, Judge("fake-judge"))
+
+    assert judged["llm_score"].to_list() == [0.75, 0.75]
+    assert all(call["options"] == {"temperature": 0} for call in fake_backend.calls)
+    # Answers to irrelevant_only are graded against the "I don't know" answers
+    assert "I don't know" in fake_backend.calls[1]["messages"][0]["content"]
+
+def test_invalid_replies_are_retried_with_backoff_then_left_empty(fake_backend, monkeypatch):
+    delays = []
+
+    async def sleep(seconds):
+        delays.append(seconds)
+
+    monkeypatch.setattr("judge.asyncio.sleep", sleep)
+    fake_backend.reply = "The answer looks right."
+    verdicts = asyncio.run(Judge("fake-judge", max_retries=3, retry_delay=0.5).judge_many([("Q?", "A", "A")]))
+
+    assert verdicts == [{"llm_correct": None, "llm_score": None}]
+    assert len(fake_backend.calls) == 3
+    # Full jitter: up to retry_delay, then up to twice that; no wait after the last attempt
+    assert len(delays) == 2 and 0 <= delays[0] <= 0.5 and 0 <= delays[1] <= 1.0
+
+def test_verdicts_are_deduplicated_and_cached(tmp_path, fake_backend):
+    fake_backend.reply = VERDICT
+    cache = ScoreCache(str(tmp_path / "scores.sqlite"))
+    triples = [("Q?", "A", "A"), ("Q?", "A", "A"), ("Q?", "A", "B")]
+
+    first = asyncio.run(Judge("fake-judge", cache=cache).judge_many(triples))
+    second = asyncio.run(Judge("fake-judge", cache=cache).judge_many(triples))
+    cache.close()
+
+    assert first == second and len(first) == 3
+    assert len(fake_backend.calls) == 2
+
+def test_requests_in_flight_are_bounded(fake_backend):
+    fake_backend.reply = VERDICT
+    in_flight, peak = 0, 0
+    chat = fake_backend.achat
+
+    async def slow_chat(*args, **kwargs):
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        await asyncio.sleep(0.001)
+        in_flight -= 1
+        return await chat(*args, **kwargs)
+
+    fake_backend.achat = slow_chat
+    triples = [(f"Q{i}?", "A", "A") for i in range(50)]
+    verdicts = asyncio.run(Judge("fake-judge", max_in_flight=4).judge_many(triples))
+
+    assert len(verdicts) == 50 and peak == 4
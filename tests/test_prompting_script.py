@@ -0,0 +1,26 @@
+import json
+
+import prompting_script
+from dataset_loader import iter_windows
+
+ITEMS = [
+    {"question": f"Question {i}?", "gold_answer": f"Answer {i}", "relevant_docs": [f"Fact {i}."], "irrelevant_docs": ["Noise."]}
+    for i in range(5)
+]
+
+def test_each_local_model_is_loaded_once_across_windows(tmp_path, fake_backend, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "data.json").write_text(json.dumps({"items": ITEMS}), encoding="utf-8")
+    monkeypatch.setattr(prompting_script, "iter_windows", lambda items, size: iter_windows(items, 2))
+    events = []
+    monkeypatch.setattr(prompting_script, "is_local_model", lambda model: True)
+    monkeypatch.setattr(prompting_script, "warm_model", lambda model, keep_alive: events.append(("warm", model)) or 0.0)
+    monkeypatch.setattr(prompting_script, "unload_model", lambda model: events.append(("unload", model)))
+
+    prompting_script.main(models=["fake-a", "fake-b"], prompt_variants=["langchain_base"], dataset_path="data.json", output_path="out.jsonl", conditions=["mixed"])
+
+    # Three windows, but every call to one model comes before the next model starts
+    assert events == [("warm", "fake-a"), ("unload", "fake-a"), ("warm", "fake-b"), ("unload", "fake-b")]
+    assert [call["model"] for call in fake_backend.calls] == ["fake-a"] * len(ITEMS) + ["fake-b"] * len(ITEMS)
+    with open(tmp_path / "out.jsonl", "r", encoding="utf-8") as f:
+        assert sum(1 for _ in f) == 2 * len(ITEMS)
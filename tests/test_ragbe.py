@@ -0,0 +1,55 @@
+import pytest
+
+import async_engine
+import backends
+import batch_mode
+import prompting_script
+import score_responses
+import sharding
+from ragbe import build_parser, main
+
+@pytest.fixture
+def calls(monkeypatch):
+    """
+    Replaces the mains the subcommands dispatch to, recording their arguments.
+    """
+    calls = []
+    for module in (prompting_script, async_engine, batch_mode, sharding, score_responses):
+        monkeypatch.setattr(module, "main", lambda *args, module=module: calls.append((module.__name__, args)))
+    return calls
+
+def test_generate_forwards_the_grid_options(calls):
+    main(["generate", "--models", "m1", "m2", "--variants", "langchain_base", "--shard", "1/3", "--conditions", "mixed", "retrieved"])
+    assert calls == [("prompting_script", ((1, 3), ["m1", "m2"], ["langchain_base"], "data/input_data.json", "results/rag_results.jsonl", ["mixed", "retrieved"]))]
+
+def test_generate_async_forwards_to_the_async_engine(calls):
+    main(["generate", "--async", "--max-in-flight", "16", "--models", "m1"])
+    assert calls == [("async_engine", (16, None, ["m1"], None, "data/input_data.json", "results/rag_results.jsonl", None))]
+
+def test_batch_takes_a_single_model(calls, capsys):
+    main(["batch", "--model", "gpt-test", "--poll-interval", "0.5", "--output", "out.jsonl"])
+    assert calls == [("batch_mode", ("gpt-test", 0.5, None, "data/input_data.json", "out.jsonl"))]
+
+    with pytest.raises(SystemExit):
+        build_parser().parse_args(["batch", "--models", "gpt-test"])
+    assert "unrecognized arguments" in capsys.readouterr().err
+
+def test_score_and_merge_shards(calls):
+    main(["score", "--metrics", "rougeL", "bleu", "--streaming"])
+    main(["merge-shards", "4", "--models", "m1", "--conditions", "retrieved"])
+    assert calls[0] == ("score_responses", (True, 50_000, ["rougeL", "bleu"], "results/rag_results.jsonl", None, "results/metric_timings.json"))
+    assert calls[1] == ("sharding", (4, ["m1"], None, "data/input_data.json", "results/rag_results.jsonl", ["retrieved"]))
+
+def test_backend_routes_are_registered_before_running(calls, monkeypatch):
+    monkeypatch.setattr(backends, "_REGISTRY", list(backends._REGISTRY))
+    main(["--backend", "plugin-,other-=backends:OpenAIBackend", "generate"])
+    assert isinstance(backends.get_backend("other-model"), backends.OpenAIBackend)
+
+    with pytest.raises(SystemExit):
+        build_parser().parse_args(["--backend", "plugin-", "generate"])
+
+def test_list_prints_the_registered_choices(capsys):
+    main(["list"])
+    out = capsys.readouterr().out
+    assert "rougeL" in out and "langchain_base" in out and "relevant_only" in out
+    assert out.count("\n") == 4
@@ -0,0 +1,107 @@
+import asyncio
+
+import httpx
+import pytest
+
+from rate_limit import AIMDController, RateController, RateLimits, TokenBucket, is_retryable, retry_after
+
+class StatusError(Exception):
+    def __init__(self, status_code: int, headers: dict[str, str] | None = None):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+        self.response = httpx.Response(status_code, headers=headers or {})
+
+def flaky(failures: list[Exception], result: str = "ok"):
+    """
+    A call that raises each of `failures` in turn, then returns `result`.
+    """
+    calls = []
+
+    def fn():
+        calls.append(1)
+        if len(calls) <= len(failures):
+            raise failures[len(calls) - 1]
+        return result
+
+    fn.calls = calls
+    return fn
+
+def test_retryable_errors():
+    assert is_retryable(StatusError(429)) and is_retryable(StatusError(503))
+    assert is_retryable(httpx.ConnectTimeout("slow")) and is_retryable(ConnectionResetError())
+    assert not is_retryable(StatusError(400)) and not is_retryable(ValueError("bad"))
+    assert retry_after(StatusError(429, {"retry-after": "2.5"})) == 2.5
+    assert retry_after(StatusError(429)) is None
+
+def test_token_bucket_reserves_into_debt():
+    bucket = TokenBucket(per_minute=60, burst=2)
+    assert bucket.reserve() == 0 and bucket.reserve() == 0
+    # The third request waits for about one refill (one per second)
+    assert bucket.reserve() == pytest.approx(1.0, abs=0.05)
+
+def test_aimd_grows_on_success_and_halves_on_throttle():
+    controller = AIMDController(initial=4, maximum=5, cooldown=0.0)
+    for _ in range(40):
+        controller.record_success(0.1)
+    assert controller.limit == 5
+
+    controller.record_throttle()
+    assert controller.limit == 2.5
+    controller.record_success(10.0)
+    assert controller.limit > 2.5
+
+def test_aimd_cuts_once_per_cooldown_and_on_slow_calls():
+    controller = AIMDController(initial=8, cooldown=60.0, latency_target=1.0)
+    controller.record_throttle()
+    controller.record_throttle()
+    assert controller.limit == 4
+
+    slow = AIMDController(initial=8, cooldown=0.0, latency_target=1.0)
+    slow.record_success(2.0)
+    assert slow.limit == 4
+
+def test_controller_retries_retryable_failures(monkeypatch):
+    monkeypatch.setattr("rate_limit.time.sleep", lambda seconds: None)
+    controller = RateController(RateLimits(max_retries=3))
+    fn = flaky([StatusError(429), httpx.ReadTimeout("slow")])
+
+    assert controller.call(fn) == "ok"
+    assert len(fn.calls) == 3
+    assert (controller.stats()["retries"], controller.stats()["throttles"]) == (2, 1)
+    assert controller.concurrency.in_flight == 0
+
+def test_controller_raises_permanent_and_exhausted_failures(monkeypatch):
+    monkeypatch.setattr("rate_limit.time.sleep", lambda seconds: None)
+    controller = RateController(RateLimits(max_retries=2))
+
+    bad_request = flaky([StatusError(400)])
+    with pytest.raises(StatusError):
+        controller.call(bad_request)
+    assert len(bad_request.calls) == 1
+
+    throttled = flaky([StatusError(429)] * 5)
+    with pytest.raises(StatusError):
+        controller.call(throttled)
+    assert len(throttled.calls) == 3
+
+def test_async_controller_waits_retry_after(monkeypatch):
+    delays = []
+
+    async def sleep(seconds):
+        delays.append(seconds)
+
+    monkeypatch.setattr("rate_limit.asyncio.sleep", sleep)
+    controller = RateController(RateLimits(max_retries=2))
+    fn = flaky([StatusError(429, {"retry-after": "7"})])
+
+    async def call():
+        return fn()
+
+    assert asyncio.run(controller.acall(call)) == "ok"
+    assert delays == [7.0]
+
+def test_limits_from_env(monkeypatch):
+    monkeypatch.setenv("TESTAPI_RPM", "500")
+    monkeypatch.setenv("TESTAPI_MAX_CONCURRENCY", "8")
+    limits = RateLimits.from_env("TESTAPI", tpm=1000)
+    assert (limits.rpm, limits.tpm, limits.max_concurrency) == (500.0, 1000, 8)
@@ -0,0 +1,54 @@
+import pytest
+
+from response_cache import ResponseCache
+
+MESSAGES = [{"role": "user", "content": "Q: what?"}]
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = ResponseCache(str(tmp_path / "cache.sqlite"))
+    yield cache
+    cache.close()
+
+def test_key_depends_on_model_messages_and_options():
+    key = ResponseCache.make_key("m", MESSAGES, {"temperature": 0})
+    assert key == ResponseCache.make_key("m", [dict(m) for m in MESSAGES], {"temperature": 0})
+    assert key != ResponseCache.make_key("other", MESSAGES, {"temperature": 0})
+    assert key != ResponseCache.make_key("m", MESSAGES, {"temperature": 1})
+    assert ResponseCache.make_key("m", MESSAGES) == ResponseCache.make_key("m", MESSAGES, {})
+
+def test_round_trip_with_telemetry(cache):
+    key = ResponseCache.make_key("m", MESSAGES)
+    assert cache.get(key) is None
+    cache.put(key, "m", "answer", {"eval_count": 3})
+    assert cache.get(key) == ("answer", {"eval_count": 3})
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+
+def test_persists_across_instances(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    first = ResponseCache(path)
+    first.put("k", "m", "answer")
+    first.close()
+    second = ResponseCache(path)
+    assert second.get("k") == ("answer", None)
+    second.close()
+
+def test_evicts_least_recently_used(tmp_path):
+    cache = ResponseCache(str(tmp_path / "cache.sqlite"), max_bytes=10)
+    cache.put("a", "m", "aaaa")
+    cache.put("b", "m", "bbbb")
+    cache.get("a")
+    cache.put("c", "m", "cccc")
+    assert cache.get("b") is None
+    assert cache.get("a") is not None and cache.get("c") is not None
+    assert cache.size() <= 10
+    cache.close()
+
+def test_call_model_only_calls_backend_on_miss(cache, fake_backend):
+    from prompting_script import call_model
+
+    first = call_model(MESSAGES, "fake-model", cache=cache)
+    second = call_model(MESSAGES, "fake-model", cache=cache)
+    assert first[0] == second[0] == fake_backend.reply.strip()
+    assert len(fake_backend.calls) == 1
+    assert second[1]["cached"] is True
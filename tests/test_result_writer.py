@@ -0,0 +1,47 @@
+import json
+
+from result_writer import ERROR_PREFIX, ResultWriter, is_error_record, load_completed_keys, record_key
+
+def make_record(idx: int, answer: str = "answer") -> dict[str, any]:
+    return {"item_index": idx, "model_name": "m", "prompt_variant": "v", "context_condition": "mixed", "model_answer": answer}
+
+def test_missing_file_has_no_completed_keys(tmp_path):
+    assert load_completed_keys(str(tmp_path / "missing.jsonl")) == set()
+
+def test_resume_skips_written_and_retries_errors(tmp_path):
+    path = str(tmp_path / "results.jsonl")
+    with ResultWriter(path) as writer:
+        writer.write(make_record(0))
+        writer.write(make_record(1, f"{ERROR_PREFIX} timeout"))
+        writer.write(make_record(2))
+    assert writer.written == 3
+    assert load_completed_keys(path) == {record_key(make_record(0)), record_key(make_record(2))}
+
+def test_partial_trailing_line_is_dropped(tmp_path):
+    path = tmp_path / "results.jsonl"
+    path.write_text(json.dumps(make_record(0)) + "\n" + json.dumps(make_record(1))[:20], encoding="utf-8")
+    assert load_completed_keys(str(path)) == {record_key(make_record(0))}
+
+    # Reopening truncates the cut-off line, so appended records stay valid JSONL
+    with ResultWriter(str(path)) as writer:
+        writer.write(make_record(1))
+    lines = path.read_text(encoding="utf-8").splitlines()
+    assert [json.loads(line)["item_index"] for line in lines] == [0, 1]
+
+def test_is_error_record():
+    assert is_error_record(make_record(0, f"{ERROR_PREFIX} boom"))
+    assert not is_error_record(make_record(0, "fine"))
+
+def test_partial_lines_longer_than_a_block_are_found(tmp_path):
+    path = tmp_path / "results.jsonl"
+    complete = "".join(json.dumps(make_record(i)) + "\n" for i in range(3))
+    with ResultWriter(str(path)) as writer:
+        for tail in ("", "x" * 10, "x" * 1000):
+            path.write_text(complete + tail, encoding="utf-8")
+            writer._truncate_partial_line(block_size=16)
+            assert path.read_text(encoding="utf-8") == complete
+
+    # A file that is one cut-off line is emptied
+    path.write_text("x" * 100, encoding="utf-8")
+    ResultWriter(str(path)).close()
+    assert path.read_text(encoding="utf-8") == ""
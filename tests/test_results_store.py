@@ -0,0 +1,55 @@
+import polars as pl
+import pytest
+
+from results_store import RECORD_COLUMNS, scan_metric_scores, scan_results, write_metric_scores, write_results
+
+def record(item_index, condition, documents, answer="An answer."):
+    return {
+        "item_index": item_index, "model_name": "fake-a", "prompt_variant": "langchain_base", "context_condition": condition,
+        "question": f"Q{item_index}?", "gold_answer": f"A{item_index}",
+        "context": "\n\n".join(d["text"] for d in documents if d.get("included", True)), "documents": documents,
+        "system_prompt": "System.", "user_prompt": "User.", "model_answer": answer,
+    }
+
+RECORDS = [
+    record(0, "mixed", [{"text": "Doc one.", "label": "relevant"}, {"text": "Noise.", "label": "irrelevant"}]),
+    record(0, "relevant_only", [{"text": "Doc one.", "label": "relevant"}]),
+    record(1, "irrelevant_only", []),
+    record(2, "mixed", [{"text": "Noise.", "label": "irrelevant"}]),
+]
+
+def test_round_trip_keeps_rows_without_documents(tmp_path):
+    df = pl.DataFrame(RECORDS)
+    write_results(df, str(tmp_path))
+
+    restored = scan_results(str(tmp_path)).collect()
+    assert restored.select(RECORD_COLUMNS).to_dicts() == df.select(RECORD_COLUMNS).to_dicts()
+    # Documents shared between records are stored once
+    assert pl.read_parquet(tmp_path / "documents.parquet")["text"].sort().to_list() == ["Doc one.", "Noise."]
+
+def test_packed_documents_round_trip(tmp_path):
+    records = [
+        record(0, "mixed", [{"text": "Kept.", "label": "relevant", "included": True}, {"text": "Cut.", "label": "irrelevant", "included": False}]),
+        record(1, "irrelevant_only", []),
+    ]
+    write_results(pl.DataFrame(records), str(tmp_path))
+
+    restored = scan_results(str(tmp_path)).collect().to_dicts()
+    assert [r["context"] for r in restored] == ["Kept.", ""]
+    assert [r["documents"] for r in restored] == [records[0]["documents"], []]
+
+def test_append_extends_the_lookup_tables(tmp_path):
+    write_results(pl.DataFrame(RECORDS[:2]), str(tmp_path))
+    write_results(pl.DataFrame(RECORDS[2:]), str(tmp_path), append=True)
+
+    assert scan_results(str(tmp_path)).collect()["item_index"].to_list() == [0, 0, 1, 2]
+    assert pl.read_parquet(tmp_path / "documents.parquet")["doc_id"].to_list() == [0, 1]
+
+def test_metric_scores_join_back_to_the_records(tmp_path):
+    df = pl.DataFrame(RECORDS)
+    write_results(df, str(tmp_path / "store"))
+    write_metric_scores(df.with_columns(pl.Series("rougeL_recall", [0.1, 0.2, 0.3, 0.4])), str(tmp_path / "scores.parquet"))
+
+    scores = scan_metric_scores(str(tmp_path / "store"), str(tmp_path / "scores.parquet")).collect()
+    assert scores["rougeL_recall"].to_list() == pytest.approx([0.1, 0.2, 0.3, 0.4])
+    assert scores["documents"].to_list() == df["documents"].to_list()
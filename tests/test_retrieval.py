@@ -0,0 +1,70 @@
+import json
+
+import numpy as np
+import pytest
+
+from retrieval import HashingEmbedder, Retriever, VectorIndex, document_pool
+
+TOPICS = ["apple", "river", "engine", "violin", "glacier", "pepper", "comet", "falcon", "marble", "lantern"]
+TEXTS = [f"The {topic} note number {i} mentions {TOPICS[(i * 7) % len(TOPICS)]} and {i % 13}." for i, topic in enumerate(TOPICS * 20)]
+QUESTIONS = [f"What does the {topic} note say?" for topic in TOPICS]
+
+@pytest.fixture(scope="module")
+def embedder():
+    return HashingEmbedder(dim=64)
+
+def brute_force(texts, queries, k):
+    scores = queries @ np.asarray(texts).T
+    return np.argsort(-scores, axis=1, kind="stable")[:, :k], -np.sort(-scores, axis=1)[:, :k]
+
+def test_hashing_embedder_is_deterministic_and_unit_length(embedder):
+    vectors = embedder.embed(["Some text here.", "Some text here.", ""])
+    assert vectors.dtype == np.float32 and vectors.shape == (3, 64)
+    np.testing.assert_allclose(np.linalg.norm(vectors[:2], axis=1), 1.0, rtol=1e-6)
+    np.testing.assert_array_equal(vectors[0], vectors[1])
+    assert not vectors[2].any()
+
+def test_exact_search_matches_brute_force(tmp_path, embedder):
+    index = VectorIndex.build(TEXTS, embedder, str(tmp_path / "exact"), batch_size=32)
+    queries = embedder.embed(QUESTIONS)
+    ids, scores = index.search(queries, k=5, block_size=37)
+
+    expected_ids, expected_scores = brute_force(embedder.embed(TEXTS), queries, 5)
+    np.testing.assert_allclose(scores, expected_scores, rtol=1e-5)
+    # Ties may come back in either order, the scores of the returned documents must still match
+    np.testing.assert_allclose(np.take_along_axis(queries @ embedder.embed(TEXTS).T, ids, axis=1), expected_scores, rtol=1e-5)
+    assert index.search(queries, k=10_000)[0].shape == (len(QUESTIONS), len(TEXTS))
+
+def test_ivf_search_probing_every_list_is_exact(tmp_path, embedder):
+    exact = VectorIndex.build(TEXTS, embedder, str(tmp_path / "exact"))
+    ivf = VectorIndex.build(TEXTS, embedder, str(tmp_path / "ivf"), n_lists=8)
+    queries = embedder.embed(QUESTIONS)
+
+    # Rows are regrouped by list; ids maps them back to the original documents
+    assert sorted(ivf.ids.tolist()) == list(range(len(TEXTS)))
+    np.testing.assert_allclose(np.asarray(ivf.vectors), np.asarray(exact.vectors)[ivf.ids])
+    np.testing.assert_allclose(ivf.search(queries, 5, n_probe=8)[1], exact.search(queries, 5)[1], rtol=1e-5)
+
+    # One probe is approximate: never better than exact search, and short lists leave -inf slots
+    scores = ivf.search(queries, 5, n_probe=1)[1]
+    assert np.isfinite(scores[:, 0]).all()
+    assert (scores <= exact.search(queries, 1)[1] + 1e-6).all()
+
+def test_retriever_attaches_ranked_documents(tmp_path):
+    items = [
+        {"question": "Which bird hunts from the cliffs?", "relevant_docs": ["The falcon hunts from the cliffs."], "irrelevant_docs": ["Bread rises in the oven.", "Shared noise."]},
+        {"question": "Where does the river start?", "relevant_docs": ["The river starts in the mountains."], "irrelevant_docs": ["Shared noise."]},
+    ]
+    (tmp_path / "data.json").write_text(json.dumps({"items": items}), encoding="utf-8")
+    texts = document_pool(str(tmp_path / "data.json"))
+    # The shared distractor is indexed once
+    assert len(texts) == 4
+
+    VectorIndex.build(texts, HashingEmbedder(), str(tmp_path / "index"), n_lists=2)
+    retriever = Retriever(str(tmp_path / "index"), k=2, n_probe=2)
+    window = list(enumerate(items))
+    retriever.attach(window)
+
+    for _, item in window:
+        assert item["retrieved_docs"][0] == item["relevant_docs"][0]
+        assert len(item["retrieved_docs"]) == 2
@@ -0,0 +1,58 @@
+import random
+
+import polars as pl
+import pytest
+from rouge_score import rouge_scorer
+
+from metrics import RougeL, _LCSScorer
+
+WORDS = ["the", "cell", "energy", "ATP", "mitochondria", "produces", "is", "a", "I", "don't", "know"]
+
+def random_rows(n_rows: int, seed: int = 0) -> tuple[list[list[str]], list[str]]:
+    rng = random.Random(seed)
+    sentence = lambda: " ".join(rng.choices(WORDS, k=rng.randint(0, 80)))
+    references = [[sentence() for _ in range(rng.randint(1, 3))] for _ in range(n_rows)]
+    return references, [sentence() for _ in range(n_rows)]
+
+def reference_scores(references, candidates, use_stemmer=False):
+    scorer = rouge_scorer.RougeScorer(["rougeL"], use_stemmer=use_stemmer)
+    scores = [scorer.score_multi(refs, cand)["rougeL"] for refs, cand in zip(references, candidates)]
+    return [s.precision for s in scores], [s.recall for s in scores]
+
+def lcs_dp(a, b):
+    table = [[0] * (len(b) + 1) for _ in range(len(a) + 1)]
+    for i, x in enumerate(a):
+        for j, y in enumerate(b):
+            table[i + 1][j + 1] = table[i][j] + 1 if x == y else max(table[i][j + 1], table[i + 1][j])
+    return table[-1][-1]
+
+def test_bit_parallel_lcs_matches_dynamic_programming():
+    rng = random.Random(1)
+    scorer = _LCSScorer()
+    for _ in range(200):
+        reference = " ".join(rng.choices(WORDS, k=rng.randint(1, 100)))
+        candidate = tuple(rng.choices([w.lower() for w in WORDS], k=rng.randint(0, 100)))
+        assert scorer.lcs_length(reference, candidate) == lcs_dp(scorer.tokens(reference), candidate)
+
+@pytest.mark.parametrize("use_stemmer", [False, True])
+def test_score_many_matches_rouge_score(use_stemmer):
+    references, candidates = random_rows(300)
+    scores = RougeL(use_stemmer=use_stemmer, n_jobs=1).score_many(pl.Series(references), pl.Series(candidates))
+
+    precision, recall = reference_scores(references, candidates, use_stemmer)
+    assert scores["rougeL_precision"] == pytest.approx(precision)
+    assert scores["rougeL_recall"] == pytest.approx(recall)
+
+def test_process_pool_chunks_give_the_same_scores():
+    references, candidates = random_rows(50, seed=2)
+    serial = RougeL(n_jobs=1).score_many(pl.Series(references), pl.Series(candidates))
+    chunked = RougeL(n_jobs=2, chunk_size=10).score_many(pl.Series(references), pl.Series(candidates))
+    assert chunked == serial
+
+def test_only_references_are_cached_and_the_cache_is_bounded():
+    references, candidates = random_rows(100, seed=3)
+    scorer = _LCSScorer(max_cached=20)
+    scorer.score_rows(references, candidates)
+
+    assert len(scorer._tokens) <= 20 and len(scorer._masks) <= 20
+    assert scorer._tokens.keys() <= {ref for refs in references for ref in refs}
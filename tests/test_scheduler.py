@@ -0,0 +1,41 @@
+from prompting_script import grid_cells, select_combos
+from scheduler import avoided_load_time, count_model_loads, prefix_key, schedule_by_model
+
+ITEMS = list(enumerate([{"question": f"Q{i}?", "relevant_docs": [], "irrelevant_docs": []} for i in range(3)]))
+MODELS = ["model-a", "model-b"]
+
+def interleaved_cells():
+    return grid_cells(ITEMS, ["relevant_only", "mixed"], MODELS, select_combos(["langchain_base", "langchain_user", "llamaindex_base"]))
+
+def test_schedule_groups_every_cell_by_model_in_the_given_order():
+    cells = interleaved_cells()
+    batches = schedule_by_model(cells, list(reversed(MODELS)))
+
+    assert [model for model, _ in batches] == ["model-b", "model-a"]
+    assert all(cell[2] == model for model, batch in batches for cell in batch)
+    assert sorted(map(id, (cell for _, batch in batches for cell in batch))) == sorted(map(id, cells))
+
+def test_models_missing_from_the_order_are_appended():
+    batches = schedule_by_model(interleaved_cells(), ["model-b"])
+    assert [model for model, _ in batches] == ["model-b", "model-a"]
+
+def test_cells_sharing_a_prompt_prefix_are_adjacent():
+    for _, batch in schedule_by_model(interleaved_cells(), MODELS):
+        keys = [prefix_key(cell) for cell in batch]
+        assert keys == sorted(keys)
+        # Each prefix forms one contiguous run
+        runs = [key for i, key in enumerate(keys) if i == 0 or key != keys[i - 1]]
+        assert len(runs) == len(set(keys))
+
+def test_count_model_loads_counts_switches():
+    assert count_model_loads(["a", "b", "a", "a", "b"]) == {"a": 2, "b": 2}
+    assert count_model_loads([]) == {}
+
+def test_avoided_load_time_of_the_scheduled_order():
+    cells = interleaved_cells()
+    naive = [cell[2] for cell in cells]
+    scheduled = [cell[2] for _, batch in schedule_by_model(cells, MODELS) for cell in batch]
+
+    assert count_model_loads(scheduled) == {"model-a": 1, "model-b": 1}
+    expected = (count_model_loads(naive)["model-a"] - 1) * 2.0 + (count_model_loads(naive)["model-b"] - 1) * 3.0
+    assert avoided_load_time(naive, scheduled, {"model-a": 2.0, "model-b": 3.0}) == expected > 0
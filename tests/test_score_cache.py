@@ -0,0 +1,34 @@
+import polars as pl
+
+from metrics import RougeL
+from score_cache import ScoreCache
+from score_responses import run_metrics
+
+def test_key_covers_references_and_candidate():
+    assert ScoreCache.make_key(["a"], "b") == ScoreCache.make_key(["a"], "b")
+    assert ScoreCache.make_key(["a"], "b") != ScoreCache.make_key(["a", "b"], "b")
+    assert ScoreCache.make_key(["a"], "b") != ScoreCache.make_key(["a"], "c")
+
+def test_scores_are_kept_per_metric_version(tmp_path):
+    cache = ScoreCache(str(tmp_path / "scores.sqlite"))
+    cache.put_many("rougeL", "1", {"k": {"rougeL_recall": 0.5}})
+
+    assert cache.get_many("rougeL", "1", ["k", "missing"]) == {"k": {"rougeL_recall": 0.5}}
+    assert cache.get_many("rougeL", "2", ["k"]) == {}
+    assert cache.stats() == {"hits": 1, "misses": 2}
+    cache.close()
+
+def test_run_metrics_only_scores_pairs_the_cache_has_not_seen(tmp_path):
+    cache = ScoreCache(str(tmp_path / "scores.sqlite"))
+    references = pl.Series([["a b c"], ["d e"]])
+    first, timings = run_metrics([RougeL()], references, pl.Series(["a b", "d"]), cache=cache)
+    assert timings["rougeL"]["scored_rows"] == 2
+
+    references = pl.Series([["a b c"], ["d e"], ["a b c"]])
+    second, timings = run_metrics([RougeL()], references, pl.Series(["a b", "e", "a b"]), cache=cache)
+    assert timings["rougeL"]["scored_rows"] == 1
+    assert second[0]["rougeL_recall"].to_list() == [first[0]["rougeL_recall"][0], 0.5, first[0]["rougeL_recall"][0]]
+
+    _, timings = run_metrics([RougeL(use_stemmer=True)], references, pl.Series(["a b", "e", "a b"]), cache=cache)
+    assert timings["rougeL"]["scored_rows"] == 2
+    cache.close()
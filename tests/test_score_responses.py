@@ -0,0 +1,77 @@
+import json
+
+import polars as pl
+import pytest
+
+import score_responses
+from metrics import BLEU, RougeL
+from score_responses import metric_pool, run_metrics, score_stream, with_reference_answers
+
+def write_results(path, n_rows):
+    with open(path, "w", encoding="utf-8") as f:
+        for i in range(n_rows):
+            f.write(json.dumps({
+                "item_index": i % 7, "model_name": "fake-a", "prompt_variant": f"v{i}", "context_condition": ["mixed", "irrelevant_only"][i % 2],
+                "gold_answer": f"answer number {i % 5}", "model_answer": f"the answer number {i % 3}",
+            }) + "\n")
+
+def test_run_metrics_matches_direct_scoring():
+    references = pl.Series([["a b c"], ["a b c"], ["d e"], ["a b c"]])
+    candidates = pl.Series(["a b", "a b", "d", "c"])
+    columns, timings = run_metrics([RougeL(), BLEU(smoothing="add1")], references, candidates, n_jobs=2, chunk_size=1)
+
+    assert columns[0].to_dict(as_series=False) == RougeL(n_jobs=1).score_many(references, candidates)
+    assert columns[1].to_dict(as_series=False) == BLEU(smoothing="add1").score_many(references, candidates)
+    # The repeated pair is only scored once
+    assert timings["rougeL"]["scored_rows"] == 3
+
+def test_metric_pool_spawns_its_workers():
+    with metric_pool(1) as pool:
+        assert pool._mp_context.get_start_method() == "spawn"
+
+def test_score_stream_reuses_one_pool_across_batches(tmp_path, monkeypatch):
+    write_results(tmp_path / "results.jsonl", 25)
+    pools = []
+
+    def counting_pool(n_jobs=None):
+        pools.append(metric_pool(n_jobs))
+        return pools[-1]
+
+    monkeypatch.setattr(score_responses, "metric_pool", counting_pool)
+    score_stream(str(tmp_path / "results.jsonl"), str(tmp_path / "scores"), [RougeL(), BLEU()], batch_size=10)
+
+    assert len(pools) == 1
+    assert len(list((tmp_path / "scores").glob("part-*.parquet"))) == 3
+
+def test_run_metrics_uses_a_given_pool(monkeypatch):
+    monkeypatch.setattr(score_responses, "metric_pool", lambda n_jobs=None: pytest.fail("created a pool"))
+    df = with_reference_answers(pl.DataFrame({"context_condition": ["mixed"], "gold_answer": ["x y"], "model_answer": ["x"]}))
+    with metric_pool(1) as pool:
+        columns, _ = run_metrics([RougeL()], df["reference_answers"], df["model_answer"], pool=pool)
+    assert columns[0]["rougeL_recall"].to_list() == [0.5]
+
+def test_streamed_parts_match_scoring_in_memory(tmp_path):
+    write_results(tmp_path / "results.jsonl", 25)
+    score_stream(str(tmp_path / "results.jsonl"), str(tmp_path / "scores"), [RougeL(), BLEU()], batch_size=10)
+
+    df = with_reference_answers(pl.read_ndjson(tmp_path / "results.jsonl"))
+    columns, _ = run_metrics([RougeL(), BLEU()], df["reference_answers"], df["model_answer"])
+    streamed = pl.read_parquet(tmp_path / "scores" / "part-*.parquet")
+    assert streamed.select("rougeL_precision", "rougeL_recall", "bleu").to_dicts() == pl.concat(columns, how="horizontal").to_dicts()
+    assert streamed["prompt_variant"].cast(pl.String).to_list() == df["prompt_variant"].to_list()
+
+def test_score_stream_replaces_parts_of_an_earlier_run(tmp_path):
+    write_results(tmp_path / "results.jsonl", 25)
+    score_stream(str(tmp_path / "results.jsonl"), str(tmp_path / "scores"), [RougeL()], batch_size=5)
+    score_stream(str(tmp_path / "results.jsonl"), str(tmp_path / "scores"), [RougeL()], batch_size=10)
+    assert len(list((tmp_path / "scores").glob("part-*.parquet"))) == 3
+
+@pytest.mark.parametrize("streaming", [False, True])
+def test_main_writes_to_the_given_paths(tmp_path, monkeypatch, streaming):
+    monkeypatch.chdir(tmp_path)
+    write_results(tmp_path / "results.jsonl", 12)
+    output = tmp_path / ("scores" if streaming else "scores.parquet")
+    score_responses.main(streaming, 5, ["rougeL"], "results.jsonl", str(output), str(tmp_path / "timings.json"))
+
+    assert pl.read_parquet(output / "part-*.parquet" if streaming else output).height == 12
+    assert "rougeL" in json.loads((tmp_path / "timings.json").read_text(encoding="utf-8"))
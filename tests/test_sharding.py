@@ -0,0 +1,90 @@
+import argparse
+import json
+
+import pytest
+
+import sharding
+from sharding import cell_rng, grid_keys, in_shard, merge_shards, parse_shard, shard_of, shard_path
+
+N_SHARDS = 3
+EXPECTED = grid_keys(4, ["m1", "m2"], ["langchain_base"], ["mixed", "relevant_only"])
+
+def record(key, answer="An answer."):
+    idx, model, variant, condition = key
+    return {"item_index": idx, "model_name": model, "prompt_variant": variant, "context_condition": condition, "model_answer": answer}
+
+def write_shards(output_path, records_by_shard):
+    for index, records in records_by_shard.items():
+        with open(shard_path(str(output_path), (index, N_SHARDS)), "w", encoding="utf-8") as f:
+            for r in records:
+                f.write(json.dumps(r) + "\n")
+
+def sharded(keys):
+    return {index: [record(key) for key in sorted(keys) if shard_of(key, N_SHARDS) == index] for index in range(N_SHARDS)}
+
+def test_parse_shard():
+    assert parse_shard("1/4") == (1, 4)
+    for value in ("4/4", "-1/2", "a/b", "3"):
+        with pytest.raises(argparse.ArgumentTypeError):
+            parse_shard(value)
+
+def test_every_cell_belongs_to_exactly_one_shard():
+    for key in EXPECTED:
+        assert sum(in_shard(key, (index, N_SHARDS)) for index in range(N_SHARDS)) == 1
+    assert in_shard(next(iter(EXPECTED)), None)
+    assert shard_path("results/out.jsonl", (1, 4)) == "results/out.shard-1-of-4.jsonl"
+
+def test_cell_rng_is_independent_of_run_order():
+    assert cell_rng(42, 3, "mixed").random() == cell_rng(42, 3, "mixed").random()
+    assert cell_rng(42, 3, "mixed").random() != cell_rng(42, 4, "mixed").random()
+
+def test_merge_writes_every_record_in_key_order(tmp_path):
+    shards = sharded(EXPECTED)
+    # Error rows of a shard are left out of the merge
+    shards[0].append(record(sorted(EXPECTED)[0], "[ERROR] timeout"))
+    write_shards(tmp_path / "out.jsonl", shards)
+
+    assert merge_shards(str(tmp_path / "out.jsonl"), N_SHARDS, EXPECTED) == {"records": len(EXPECTED), "shards": N_SHARDS}
+    with open(tmp_path / "out.jsonl", "r", encoding="utf-8") as f:
+        keys = [tuple(json.loads(line)[k] for k in ("item_index", "model_name", "prompt_variant", "context_condition")) for line in f]
+    assert keys == sorted(EXPECTED)
+
+@pytest.mark.parametrize("problem, message", [
+    ("misplaced", "belongs to shard"),
+    ("duplicate", "more than once"),
+    ("missing", "cells are missing"),
+    ("unexpected", "not in the grid"),
+    ("missing_file", "missing shard file"),
+])
+def test_merge_refuses_an_inconsistent_run(tmp_path, problem, message):
+    shards = sharded(EXPECTED)
+    if problem == "misplaced":
+        moved = shards[0].pop()
+        shards[1].append(moved)
+    elif problem == "duplicate":
+        shards[2].append(shards[2][0])
+    elif problem == "missing":
+        shards[1].pop()
+    elif problem == "unexpected":
+        extra = (99, "m1", "langchain_base", "mixed")
+        shards[shard_of(extra, N_SHARDS)].append(record(extra))
+    write_shards(tmp_path / "out.jsonl", {i: r for i, r in shards.items() if not (problem == "missing_file" and i == 2)})
+
+    with pytest.raises(ValueError, match=message):
+        merge_shards(str(tmp_path / "out.jsonl"), N_SHARDS, EXPECTED)
+    assert not (tmp_path / "out.jsonl").exists()
+
+def test_main_merges_the_conditions_the_shards_ran(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr("results_store.convert_jsonl", lambda *args: None)
+    items = [{"question": f"Question {i}?", "gold_answer": "", "relevant_docs": [], "irrelevant_docs": []} for i in range(4)]
+    (tmp_path / "data.json").write_text(json.dumps({"items": items}), encoding="utf-8")
+    keys = grid_keys(4, ["m1"], ["langchain_base"], ["mixed", "retrieved"])
+    write_shards(tmp_path / "out.jsonl", sharded(keys))
+
+    sharding.main(N_SHARDS, ["m1"], ["langchain_base"], "data.json", "out.jsonl", conditions=["mixed", "retrieved"])
+    with open(tmp_path / "out.jsonl", "r", encoding="utf-8") as f:
+        assert sum(1 for _ in f) == len(keys)
+
+    with pytest.raises(ValueError, match="Unknown context conditions"):
+        sharding.main(N_SHARDS, ["m1"], ["langchain_base"], "data.json", "out.jsonl", conditions=["mixd"])
@@ -0,0 +1,52 @@
+import polars as pl
+import pytest
+
+from backends import empty_telemetry
+from telemetry import summarize_telemetry
+
+def call(model, eval_count, eval_duration_s, wall_time_s, cached=False, load_duration_s=0.0):
+    return {
+        "model_name": model, "prompt_variant": "langchain_base",
+        "telemetry": empty_telemetry() | {
+            "prompt_eval_count": 100, "prompt_eval_duration": int(0.5e9), "eval_count": eval_count,
+            "eval_duration": int(eval_duration_s * 1e9), "load_duration": int(load_duration_s * 1e9),
+            "total_duration": int((0.5 + eval_duration_s + load_duration_s) * 1e9),
+            "wall_time_s": wall_time_s, "ttft_s": 0.1, "cached": cached,
+        },
+    }
+
+def test_rates_leave_out_cached_and_errored_calls():
+    results = pl.LazyFrame([
+        call("a", 50, 1.0, 1.6, load_duration_s=1.0),
+        call("a", 150, 2.0, 2.6),
+        call("a", 999, 0.1, 0.0, cached=True),
+        {"model_name": "a", "prompt_variant": "langchain_base", "telemetry": None},
+        call("b", 10, 0.5, 1.0),
+    ])
+    summary = summarize_telemetry(results).to_dicts()
+
+    a, b = summary
+    assert (a["model_name"], a["calls"], b["calls"]) == ("a", 2, 1)
+    assert a["output_tokens_per_s"] == pytest.approx(200 / 3.0)
+    assert a["prompt_tokens_per_s"] == pytest.approx(200 / 1.0)
+    assert a["load_time_s"] == pytest.approx(1.0)
+    assert a["load_share"] == pytest.approx(1.0 / 5.0)
+
+def test_grouping_columns_are_configurable():
+    results = pl.LazyFrame([call("a", 50, 1.0, 1.0), call("b", 50, 1.0, 1.0)])
+    assert summarize_telemetry(results, by=("prompt_variant",))["calls"].to_list() == [2]
+
+def test_streams_stopped_early_count_with_client_timings():
+    stopped = {
+        "model_name": "a", "prompt_variant": "langchain_base",
+        "telemetry": empty_telemetry() | {
+            "eval_count": 30, "eval_duration": int(1e9), "total_duration": int(1.2e9),
+            "wall_time_s": 1.2, "ttft_s": 0.2, "stopped_early": True, "client_timed": True,
+        },
+    }
+    summary = summarize_telemetry(pl.LazyFrame([call("a", 50, 1.0, 1.6, load_duration_s=1.0), stopped])).row(0, named=True)
+
+    assert summary["output_tokens_per_s"] == pytest.approx(80 / 2.0)
+    # The client-timed call has no load time, so it does not dilute the load share
+    assert summary["load_share"] == pytest.approx(1.0 / 2.5)
+    assert summary["client_timed_share"] == 0.5